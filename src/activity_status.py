@@ -0,0 +1,71 @@
+"""
+Activity Status Module
+
+This module tells, from file modification times only, which activities have no
+results yet, which are up to date and which changed since their last processing.
+It is used by the activities command and by the watcher's catch-up, and imports
+nothing beyond the standard library and src.config, so it answers in milliseconds.
+
+Functions:
+    list_activities: Activities and whether their results are up to date.
+"""
+
+import os
+from typing import List, Optional, Tuple
+from src.config import Config
+
+NEW = "new"
+PROCESSED = "processed"
+STALE = "stale"
+NO_DATA = "no data"
+
+
+def list_activities(config: Config) -> List[Tuple[str, str, Optional[float]]]:
+    """
+    Activities and the state of their results, from file modification times only.
+
+    An activity is NEW when it has no results yet, STALE when one of its inputs (res.csv,
+    mathAlea.html, tags manifest or student roster) changed after its last processing,
+    and PROCESSED otherwise. Unlike the fingerprint check of save_activity, nothing is
+    hashed, so a file touched without being changed also shows as stale.
+
+    Returns:
+        List[Tuple[str, str, Optional[float]]]: (activity, status, last processing time) by name.
+    """
+    if not os.path.isdir(config.activity_dir):
+        return []
+    roster_mtime = _mtime(os.path.join(config.data_dir, config.groupe_classe_filename))
+    activities = []
+    for activity in sorted(os.listdir(config.activity_dir)):
+        activity_dir = os.path.join(config.activity_dir, activity)
+        if not os.path.isdir(activity_dir):
+            continue
+        source_data_dir = os.path.join(activity_dir, config.source_data_dir)
+        output_dir = os.path.join(activity_dir, config.final_data_dir)
+        input_mtimes = [
+            _mtime(os.path.join(source_data_dir, config.res_filename)),
+            _mtime(os.path.join(source_data_dir, config.url_filename)),
+            _mtime(os.path.join(activity_dir, config.tags_manifest_filename)),
+            roster_mtime,
+        ]
+        output_mtimes = [
+            _mtime(os.path.join(output_dir, filename))
+            for filename in (config.resultat_csv_filename, config.resultat_json_filename)
+        ]
+        if input_mtimes[0] is None or input_mtimes[1] is None:
+            activities.append((activity, NO_DATA, None))
+            continue
+        if None in output_mtimes:
+            activities.append((activity, NEW, None))
+            continue
+        processed_at = _mtime(os.path.join(output_dir, config.fingerprint_filename)) or min(output_mtimes)
+        stale = any(mtime is not None and mtime > processed_at for mtime in input_mtimes)
+        activities.append((activity, STALE if stale else PROCESSED, processed_at))
+    return activities
+
+
+def _mtime(path: str) -> Optional[float]:
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
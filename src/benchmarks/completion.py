@@ -0,0 +1,200 @@
+"""
+Benchmark suite for the matrix completion engines.
+
+Generates synthetic low-rank score matrices at several sizes and missing-data rates,
+holds out part of the observed scores, runs every completion engine on the rest and
+records wall time, peak memory and held-out RMSE to a JSON results file. When a
+baseline results file is given, the run fails if an engine got slower or less
+accurate than allowed, so regressions are caught before deployment.
+
+Usage:
+    python -m src.benchmarks.completion [--sizes 200x50,1000x200] [--missing-rates 0.5,0.9]
+        [--engines svd,soft_impute,als,iterative] [--synthesis data/synthesis_data/synthesis.json]
+        [--output bench_completion.json] [--baseline previous.json]
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Any, Callable, Dict, List
+import numpy as np
+from src.db.sparse_scores import SparseScoreMatrix
+from src.matrix_completion import COMPLETION_ENGINES
+
+DEFAULT_SIZES = "200x50,1000x200"
+DEFAULT_MISSING_RATES = "0.5,0.8,0.95"
+
+
+def make_low_rank_scores(n_rows, n_cols, rank=5, missing_rate=0.5, noise=0.05, seed=0):
+    """
+    Generate a synthetic score matrix in [0, 1] with a low-rank structure.
+
+    Returns:
+        tuple: (full matrix, matrix with NaN for the missing entries)
+    """
+    rng = np.random.default_rng(seed)
+    left = rng.normal(size=(n_rows, rank))
+    right = rng.normal(size=(rank, n_cols))
+    logits = left @ right / np.sqrt(rank) + noise * rng.normal(size=(n_rows, n_cols))
+    full = 1.0 / (1.0 + np.exp(-logits))
+    observed = full.copy()
+    observed[rng.random(full.shape) < missing_rate] = np.nan
+    return full, observed
+
+
+def run_case(engine: Callable, train: SparseScoreMatrix, held_out: SparseScoreMatrix,
+             repeat: int = 1, **kwargs) -> Dict[str, float]:
+    """
+    Benchmark one engine on one train/held-out split.
+
+    Wall time is the best of `repeat` untraced runs; peak memory is measured on a
+    separate run under tracemalloc, which numpy reports its buffers to.
+
+    Returns:
+        Dict[str, float]: seconds, peak_memory_mb and rmse (on the held-out scores).
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        completed = engine(train, **kwargs)
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        engine(train, **kwargs)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    predictions = completed[held_out.rows, held_out.cols]
+    rmse = float(np.sqrt(np.mean((predictions - held_out.values) ** 2))) if held_out.nnz else float("nan")
+    return {"seconds": best, "peak_memory_mb": peak / 2**20, "rmse": rmse}
+
+
+def run_suite(sizes, missing_rates, engines, repeat=1, held_out_fraction=0.1, rank=None,
+              synthesis_path=None, seed=0) -> List[Dict[str, Any]]:
+    """
+    Run every engine on every (size, missing rate) synthetic case, and on the real
+    synthesis when synthesis_path is given.
+
+    Returns:
+        List[Dict[str, Any]]: One record per (case, engine).
+    """
+    cases = []
+    for n_rows, n_cols in sizes:
+        for missing_rate in missing_rates:
+            _, matrix = make_low_rank_scores(n_rows, n_cols, missing_rate=missing_rate, seed=seed)
+            cases.append((f"synthetic_{n_rows}x{n_cols}_{missing_rate:g}", SparseScoreMatrix.from_dense(matrix)))
+    if synthesis_path:
+        cases.append(("synthesis", SparseScoreMatrix.from_synthesis_json(synthesis_path)))
+
+    records = []
+    for case_name, scores in cases:
+        train, held_out = scores.split(held_out_fraction, seed=seed)
+        for engine_name in engines:
+            kwargs = {} if engine_name == "iterative" else {"rank": rank}
+            result = run_case(COMPLETION_ENGINES[engine_name], train, held_out, repeat=repeat, **kwargs)
+            record = {
+                "case": case_name,
+                "engine": engine_name,
+                "n_students": scores.shape[0],
+                "n_exercises": scores.shape[1],
+                "observed": scores.nnz,
+                "density": scores.density,
+                **result,
+            }
+            records.append(record)
+            print(f"{case_name:<32} {engine_name:<12} {result['seconds']:8.3f}s "
+                  f"{result['peak_memory_mb']:9.1f} MB  RMSE {result['rmse']:.4f}")
+    return records
+
+
+def find_regressions(records, baseline_records, max_slowdown=1.5, max_rmse_increase=0.01) -> List[str]:
+    """
+    Compare records with a baseline run.
+
+    Returns:
+        List[str]: A description of each (case, engine) that regressed.
+    """
+    baseline = {(r["case"], r["engine"]): r for r in baseline_records}
+    regressions = []
+    for record in records:
+        reference = baseline.get((record["case"], record["engine"]))
+        if reference is None:
+            continue
+        if record["seconds"] > max_slowdown * reference["seconds"]:
+            regressions.append(f"{record['case']}/{record['engine']}: {record['seconds']:.3f}s "
+                               f"vs {reference['seconds']:.3f}s")
+        if record["rmse"] > reference["rmse"] + max_rmse_increase:
+            regressions.append(f"{record['case']}/{record['engine']}: RMSE {record['rmse']:.4f} "
+                               f"vs {reference['rmse']:.4f}")
+    return regressions
+
+
+def _parse_sizes(value: str):
+    return [tuple(int(n) for n in size.split("x")) for size in value.split(",") if size]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the matrix completion engines")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="Comma-separated STUDENTSxEXERCISES sizes")
+    parser.add_argument("--missing-rates", default=DEFAULT_MISSING_RATES, help="Comma-separated missing-data rates")
+    parser.add_argument("--engines", default=",".join(COMPLETION_ENGINES), help="Comma-separated engine names")
+    parser.add_argument("--rank", type=int, default=None, help="Rank passed to the low-rank engines")
+    parser.add_argument("--repeat", type=int, default=1, help="Timed runs per case, the best is kept")
+    parser.add_argument("--held-out", type=float, default=0.1, help="Fraction of observed scores held out")
+    parser.add_argument("--synthesis", default=None, help="Also benchmark this synthesis.json")
+    parser.add_argument("--output", default="bench_completion.json", help="JSON results file")
+    parser.add_argument("--baseline", default=None, help="Previous results file to check for regressions")
+    parser.add_argument("--max-slowdown", type=float, default=1.5)
+    parser.add_argument("--max-rmse-increase", type=float, default=0.01)
+    args = parser.parse_args(argv)
+
+    engines = [name for name in args.engines.split(",") if name]
+    unknown = [name for name in engines if name not in COMPLETION_ENGINES]
+    if unknown:
+        parser.error(f"Unknown engines: {', '.join(unknown)}")
+
+    records = run_suite(
+        _parse_sizes(args.sizes),
+        [float(rate) for rate in args.missing_rates.split(",") if rate],
+        engines,
+        repeat=args.repeat,
+        held_out_fraction=args.held_out,
+        rank=args.rank,
+        synthesis_path=args.synthesis,
+    )
+
+    results = {
+        "metadata": {
+            "created_at": datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count(),
+        },
+        "results": records,
+    }
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = find_regressions(records, json.load(f)["results"],
+                                           args.max_slowdown, args.max_rmse_increase)
+        if regressions:
+            print("Regressions against the baseline:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print("No regression against the baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Benchmark of the activity JSON export.
+
+Compares generate_json_data with the previous DataFrame.iterrows implementation on
+a synthetic activity and checks that both produce the same JSON.
+
+Usage:
+    python -m src.benchmarks.json_export [n_students] [n_exercises] [missing_rate]
+"""
+
+import json
+import sys
+import time
+import numpy as np
+import pandas as pd
+from src.db.json_utils import generate_json_data
+
+
+def generate_json_data_iterrows(df, tags, url_infos):
+    """Previous implementation of generate_json_data, kept as the reference"""
+    data = {"metadata": {}, "tags": tags, "exercises": {}, "students": {}}
+    for i, col in enumerate(df.columns[3:]):
+        data["exercises"][col] = {
+            "average_score": df[col].mean(),
+            "max_score": df[col].max(),
+            "min_score": df[col].min()
+        }
+        data["exercises"][col].update(url_infos[i])
+    for _, row in df.iterrows():
+        student_name = row["Élève"]
+        data["students"][student_name] = {
+            "class": row["Classe"],
+            "group": row["Groupe"],
+            "scores": {col: row[col] for col in df.columns[3:] if pd.notna(row[col])}
+        }
+    return data
+
+
+def make_activity(n_students, n_exercises, missing_rate=0.3, seed=0):
+    """Synthetic final dataframe and URL infos of an activity"""
+    rng = np.random.default_rng(seed)
+    scores = rng.integers(0, 5, size=(n_students, n_exercises)) / 4
+    scores[rng.random(scores.shape) < missing_rate] = np.nan
+    super_ids = [f"3L{j:02d}_1_NA_NA_NA_NA_NA_NA_NA_NA" for j in range(n_exercises)]
+    df = pd.DataFrame(scores, columns=super_ids)
+    df.insert(0, "Groupe", [f"G{i % 4}" if i % 7 else np.nan for i in range(n_students)])
+    df.insert(0, "Classe", [f"3{'ABCD'[i % 4]}" for i in range(n_students)])
+    df.insert(0, "Élève", [f"Élève {i}" for i in range(n_students)])
+    url_infos = [{"super_id": super_id, "id": super_id[:4], "n": 4, "alea": "AbCd"} for super_id in super_ids]
+    return df, url_infos
+
+
+def _export(data):
+    data = dict(data, metadata={})
+    return json.dumps(data, ensure_ascii=False)
+
+
+def main():
+    n_students = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    n_exercises = int(sys.argv[2]) if len(sys.argv) > 2 else 40
+    missing_rate = float(sys.argv[3]) if len(sys.argv) > 3 else 0.3
+
+    df, url_infos = make_activity(n_students, n_exercises, missing_rate)
+    timings = {}
+    outputs = {}
+    for name, export in (("iterrows", generate_json_data_iterrows), ("vectorized", generate_json_data)):
+        start = time.perf_counter()
+        outputs[name] = export(df, {}, url_infos)
+        timings[name] = time.perf_counter() - start
+
+    identical = _export(outputs["iterrows"]) == _export(outputs["vectorized"])
+    print(f"{n_students} students x {n_exercises} exercises, {missing_rate:.0%} missing")
+    for name, seconds in timings.items():
+        print(f"{name:<12} {seconds:8.3f}s")
+    print(f"Speedup: {timings['iterrows'] / timings['vectorized']:.1f}x, identical output: {identical}")
+    if not identical:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
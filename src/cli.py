@@ -0,0 +1,224 @@
+"""
+Command Line Module
+
+This module is the single entry point of the project's commands:
+
+    python -m src.cli process [activity] [--batch ...]
+    python -m src.cli synthesize [activity] [--backend ...]
+    python -m src.cli update-exercises
+    python -m src.cli watch [--catch-up]
+    python -m src.cli activities
+    python -m src.cli catalog-status [--remote]
+
+Only the standard library, src.config and src.activity_status are imported at
+startup. The pipeline commands import their module (and pandas, numpy,
+scikit-learn...) when they run, and the quick commands (activities, catalog-status)
+only read file metadata, so they answer in milliseconds. --profile-imports reruns a
+command under python -X importtime and prints the imports that cost the most.
+
+Functions:
+    catalog_status: Cached remote catalogs and the files built from them.
+    profile_imports: Run a command and summarize its import times.
+    main: Entry point of the script.
+"""
+
+import argparse
+import importlib
+import json
+import os
+import sys
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from src.activity_status import NEW, NO_DATA, PROCESSED, STALE, list_activities
+from src.config import Config
+
+# Commandes déléguées : module dont la fonction main est appelée, et son aide
+_COMMANDS: Dict[str, Tuple[str, str]] = {
+    "process": ("src.save_activity", "Process activity results into final_data"),
+    "synthesize": ("src.update_synthesis", "Merge activity results into the synthesis"),
+    "update-exercises": ("src.update_exercises", "Refresh the exercise catalogs"),
+    "watch": ("src.watch", "Process new activity exports as they arrive"),
+    "select-model": ("src.model_selection", "Select the completion method by cross-validation"),
+    "complete": ("src.completion_artifact", "Complete the synthesis and publish the completed matrix"),
+    "update-factors": ("src.factor_model", "Update the factor model of the recommendations"),
+    "bench": ("src.benchmarks.completion", "Benchmark the matrix completion methods"),
+    "bench-json": ("src.benchmarks.json_export", "Benchmark the JSON export"),
+}
+_QUICK_COMMANDS: Dict[str, str] = {
+    "activities": "List the activities and whether their results are up to date",
+    "catalog-status": "Show when the exercise catalogs were last downloaded",
+}
+
+_FRESHNESS = {True: ", up to date", False: ", CHANGED on the server", None: ", server unreachable"}
+
+
+def catalog_status(config: Config, remote: bool = False) -> Tuple[List[Dict], List[Tuple[str, Optional[float]]]]:
+    """
+    Cached remote catalogs and the local files built from them.
+
+    Args:
+        config (Config): Configuration.
+        remote (bool): Also ask the server, with a conditional HEAD request, whether
+            each cached catalog is still current.
+
+    Returns:
+        Tuple[List[Dict], List[Tuple[str, Optional[float]]]]: The cache entries (url,
+        etag, last_modified, fetched_at and, with remote, fresh), and the modification
+        time of each output file.
+    """
+    exercices_dir = os.path.join(config.data_dir, config.exercices_dir)
+    cache_dir = os.path.join(exercices_dir, config.http_cache_dirname)
+    entries = []
+    if os.path.isdir(cache_dir):
+        for filename in sorted(os.listdir(cache_dir)):
+            if not filename.endswith(".meta.json"):
+                continue
+            try:
+                with open(os.path.join(cache_dir, filename), "r", encoding="utf-8") as f:
+                    entries.append(json.load(f))
+            except (OSError, json.JSONDecodeError):
+                continue
+
+    if remote and entries:
+        # requests n'est importé que pour l'interrogation du serveur
+        from src.http_cache import CachedHttpClient
+        with CachedHttpClient(cache_dir, timeout=config.http_timeout) as http:
+            for entry in entries:
+                entry["fresh"] = http.is_fresh(entry["url"])
+
+    outputs = [
+        (path, _mtime(path))
+        for path in (
+            os.path.join(exercices_dir, config.exercices_json_filename),
+            os.path.join(exercices_dir, "themes.json"),
+            os.path.join(exercices_dir, "exercices.csv"),
+        )
+    ]
+    return entries, outputs
+
+
+def profile_imports(command_args: List[str], top: int = 15) -> int:
+    """
+    Run a command of this CLI under python -X importtime and summarize its imports.
+
+    The command's own output is passed through. The top-level imports (those not
+    triggered by another import) are then listed by cumulative time.
+
+    Returns:
+        int: Exit code of the command.
+    """
+    import subprocess
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-m", "src.cli", *command_args],
+        stderr=subprocess.PIPE, text=True,
+    )
+    imports = []
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:"):
+            sys.stderr.write(line + "\n")
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue  # ligne d'en-tête
+        name = fields[2].rstrip()
+        # Les imports déclenchés par un autre import sont indentés sous lui
+        if name.startswith("  "):
+            continue
+        imports.append((int(fields[1]), name.strip()))
+
+    imports.sort(reverse=True)
+    total = sum(cumulative for cumulative, _ in imports)
+    print(f"\nTop-level imports of '{' '.join(command_args)}' by cumulative time:", file=sys.stderr)
+    for cumulative, name in imports[:top]:
+        print(f"  {cumulative / 1000:9.1f} ms  {name}", file=sys.stderr)
+    print(f"  {total / 1000:9.1f} ms  total ({len(imports)} top-level imports)", file=sys.stderr)
+    return process.returncode
+
+
+def _mtime(path: str) -> Optional[float]:
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+
+def _format_time(timestamp: Optional[float]) -> str:
+    return datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M") if timestamp is not None else "-"
+
+
+def _run_activities(config: Config, argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(prog="python -m src.cli activities", description=_QUICK_COMMANDS["activities"])
+    parser.add_argument("--status", choices=[NEW, PROCESSED, STALE, NO_DATA], help="Only list activities in this state")
+    args = parser.parse_args(argv)
+
+    activities = [item for item in list_activities(config) if args.status in (None, item[1])]
+    width = max((len(activity) for activity, _, _ in activities), default=0)
+    for activity, status, processed_at in activities:
+        print(f"{activity:<{width}}  {status:<9}  {_format_time(processed_at)}")
+    return 0
+
+
+def _run_catalog_status(config: Config, argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(prog="python -m src.cli catalog-status",
+                                     description=_QUICK_COMMANDS["catalog-status"])
+    parser.add_argument("--remote", action="store_true",
+                        help="Ask the server whether each cached catalog changed (conditional HEAD request)")
+    args = parser.parse_args(argv)
+
+    entries, outputs = catalog_status(config, args.remote)
+    if not entries:
+        print("No catalog downloaded yet (run: python -m src.cli update-exercises)")
+    for entry in entries:
+        line = f"{entry.get('url')}\n  fetched {entry.get('fetched_at', '-')}"
+        if entry.get("last_modified"):
+            line += f", last modified {entry['last_modified']}"
+        if "fresh" in entry:
+            line += _FRESHNESS[entry["fresh"]]
+        print(line)
+    for path, mtime in outputs:
+        print(f"{path}: {_format_time(mtime) if mtime is not None else 'missing'}")
+    return 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Run a command.
+
+    The pipeline commands receive the remaining arguments as their own command line,
+    e.g. "python -m src.cli process --batch --tag niveau=3e".
+    """
+    commands = "\n".join(
+        f"  {name:<18}{help_text}"
+        for name, help_text in [*((name, help_text) for name, (_, help_text) in _COMMANDS.items()),
+                                *_QUICK_COMMANDS.items()]
+    )
+    parser = argparse.ArgumentParser(
+        prog="python -m src.cli",
+        description="MathALEA results pipeline",
+        epilog=f"commands:\n{commands}",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("--profile-imports", action="store_true",
+                        help="Run the command under python -X importtime and list its slowest imports")
+    parser.add_argument("command", choices=[*_COMMANDS, *_QUICK_COMMANDS], metavar="command")
+    parser.add_argument("args", nargs=argparse.REMAINDER, help="Arguments of the command (see <command> --help)")
+    args = parser.parse_args(argv)
+
+    if args.profile_imports:
+        return profile_imports([args.command, *args.args])
+
+    if args.command == "activities":
+        return _run_activities(Config(), args.args)
+    if args.command == "catalog-status":
+        return _run_catalog_status(Config(), args.args)
+
+    module_name, _ = _COMMANDS[args.command]
+    module = importlib.import_module(module_name)
+    # Les modules lisent leurs options dans sys.argv
+    sys.argv = [f"{parser.prog} {args.command}", *args.args]
+    module.main()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,299 @@
+"""
+Completion Artifact Module
+
+This module publishes the completed student x exercise matrix as a versioned
+on-disk artifact, so any number of processes can query the predicted scores
+without running the completion again or holding their own copy of the matrix:
+
+    completion/
+        CURRENT                 name of the current version
+        v000003/
+            matrix.npy          float64 students x exercises, the completed scores
+            observed.npy        bool, the scores actually recorded
+            students.json       student name of each row
+            classes.json        class of each student
+            exercises.json      super_id of each column
+            meta.json           engine and parameters, shape, creation date
+
+A version is written in full in its own directory before CURRENT is replaced by a
+rename, so a reader sees either the previous version or the new one, never a
+half-written file. Publishers hold an exclusive lock on the artifact's lock file
+while they choose the version number, write it and prune the old ones. Readers open matrix.npy memory-mapped: the pages are shared by
+every process through the page cache. Old versions are pruned after a publication;
+a reader that still maps one keeps its pages until it closes it (POSIX semantics).
+
+Classes:
+    CompletionArtifact: Read-only view of a published version.
+
+Functions:
+    current_version: Name of the current version of an artifact.
+    publish_artifact: Write a completed matrix as the new current version.
+    complete_and_publish: Complete the configured synthesis and publish the result.
+    artifact_dir: Directory of the artifact of the configured synthesis.
+    main: Entry point of the script.
+"""
+
+import argparse
+import fcntl
+import json
+import os
+import shutil
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence
+import numpy as np
+from src.config import Config
+from src.db.sparse_scores import SparseScoreMatrix
+
+CURRENT = "CURRENT"
+_VERSION_PREFIX = "v"
+
+
+class CompletionArtifact:
+    """
+    Read-only view of a published completion artifact.
+
+    Attributes:
+        path (str): Directory of the version.
+        version (str): Version name.
+        matrix (np.memmap): Completed scores, memory-mapped.
+        observed (np.memmap): Mask of the recorded scores, memory-mapped.
+        students (List[str]): Student name of each row.
+        classes (List[Any]): Class of each student.
+        exercises (List[str]): Exercise super_id of each column.
+        meta (Dict[str, Any]): Engine, parameters and creation date of the version.
+    """
+
+    def __init__(self, path: str):
+        """
+        Open a version directory.
+
+        Args:
+            path (str): Directory of the version (see open for the current one).
+        """
+        self.path = path
+        self.version = os.path.basename(os.path.normpath(path))
+        self.matrix = np.load(os.path.join(path, "matrix.npy"), mmap_mode="r")
+        self.observed = np.load(os.path.join(path, "observed.npy"), mmap_mode="r")
+        self.students: List[str] = _read_json(os.path.join(path, "students.json"))
+        self.classes: List[Any] = _read_json(os.path.join(path, "classes.json"))
+        self.exercises: List[str] = _read_json(os.path.join(path, "exercises.json"))
+        self.meta: Dict[str, Any] = _read_json(os.path.join(path, "meta.json"))
+        self.student_index = {student: i for i, student in enumerate(self.students)}
+        self.exercise_index = {exercise_id: j for j, exercise_id in enumerate(self.exercises)}
+
+    @classmethod
+    def open(cls, artifact_dir: str) -> "CompletionArtifact":
+        """
+        Open the current version of an artifact.
+
+        Raises:
+            FileNotFoundError: If nothing was published in artifact_dir.
+        """
+        version = current_version(artifact_dir)
+        if version is None:
+            raise FileNotFoundError(f"No completion artifact published in {artifact_dir}")
+        return cls(os.path.join(artifact_dir, version))
+
+    @property
+    def shape(self):
+        return self.matrix.shape
+
+    def score(self, student: str, super_id: str) -> float:
+        """Predicted (or recorded) score of a student for an exercise"""
+        return float(self.matrix[self.student_index[student], self.exercise_index[super_id]])
+
+    def student_scores(self, student: str) -> np.ndarray:
+        """Row of a student (a view on the mapped file)"""
+        return self.matrix[self.student_index[student]]
+
+    def is_current(self, artifact_dir: str) -> bool:
+        """False once a newer version was published, i.e. the artifact should be reopened"""
+        return current_version(artifact_dir) == self.version
+
+
+def current_version(artifact_dir: str) -> Optional[str]:
+    """Name of the current version of an artifact, or None"""
+    try:
+        with open(os.path.join(artifact_dir, CURRENT), "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def publish_artifact(artifact_dir: str, completed: np.ndarray, students: Sequence[str], exercises: Sequence[str],
+                     observed: Optional[np.ndarray] = None, classes: Optional[Sequence[Any]] = None,
+                     meta: Optional[Dict[str, Any]] = None, keep: int = 2) -> str:
+    """
+    Write a completed matrix as a new version and make it the current one.
+
+    Args:
+        artifact_dir (str): Directory of the artifact, created if needed.
+        completed (np.ndarray): Completed students x exercises matrix.
+        students (Sequence[str]): Student name of each row.
+        exercises (Sequence[str]): Exercise super_id of each column.
+        observed (np.ndarray, optional): Mask of the recorded scores (default: none recorded).
+        classes (Sequence[Any], optional): Class of each student.
+        meta (Dict[str, Any], optional): Engine, parameters... stored with the version.
+        keep (int): Versions kept, the new one included.
+
+    Returns:
+        str: Name of the published version.
+
+    Raises:
+        ValueError: If the index files do not match the shape of the matrix.
+    """
+    completed = np.asarray(completed, dtype=np.float64)
+    if completed.shape != (len(students), len(exercises)):
+        raise ValueError(f"Matrix of shape {completed.shape} for {len(students)} students "
+                         f"and {len(exercises)} exercises")
+    if observed is None:
+        observed = np.zeros(completed.shape, dtype=bool)
+
+    os.makedirs(artifact_dir, exist_ok=True)
+    with _publish_lock(artifact_dir):
+        versions = _versions(artifact_dir)
+        number = int(versions[-1][len(_VERSION_PREFIX):]) + 1 if versions else 1
+        version = f"{_VERSION_PREFIX}{number:06d}"
+
+        # La version est écrite à part, puis renommée : son nom n'existe que complète
+        tmp_path = os.path.join(artifact_dir, f".{version}.tmp")
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        _save_npy(os.path.join(tmp_path, "matrix.npy"), completed)
+        _save_npy(os.path.join(tmp_path, "observed.npy"), np.asarray(observed, dtype=bool))
+        _write_json(os.path.join(tmp_path, "students.json"), list(students))
+        _write_json(os.path.join(tmp_path, "classes.json"), list(classes) if classes else [None] * len(students))
+        _write_json(os.path.join(tmp_path, "exercises.json"), list(exercises))
+        _write_json(os.path.join(tmp_path, "meta.json"), {
+            **(meta or {}),
+            "shape": list(completed.shape),
+            "created_at": datetime.now().isoformat(),
+        })
+        _fsync_dir(tmp_path)
+        os.replace(tmp_path, os.path.join(artifact_dir, version))
+
+        pointer_tmp = os.path.join(artifact_dir, f"{CURRENT}.tmp")
+        with open(pointer_tmp, "w", encoding="utf-8") as f:
+            f.write(version)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(pointer_tmp, os.path.join(artifact_dir, CURRENT))
+        _fsync_dir(artifact_dir)
+
+        for old_version in (versions + [version])[:-keep] if keep > 0 else []:
+            shutil.rmtree(os.path.join(artifact_dir, old_version), ignore_errors=True)
+    return version
+
+
+def complete_and_publish(config: Config, engine: Optional[str] = None, rank: Optional[int] = None,
+                         tol: Optional[float] = None, keep: int = 2) -> str:
+    """
+    Complete the configured synthesis and publish the result.
+
+    The engine, rank and tolerance default to those saved by the last model
+    selection, then to soft_impute with its own defaults.
+
+    Returns:
+        str: Name of the published version.
+    """
+    # Les moteurs (et scikit-learn) ne sont importés que pour la complétion
+    import inspect
+    from src.matrix_completion import COMPLETION_ENGINES
+    from src.model_selection import load_best_config
+
+    best = load_best_config(config) or {}
+    engine = engine or best.get("engine", "soft_impute")
+    tol = tol if tol is not None else best.get("tol")
+    rank = rank if rank is not None else best.get("rank")
+
+    scores = SparseScoreMatrix.from_config(config)
+    kwargs = {}
+    if tol is not None:
+        kwargs["tol"] = tol
+    if rank is not None and "rank" in inspect.signature(COMPLETION_ENGINES[engine]).parameters:
+        kwargs["rank"] = max(1, min(rank, min(scores.shape)))
+    completed = COMPLETION_ENGINES[engine](scores, **kwargs)
+    return publish_artifact(
+        artifact_dir(config), completed, scores.students, scores.exercises,
+        observed=scores.observed_mask(), classes=scores.classes,
+        meta={"engine": engine, **kwargs}, keep=keep,
+    )
+
+
+def artifact_dir(config: Config) -> str:
+    """Directory of the completion artifact of the configured synthesis"""
+    return os.path.join(config.data_dir, config.synthesis_data_dir, config.completion_artifact_dirname)
+
+
+@contextmanager
+def _publish_lock(artifact_dir: str):
+    """Exclusive lock between publishers of an artifact"""
+    with open(os.path.join(artifact_dir, "publish.lock"), "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _versions(artifact_dir: str) -> List[str]:
+    return sorted(
+        name for name in os.listdir(artifact_dir)
+        if name.startswith(_VERSION_PREFIX) and name[len(_VERSION_PREFIX):].isdigit()
+        and os.path.isdir(os.path.join(artifact_dir, name))
+    )
+
+
+def _save_npy(path: str, array: np.ndarray) -> None:
+    with open(path, "wb") as f:
+        np.save(f, np.ascontiguousarray(array))
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _read_json(path: str) -> Any:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _write_json(path: str, data: Any) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+
+
+def _fsync_dir(path: str) -> None:
+    """Persist the entries of a directory (no-op where directories cannot be opened)"""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def main():
+    """
+    Complete the synthesis and publish the completion artifact.
+    """
+    parser = argparse.ArgumentParser(description="Complete the synthesis and publish the completed matrix")
+    parser.add_argument("--engine", default=None,
+                        help="Completion engine (default: the last model selection, else soft_impute)")
+    parser.add_argument("--rank", type=int, default=None)
+    parser.add_argument("--tol", type=float, default=None)
+    parser.add_argument("--keep", type=int, default=2, help="Versions kept on disk, the new one included")
+    args = parser.parse_args()
+
+    config = Config()
+    version = complete_and_publish(config, args.engine, args.rank, args.tol, args.keep)
+    artifact = CompletionArtifact(os.path.join(artifact_dir(config), version))
+    print(f"Complétion publiée : {artifact.version} ({artifact.meta['engine']}, "
+          f"{artifact.shape[0]} élèves x {artifact.shape[1]} exercices) dans {artifact.path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -11,15 +11,32 @@ class Config:
     final_data_dir: str = "final_data"
     activity_dir: str = os.path.join("data", "Activités")
     source_data_dir: str = "source_data"
+    tags_manifest_filename: str = "tags.json"
     data_dir: str = "data"  # Added data_dir attribute
     resultat_csv_filename: str = "resultat.csv"
     resultat_json_filename: str = "resultat.json"
+    fingerprint_filename: str = ".fingerprint.json"
+    run_report_filename: str = "run_report.json"
     synthesis_data_dir: str = "synthesis_data"
     synthesis_csv_filename: str = "synthesis.csv"
     synthesis_json_filename: str = "synthesis.json"
+    synthesis_store_dirname: str = "synthesis_store"
+    synthesis_db_filename: str = "synthesis.sqlite"
+    synthesis_journal_dirname: str = "journal"
+    completion_config_filename: str = "completion_config.json"
+    factor_model_filename: str = "factors.npz"
+    completion_artifact_dirname: str = "completion"
+    synthesis_primary_filename: str = "primary.json"
+    # Copie principale de la synthèse ("" : celle de la dernière fusion, voir src/db/synthesis_backend.py)
+    synthesis_backend: str = os.getenv('MATHALEA_SYNTHESIS_BACKEND', '')
 
     exercices_dir: str = "exercices"
     exercices_json_filename: str = "exercices.json"
+    catalog_base_url: str = os.getenv(
+        'MATHALEA_CATALOG_URL', "https://forge.apps.education.fr/coopmaths/mathalea/-/raw/main/src/json")
+    http_cache_dirname: str = "http_cache"
+    http_timeout: float = 30.0
+    http_pool_size: int = 4
     
     # Updated activity name to match the folder structure
     activity: str = os.getenv('MATHALEA_ACTIVITY', '1-Calcul_littéral')
@@ -5,37 +5,44 @@ import numpy as np
 import urllib.parse
 import re
 from pathlib import Path
+import importlib.util
+import logging
 import os
+from src.instrumentation import stage
+
+logger = logging.getLogger(__name__)
 
 
 class DataProcessor:
     def __init__(self, folder: str, config):
         self.folder = folder
         self.config = config
-        print(f"Initializing DataProcessor with folder: {self.folder}")
-        print(f"Config: {self.config.__dict__}")
+        logger.debug(f"Initializing DataProcessor with folder: {self.folder}")
         # self.ensure_output_directory()
 
     def ensure_output_directory(self) -> None:
         """Ensure the output directory exists"""
         output_dir = Path(self.config.final_data_dir)
-        print(f"Ensuring output directory exists: {output_dir}")
+        logger.debug(f"Ensuring output directory exists: {output_dir}")
         output_dir.mkdir(exist_ok=True)
-        print(
-            f"Output directory status: {'exists' if output_dir.exists() else 'creation failed'}"
-        )
 
     def process_res(self) -> pd.DataFrame:
-        """Process the results file"""
-        print(f"Processing results file: {self.config.res_filename}")
-        df = pd.read_csv(self._get_path(self.config.res_filename))
-
-        for col in df.columns:
-            try:
-                df[col] = pd.to_numeric(df[col])
-            except ValueError:
-                pass  # Keep as is if conversion is not possible
-
+        """
+        Process the results file.
+
+        Only the columns DataAnalyzer.prepare_final_dataframe uses are read: "Élève"
+        as text and the score columns (names containing a digit) as float32, so the
+        CSV is parsed once with a known schema. pyarrow's CSV reader is used when it
+        is installed.
+        """
+        logger.info(f"Processing results file: {self.config.res_filename}")
+        path = self._get_path(self.config.res_filename)
+        with stage("load_res") as record:
+            header = pd.read_csv(path, nrows=0).columns
+            score_columns = exercise_columns(header)
+            dtype = {"Élève": str, **{col: np.float32 for col in score_columns}}
+            df = pd.read_csv(path, usecols=["Élève"] + score_columns, dtype=dtype, engine=_csv_engine())
+            record.set_shape(df.shape)
         return df
 
     def process_eleve_groupe(self) -> pd.DataFrame:
@@ -43,23 +50,43 @@ class DataProcessor:
         file_path = os.path.join(
             self.config.data_dir, self.config.groupe_classe_filename
         )
-        print(f"Processing student group file: {file_path}")
-        print(f"File exists: {os.path.exists(file_path)}")
-        return pd.read_csv(file_path, usecols=["Élève", "Classe", "Groupe"])
+        logger.info(f"Processing student group file: {file_path}")
+        with stage("load_roster") as record:
+            df = pd.read_csv(file_path, usecols=["Élève", "Classe", "Groupe"], dtype={"Élève": str})
+            # Les libellés textuels de classe et de groupe se répètent : catégories
+            for col in ("Classe", "Groupe"):
+                if not pd.api.types.is_numeric_dtype(df[col]):
+                    df[col] = df[col].astype("category")
+            record.set_shape(df.shape)
+        return df
 
     def process_meta(self) -> pd.DataFrame:
         """Process the metadata file"""
-        print(f"Processing metadata file: {self.config.meta_filename}")
+        logger.info(f"Processing metadata file: {self.config.meta_filename}")
         df = pd.read_csv(self._get_path(self.config.meta_filename))
 
     def _get_path(self, filename: str) -> str:
         """Get the full path for a file"""
         full_path = os.path.join(self.folder, filename)
-        print(f"Full path for {filename}: {full_path}")
-        print(f"File exists: {os.path.exists(full_path)}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Full path for {filename}: {full_path} (exists: {os.path.exists(full_path)})")
         return full_path
 
 
+# Les colonnes d'exercices sont celles dont le nom contient un chiffre ("Exercice 1")
+_EXERCISE_COLUMN = re.compile(r"\d")
+
+
+def exercise_columns(columns) -> List[str]:
+    """Names of the exercise score columns among columns"""
+    return [col for col in columns if _EXERCISE_COLUMN.search(col)]
+
+
+def _csv_engine() -> str:
+    """pyarrow's multithreaded CSV reader when installed, else pandas' C parser"""
+    return "pyarrow" if importlib.util.find_spec("pyarrow") is not None else "c"
+
+
 class URLProcessor:
     @staticmethod
     def extract_url_from_html(content: str) -> str:
@@ -119,54 +146,56 @@ class DataAnalyzer:
         self.url_dict = url_dict
 
     def prepare_final_dataframe(self) -> pd.DataFrame:
-        """Prepare the final dataframe with all necessary transformations"""
-        df = self.df_res.join(self.df_groupe.set_index("Élève"), on="Élève")
-        print("Columns before renaming:")
-        print(df.columns)
-        # get numeric columns : columns in which the name contains some numbers
-
-        numeric_columns = [
-            col
-            for col in df.columns
-            if any(char.isdigit() for char in col)
-        ]
-        print("Numeric columns:")
-        print(numeric_columns)
-
-        columns = ["Élève", "Classe", "Groupe"] + numeric_columns
-        df = df[columns]
-        print("Columns after joining:")
-        print(df.columns)
-        print(len(self.url_dict))
+        """
+        Prepare the final dataframe with all necessary transformations.
+
+        The exercise columns are renamed to their super_id, missing "n" values are
+        inferred and the scores normalized as whole-matrix operations on the exercise
+        block.
+
+        Raises:
+            ValueError: If the URL does not list one exercise per score column.
+        """
+        with stage("join") as record:
+            df = self.df_res.join(self.df_groupe.set_index("Élève"), on="Élève")
+            # get numeric columns : columns in which the name contains some numbers
+            numeric_columns = exercise_columns(df.columns)
+            logger.debug(f"Numeric columns: {numeric_columns}")
+
+            if len(numeric_columns) != len(self.url_dict):
+                raise ValueError(
+                    f"The URL lists {len(self.url_dict)} exercises but the results have "
+                    f"{len(numeric_columns)} score columns: {numeric_columns}"
+                )
+            scores = df[numeric_columns].to_numpy(dtype=np.float64)
+            record.set_shape(scores.shape)
 
         # Rename columns and normalize scores
-
-        column_mapping = {
-            numeric_columns[i]: self.url_dict[i]["super_id"]
-            for i in range(0, len(self.url_dict))
-        }
-        df = df.rename(columns=column_mapping)
-        print("Columns after renaming:")
-        print(df.columns)
-
-        self._update_missing_n_values(df)
-        self._normalize_scores(df)
-
+        with stage("normalize") as record:
+            self._update_missing_n_values(scores)
+            scores = self._normalize_scores(scores)
+
+            super_ids = [d["super_id"] for d in self.url_dict]
+            logger.debug(f"Columns after renaming: {super_ids}")
+            df = pd.concat(
+                [df[["Élève", "Classe", "Groupe"]], pd.DataFrame(scores, columns=super_ids, index=df.index)],
+                axis=1,
+            )
+            record.set_shape(scores.shape)
         return df
 
-    def _update_missing_n_values(self, df: pd.DataFrame) -> None:
-        """Update missing 'n' values in url_dict"""
-        for d in self.url_dict:
-            if "n" not in d:
-                d["n"] = str(int(df[d["super_id"]].max()))
-
-    def _normalize_scores(self, df: pd.DataFrame) -> None:
-        """Normalize scores by dividing by n"""
-        for d in self.url_dict:
-            print(d["super_id"])
-            print("n")
-            print(d["n"])
-            print(df[d["super_id"]].max())
-            df[d["super_id"]] = df[d["super_id"]] / int(d["n"])
-            print(df[d["super_id"]].max())
-        
+    def _update_missing_n_values(self, scores: np.ndarray) -> None:
+        """Update missing 'n' values in url_dict with the best score of their column"""
+        missing = [i for i, d in enumerate(self.url_dict) if "n" not in d]
+        if not missing:
+            return
+        # fmax ignore les NaN (élèves sans réponse)
+        maxima = np.fmax.reduce(scores[:, missing], axis=0)
+        for i, maximum in zip(missing, maxima.tolist()):
+            self.url_dict[i]["n"] = str(int(maximum))
+
+    def _normalize_scores(self, scores: np.ndarray) -> np.ndarray:
+        """Normalize scores by dividing each column by its n"""
+        divisors = np.array([int(d["n"]) for d in self.url_dict], dtype=np.float64)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return scores / divisors
@@ -0,0 +1,77 @@
+import hashlib
+import json
+import os
+from typing import Dict, Optional
+
+# Champs de Config dont dépend le résultat d'une activité : fichiers lus et écrits, et
+# dossiers de l'activité. Les autres (synthèse, catalogue, HTTP, variables
+# d'environnement...) ne rendent pas les résultats obsolètes.
+FINGERPRINT_CONFIG_FIELDS = (
+    "res_filename",
+    "url_filename",
+    "meta_filename",
+    "groupe_classe_filename",
+    "tags_manifest_filename",
+    "source_data_dir",
+    "final_data_dir",
+    "resultat_csv_filename",
+    "resultat_json_filename",
+)
+
+
+def hash_file(path: str, chunk_size: int = 1 << 20) -> Optional[str]:
+    """SHA-256 of a file's content, or None if the file does not exist"""
+    if not os.path.exists(path):
+        return None
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def compute_fingerprint(source_data_dir: str, config, tags: Optional[Dict] = None) -> Dict:
+    """
+    Fingerprint of everything the results of an activity depend on: its res.csv and
+    mathAlea.html, the student roster, its tags manifest, the configuration fields
+    listed in FINGERPRINT_CONFIG_FIELDS and the tags given on the command line.
+    """
+    activity_dir = os.path.dirname(os.path.normpath(source_data_dir))
+    config_fields = {field: getattr(config, field) for field in FINGERPRINT_CONFIG_FIELDS}
+    return {
+        "inputs": {
+            "res": hash_file(os.path.join(source_data_dir, config.res_filename)),
+            "url": hash_file(os.path.join(source_data_dir, config.url_filename)),
+            "roster": hash_file(os.path.join(config.data_dir, config.groupe_classe_filename)),
+            "tags_manifest": hash_file(os.path.join(activity_dir, config.tags_manifest_filename)),
+        },
+        "config": hashlib.sha256(json.dumps(config_fields, sort_keys=True).encode()).hexdigest(),
+        "tags": tags or {},
+    }
+
+
+def load_fingerprint(output_dir: str, config) -> Optional[Dict]:
+    """Fingerprint stored with the results of the last run, or None"""
+    path = os.path.join(output_dir, config.fingerprint_filename)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+
+def save_fingerprint(output_dir: str, config, fingerprint: Dict) -> None:
+    """Store the fingerprint next to the results it was computed for"""
+    with open(os.path.join(output_dir, config.fingerprint_filename), "w", encoding="utf-8") as f:
+        json.dump(fingerprint, f, indent=2, ensure_ascii=False)
+
+
+def is_up_to_date(output_dir: str, config, fingerprint: Dict) -> bool:
+    """True if the results in output_dir exist and were produced from identical inputs"""
+    results_exist = all(
+        os.path.exists(os.path.join(output_dir, filename))
+        for filename in (config.resultat_csv_filename, config.resultat_json_filename)
+    )
+    return results_exist and load_fingerprint(output_dir, config) == fingerprint
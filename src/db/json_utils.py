@@ -1,5 +1,6 @@
 import json
 from datetime import datetime
+import numpy as np
 import pandas as pd
 import os
 
@@ -14,28 +15,41 @@ def generate_json_data(df, tags, url_infos):
         "exercises": {},
         "students": {}
     }
-    
-    # Extract exercise information
-    for i,col in enumerate(df.columns[3:]):  # Assuming first 3 columns are Élève, Classe, Groupe
-        data["exercises"][col] = {
-            "average_score": df[col].mean(),
-            "max_score": df[col].max(),
-            "min_score": df[col].min()
-        }
-        ## add url info
-        data["exercises"][col].update(url_infos[i])
 
+    score_columns = list(df.columns[3:])  # Assuming first 3 columns are Élève, Classe, Groupe
+    scores = df.iloc[:, 3:].to_numpy(dtype=float)
 
-    
-    # Extract student information
-    for _, row in df.iterrows():
-        student_name = row["Élève"]
+    # Extract exercise information: all column statistics in one pass
+    # (pandas cannot aggregate a frame without columns)
+    if score_columns:
+        stats = pd.DataFrame(scores, columns=range(len(score_columns))).agg(["mean", "max", "min"])
+        averages, maxima, minima = (stats.loc[stat].tolist() for stat in ("mean", "max", "min"))
+        for i, col in enumerate(score_columns):
+            data["exercises"][col] = {
+                "average_score": averages[i],
+                "max_score": maxima[i],
+                "min_score": minima[i]
+            }
+            ## add url info
+            data["exercises"][col].update(url_infos[i])
+
+    # Extract student information from the (row, column, score) triples of the
+    # non-missing scores, in row-major order so each student's scores are contiguous
+    rows, cols = np.nonzero(~np.isnan(scores))
+    observed_scores = scores[rows, cols].tolist()
+    observed_columns = [score_columns[j] for j in cols.tolist()]
+    bounds = np.searchsorted(rows, np.arange(len(df) + 1)).tolist()
+
+    for i, (student_name, classe, groupe) in enumerate(zip(
+        df["Élève"].tolist(), df["Classe"].tolist(), df["Groupe"].tolist()
+    )):
+        start, stop = bounds[i], bounds[i + 1]
         data["students"][student_name] = {
-            "class": row["Classe"],
-            "group": row["Groupe"],
-            "scores": {col: row[col] for col in df.columns[3:] if pd.notna(row[col])}
+            "class": classe,
+            "group": groupe,
+            "scores": dict(zip(observed_columns[start:stop], observed_scores[start:stop]))
         }
-    
+
     return data
 
 def update_or_create_json(json_path, new_data):
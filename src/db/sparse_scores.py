@@ -0,0 +1,209 @@
+"""
+Sparse student x exercise score matrix.
+
+The synthesis only records the scores students actually obtained, which is a small
+fraction of the students x exercises grid. SparseScoreMatrix keeps those observed
+scores in coordinate form (sorted row-major, so the row pointers give a CSR view)
+together with the student and exercise index maps, and is built straight from
+synthesis.json without going through the wide CSV.
+"""
+
+import json
+import os
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+import numpy as np
+
+
+@dataclass(eq=False)
+class SparseScoreMatrix:
+    """
+    Observed scores of a student x exercise matrix in COO/CSR layout.
+
+    Attributes:
+        rows (np.ndarray): Student (row) index of each observed score.
+        cols (np.ndarray): Exercise (column) index of each observed score.
+        values (np.ndarray): Observed scores.
+        students (List[str]): Student name of each row.
+        exercises (List[str]): Exercise super_id of each column.
+        classes (List[Any]): Class of each student, when known.
+        groups (List[Any]): Group of each student, when known.
+    """
+
+    rows: np.ndarray
+    cols: np.ndarray
+    values: np.ndarray
+    students: List[str]
+    exercises: List[str]
+    classes: List[Any] = field(default_factory=list)
+    groups: List[Any] = field(default_factory=list)
+
+    def __post_init__(self):
+        self.rows = np.asarray(self.rows, dtype=np.int32)
+        self.cols = np.asarray(self.cols, dtype=np.int32)
+        self.values = np.asarray(self.values, dtype=np.float64)
+        order = np.lexsort((self.cols, self.rows))
+        if not np.array_equal(order, np.arange(order.size)):
+            self.rows, self.cols, self.values = self.rows[order], self.cols[order], self.values[order]
+        self._student_index = None
+        self._exercise_index = None
+
+    @classmethod
+    def from_synthesis(cls, synthesis_data: Dict[str, Any]) -> "SparseScoreMatrix":
+        """
+        Build the matrix from a loaded synthesis dictionary.
+
+        Columns follow the order of synthesis_data["exercises"], like synthesis.csv;
+        scores of exercises missing from that section are ignored.
+        """
+        exercises = list(synthesis_data.get("exercises", {}))
+        exercise_index = {exercise_id: j for j, exercise_id in enumerate(exercises)}
+
+        students, classes, groups = [], [], []
+        rows, cols, values = [], [], []
+        for i, (student, student_info) in enumerate(synthesis_data.get("students", {}).items()):
+            students.append(student)
+            classes.append(student_info.get("class"))
+            groups.append(student_info.get("group"))
+            for exercise_id, score in student_info.get("scores", {}).items():
+                j = exercise_index.get(exercise_id)
+                if j is not None and score is not None:
+                    rows.append(i)
+                    cols.append(j)
+                    values.append(score)
+
+        return cls(rows, cols, values, students, exercises, classes, groups)
+
+    @classmethod
+    def from_synthesis_json(cls, json_path: str) -> "SparseScoreMatrix":
+        """Build the matrix from a synthesis.json file"""
+        with open(json_path, "r", encoding="utf-8") as f:
+            return cls.from_synthesis(json.load(f))
+
+    @classmethod
+    def from_config(cls, config) -> "SparseScoreMatrix":
+        """
+        Build the matrix from the primary copy of the synthesis: the backend set in
+        config.synthesis_backend, else the one the last merge wrote to (see
+        src.db.synthesis_backend). For a synthesis merged before the primary copy was
+        recorded, the first copy found is used: the columnar store, then the SQLite
+        database, then the journal, then synthesis.json.
+
+        Raises:
+            FileNotFoundError: If the primary copy does not exist.
+        """
+        from src.db.synthesis_backend import reader_backend
+        from src.db.synthesis_journal import SynthesisJournal
+        from src.db.synthesis_sqlite import SynthesisDatabase
+        from src.db.synthesis_store import SynthesisStore
+
+        synthesis_dir = os.path.join(config.data_dir, config.synthesis_data_dir)
+        store = SynthesisStore(os.path.join(synthesis_dir, config.synthesis_store_dirname))
+        db_path = os.path.join(synthesis_dir, config.synthesis_db_filename)
+        journal_dir = os.path.join(synthesis_dir, config.synthesis_journal_dirname)
+        json_path = os.path.join(synthesis_dir, config.synthesis_json_filename)
+
+        backend = reader_backend(config)
+        if backend is None:
+            backend = ("store" if store.exists() else "sqlite" if os.path.exists(db_path)
+                       else "journal" if os.path.isdir(journal_dir) else "json")
+        if backend == "store":
+            if not store.exists():
+                raise FileNotFoundError(f"No synthesis store in {store.path}")
+            return store.to_sparse()
+        if backend == "sqlite":
+            if not os.path.exists(db_path):
+                raise FileNotFoundError(f"No synthesis database at {db_path}")
+            with SynthesisDatabase(db_path, read_only=True) as database:
+                return database.to_sparse()
+        if backend == "journal":
+            if not os.path.isdir(journal_dir):
+                raise FileNotFoundError(f"No synthesis journal in {journal_dir}")
+            return cls.from_synthesis(SynthesisJournal(journal_dir).load())
+        return cls.from_synthesis_json(json_path)
+
+    @classmethod
+    def from_dense(cls, matrix: np.ndarray, students: Optional[List[str]] = None,
+                   exercises: Optional[List[str]] = None) -> "SparseScoreMatrix":
+        """Build the matrix from a dense array with NaN for the missing entries"""
+        matrix = np.asarray(matrix, dtype=np.float64)
+        rows, cols = np.nonzero(~np.isnan(matrix))
+        students = students if students is not None else [str(i) for i in range(matrix.shape[0])]
+        exercises = exercises if exercises is not None else [str(j) for j in range(matrix.shape[1])]
+        return cls(rows, cols, matrix[rows, cols], list(students), list(exercises))
+
+    @property
+    def shape(self):
+        return len(self.students), len(self.exercises)
+
+    @property
+    def nnz(self) -> int:
+        return int(self.values.size)
+
+    @property
+    def density(self) -> float:
+        n_rows, n_cols = self.shape
+        return self.nnz / (n_rows * n_cols) if n_rows and n_cols else 0.0
+
+    @property
+    def student_index(self) -> Dict[str, int]:
+        if self._student_index is None:
+            self._student_index = {student: i for i, student in enumerate(self.students)}
+        return self._student_index
+
+    @property
+    def exercise_index(self) -> Dict[str, int]:
+        if self._exercise_index is None:
+            self._exercise_index = {exercise_id: j for j, exercise_id in enumerate(self.exercises)}
+        return self._exercise_index
+
+    @property
+    def indptr(self) -> np.ndarray:
+        """CSR row pointers: the scores of row i are values[indptr[i]:indptr[i + 1]]"""
+        counts = np.bincount(self.rows, minlength=self.shape[0])
+        return np.concatenate(([0], np.cumsum(counts)))
+
+    def flat_index(self) -> np.ndarray:
+        """Row-major flat index of each observed score"""
+        return self.rows.astype(np.int64) * self.shape[1] + self.cols
+
+    def observed_mask(self) -> np.ndarray:
+        """Dense boolean mask of the observed entries"""
+        mask = np.zeros(self.shape, dtype=bool)
+        mask[self.rows, self.cols] = True
+        return mask
+
+    def column_means(self) -> np.ndarray:
+        """Mean observed score of each exercise (global mean for exercises without scores)"""
+        n_cols = self.shape[1]
+        counts = np.bincount(self.cols, minlength=n_cols)
+        sums = np.bincount(self.cols, weights=self.values, minlength=n_cols)
+        global_mean = self.values.mean() if self.nnz else 0.0
+        return np.divide(sums, counts, out=np.full(n_cols, global_mean), where=counts > 0)
+
+    def subset(self, selection: np.ndarray) -> "SparseScoreMatrix":
+        """Matrix with the same index maps restricted to the selected observed scores"""
+        return SparseScoreMatrix(self.rows[selection], self.cols[selection], self.values[selection],
+                                 self.students, self.exercises, self.classes, self.groups)
+
+    def split(self, fraction: float, seed: Optional[int] = 0):
+        """
+        Randomly hold out a fraction of the observed scores.
+
+        Returns:
+            tuple: (training matrix, held-out matrix), both with the full index maps.
+        """
+        held_out = np.random.default_rng(seed).random(self.nnz) < fraction
+        return self.subset(~held_out), self.subset(held_out)
+
+    def to_dense(self, fill_value: float = np.nan) -> np.ndarray:
+        """Dense matrix with fill_value for the missing entries"""
+        dense = np.full(self.shape, fill_value, dtype=np.float64)
+        dense[self.rows, self.cols] = self.values
+        return dense
+
+    def to_scipy(self):
+        """scipy.sparse CSR matrix of the observed scores"""
+        from scipy.sparse import csr_matrix
+
+        return csr_matrix((self.values, self.cols, self.indptr), shape=self.shape)
@@ -0,0 +1,56 @@
+"""
+Primary copy of the synthesis.
+
+The synthesis can be kept in the columnar store, the SQLite database, the journal or
+synthesis.json. The backend activities are merged into is recorded next to the
+synthesis, so the readers (model selection, completion, factor model) load that copy
+rather than whichever file happens to exist:
+
+    synthesis_data/
+        primary.json    {"backend": "sqlite", "updated_at": "..."}
+
+Config.synthesis_backend (MATHALEA_SYNTHESIS_BACKEND) pins the backend for readers
+and writers alike.
+"""
+
+import json
+import os
+from datetime import datetime
+from typing import Optional
+
+SYNTHESIS_BACKENDS = ("store", "sqlite", "journal", "json")
+DEFAULT_BACKEND = "store"
+
+
+def recorded_backend(config) -> Optional[str]:
+    """Backend the last merge wrote to, or None"""
+    path = _primary_path(config)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            backend = json.load(f).get("backend")
+    except (OSError, json.JSONDecodeError, AttributeError):
+        return None
+    return backend if backend in SYNTHESIS_BACKENDS else None
+
+
+def reader_backend(config) -> Optional[str]:
+    """Backend to read the synthesis from: the configured one, else the recorded one, else None"""
+    return config.synthesis_backend or recorded_backend(config)
+
+
+def writer_backend(config, requested: Optional[str] = None) -> str:
+    """Backend to merge into: the requested one, else the configured or recorded one, else the store"""
+    return requested or config.synthesis_backend or recorded_backend(config) or DEFAULT_BACKEND
+
+
+def record_backend(config, backend: str) -> None:
+    """Record backend as the primary copy of the synthesis"""
+    path = _primary_path(config)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+        json.dump({"backend": backend, "updated_at": datetime.now().isoformat()}, f, indent=2)
+    os.replace(f"{path}.tmp", path)
+
+
+def _primary_path(config) -> str:
+    return os.path.join(config.data_dir, config.synthesis_data_dir, config.synthesis_primary_filename)
@@ -0,0 +1,226 @@
+"""
+Append-only synthesis journal.
+
+Each synthesized activity appends one line to journal.jsonl with its delta (the
+exercises, students and scores of its resultat.json), flushed to disk before the
+update is reported, so an update costs O(delta) and a crash can at worst lose the
+line being written. Readers get the last snapshot plus a replay of the journal
+entries written after it, under a shared lock so a compaction cannot move the
+journal between the two reads. Compaction folds the journal into a new snapshot and
+archives the folded entries as a segment, which keeps every historical state
+rebuildable.
+
+    journal/
+        snapshot.json           synthesis at sequence number "journal_seq"
+        journal.jsonl           entries not folded into the snapshot yet
+        segments/<first>-<last>.jsonl   archived entries
+"""
+
+import fcntl
+import glob
+import json
+import os
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Iterator, Optional
+from src.db.synthesis_utils import merge_activity, new_synthesis_data, update_statistics, write_synthesis_json
+
+
+class SynthesisJournal:
+    """
+    Synthesis stored as a snapshot plus an append-only journal of activity deltas.
+
+    Attributes:
+        directory (str): Directory of the snapshot, journal and archived segments.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.snapshot_path = os.path.join(directory, "snapshot.json")
+        self.journal_path = os.path.join(directory, "journal.jsonl")
+        self.segments_dir = os.path.join(directory, "segments")
+        os.makedirs(self.segments_dir, exist_ok=True)
+
+    @property
+    def last_seq(self) -> int:
+        """
+        Sequence number of the last entry appended, by any writer.
+
+        Read from the files every time: another process may have appended or
+        compacted since this instance was created.
+        """
+        # Les segments archivés couvrent tout ce que le snapshot contient
+        last = max((int(os.path.basename(p).split("-")[1].split(".")[0]) for p in self._segment_paths()),
+                   default=0)
+        tail = self._last_entry_seq()
+        return max(last, tail) if tail is not None else last
+
+    def append(self, activity_name: str, new_data: Dict[str, Any]) -> int:
+        """
+        Append the delta of a synthesized activity.
+
+        The sequence number is derived under the writers' lock, from the archived
+        segments and the last line of the journal, so concurrent appends and
+        compactions by other processes are accounted for.
+
+        Returns:
+            int: Sequence number of the new entry.
+        """
+        entry = {
+            "seq": None,
+            "activity": activity_name,
+            "appended_at": datetime.now().isoformat(),
+            "exercises": new_data["exercises"],
+            "students": new_data["students"],
+        }
+        with self._lock():
+            self._truncate_partial_line()
+            entry["seq"] = seq = self.last_seq + 1
+            line = json.dumps(entry, ensure_ascii=False) + "\n"
+            with open(self.journal_path, "a", encoding="utf-8") as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+        return seq
+
+    def load(self) -> Dict[str, Any]:
+        """Current synthesis: the snapshot with the newer journal entries replayed on top"""
+        # Partagé : une compaction ne peut pas déplacer le journal entre les deux lectures
+        with self._lock(shared=True):
+            return self._load()
+
+    def _load(self) -> Dict[str, Any]:
+        synthesis_data = self._load_snapshot()
+        snapshot_seq = synthesis_data["metadata"].get("journal_seq", 0)
+        replayed = self._replay(synthesis_data, self._read(self.journal_path), after=snapshot_seq)
+        if replayed:
+            update_statistics(synthesis_data)
+        return synthesis_data
+
+    def state_at(self, seq: int) -> Dict[str, Any]:
+        """Synthesis as it was right after entry seq, rebuilt from the archived segments and the journal"""
+        synthesis_data = new_synthesis_data()
+        synthesis_data["metadata"]["journal_seq"] = 0
+        with self._lock(shared=True):
+            for path in self._segment_paths() + [self.journal_path]:
+                self._replay(synthesis_data, self._read(path), after=synthesis_data["metadata"]["journal_seq"],
+                             until=seq)
+        if synthesis_data["exercises"]:
+            update_statistics(synthesis_data)
+        return synthesis_data
+
+    def compact(self) -> Optional[int]:
+        """
+        Fold the journal into a new snapshot and archive the folded entries.
+
+        The snapshot is written atomically before the journal is moved, so a crash at
+        any point leaves a state that load() replays correctly.
+
+        Returns:
+            Optional[int]: Sequence number of the new snapshot, or None if there was nothing to fold.
+        """
+        with self._lock():
+            entries = list(self._read(self.journal_path))
+            if not entries:
+                return None
+
+            synthesis_data = self._load()
+            write_synthesis_json(synthesis_data, self.snapshot_path)
+
+            segment_path = os.path.join(self.segments_dir,
+                                        f"{entries[0]['seq']:09d}-{entries[-1]['seq']:09d}.jsonl")
+            os.replace(self.journal_path, segment_path)
+            return synthesis_data["metadata"]["journal_seq"]
+
+    @contextmanager
+    def _lock(self, shared: bool = False):
+        """Exclusive lock between writers (appends and compaction), shared between readers"""
+        with open(os.path.join(self.directory, "journal.lock"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _replay(self, synthesis_data, entries: Iterator[Dict[str, Any]], after: int = 0,
+                until: Optional[int] = None) -> int:
+        replayed = 0
+        for entry in entries:
+            if entry["seq"] <= after or (until is not None and entry["seq"] > until):
+                continue
+            merge_activity(synthesis_data, {"exercises": entry["exercises"], "students": entry["students"]},
+                           entry["activity"])
+            synthesis_data["metadata"]["journal_seq"] = entry["seq"]
+            replayed += 1
+        return replayed
+
+    def _load_snapshot(self) -> Dict[str, Any]:
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, "r") as f:
+                return json.load(f)
+        synthesis_data = new_synthesis_data()
+        synthesis_data["metadata"]["journal_seq"] = 0
+        return synthesis_data
+
+    def _last_entry_seq(self, chunk_size: int = 1 << 16) -> Optional[int]:
+        """Sequence number of the last complete line of the journal, read backwards from its end"""
+        if not os.path.exists(self.journal_path):
+            return None
+        with open(self.journal_path, "rb") as f:
+            end = f.seek(0, os.SEEK_END)
+            content = b""
+            # Fin de la dernière ligne complète (une ligne interrompue est ignorée)
+            while end > 0:
+                start = max(0, end - chunk_size)
+                f.seek(start)
+                content = f.read(end - start) + content
+                end = start
+                if content.count(b"\n") >= 2 or (end == 0 and b"\n" in content):
+                    break
+        last_newline = content.rfind(b"\n")
+        if last_newline < 0:
+            return None
+        line = content[content.rfind(b"\n", 0, last_newline) + 1:last_newline]
+        return json.loads(line)["seq"] if line else None
+
+    def _truncate_partial_line(self, chunk_size: int = 1 << 16) -> None:
+        """
+        Drop a line left incomplete by a crash mid-append, so the next append starts on
+        a new line. Must be called with the writers' lock held.
+
+        Only the last byte is read when the journal ends with a newline; the journal is
+        scanned backwards for the last newline otherwise.
+        """
+        if not os.path.exists(self.journal_path):
+            return
+        with open(self.journal_path, "rb+") as f:
+            end = f.seek(0, os.SEEK_END)
+            if end == 0:
+                return
+            f.seek(end - 1)
+            if f.read(1) == b"\n":
+                return
+            # Ligne interrompue : tronquer après le dernier saut de ligne
+            while end > 0:
+                start = max(0, end - chunk_size)
+                f.seek(start)
+                last_newline = f.read(end - start).rfind(b"\n")
+                if last_newline >= 0:
+                    f.truncate(start + last_newline + 1)
+                    return
+                end = start
+            f.truncate(0)
+
+    def _segment_paths(self):
+        return sorted(glob.glob(os.path.join(self.segments_dir, "*.jsonl")))
+
+    @staticmethod
+    def _read(path: str) -> Iterator[Dict[str, Any]]:
+        """Entries of a journal file; a truncated last line (crash mid-append) is ignored"""
+        if not os.path.exists(path):
+            return
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.endswith("\n"):
+                    break
+                yield json.loads(line)
@@ -0,0 +1,347 @@
+"""
+SQLite synthesis database.
+
+Each activity's resultat.json is merged with UPSERTs into per-activity rows, so
+adding (or re-running) an activity only touches that activity's rows, and the
+synthesized values are computed by the queries. Each score row is one observation:
+the sufficient statistics [count, sum, sum of squares] of every student x exercise
+cell are kept in cell_stats, recomputed from the score rows of the cells an upsert
+touches, and the exercise averages and variances derive from them, as
+synthesis_utils.merge_activity computes them. The database runs in WAL mode so
+readers keep working while the nightly job writes.
+"""
+
+import json
+import sqlite3
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from src.db.sparse_scores import SparseScoreMatrix
+from src.db.synthesis_utils import score_variance, update_statistics
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS activities (
+    name TEXT PRIMARY KEY,
+    synthesized_at TEXT NOT NULL,
+    tags TEXT NOT NULL DEFAULT '{}'
+);
+CREATE TABLE IF NOT EXISTS exercises (
+    super_id TEXT PRIMARY KEY,
+    attributes TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS students (
+    name TEXT PRIMARY KEY,
+    class TEXT,
+    "group" TEXT
+);
+CREATE TABLE IF NOT EXISTS exercise_activities (
+    super_id TEXT NOT NULL,
+    activity TEXT NOT NULL,
+    n INTEGER NOT NULL,
+    average_score REAL,
+    max_score REAL,
+    min_score REAL,
+    run_at TEXT NOT NULL,
+    PRIMARY KEY (super_id, activity)
+);
+CREATE TABLE IF NOT EXISTS scores (
+    student TEXT NOT NULL,
+    super_id TEXT NOT NULL,
+    activity TEXT NOT NULL,
+    score REAL NOT NULL,
+    run_at TEXT NOT NULL,
+    PRIMARY KEY (student, super_id, activity)
+);
+CREATE TABLE IF NOT EXISTS student_activities (
+    student TEXT NOT NULL,
+    activity TEXT NOT NULL,
+    run_at TEXT NOT NULL,
+    PRIMARY KEY (student, activity)
+);
+CREATE TABLE IF NOT EXISTS cell_stats (
+    student TEXT NOT NULL,
+    super_id TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    sum REAL NOT NULL,
+    sumsq REAL NOT NULL,
+    PRIMARY KEY (student, super_id)
+);
+-- La clé primaire de scores sert d'index sur student
+CREATE INDEX IF NOT EXISTS idx_scores_exercise ON scores (super_id);
+CREATE INDEX IF NOT EXISTS idx_student_activities_activity ON student_activities (activity, run_at);
+CREATE INDEX IF NOT EXISTS idx_scores_activity ON scores (activity, run_at);
+CREATE INDEX IF NOT EXISTS idx_exercise_activities_activity ON exercise_activities (activity, run_at);
+CREATE INDEX IF NOT EXISTS idx_students_class ON students (class);
+CREATE INDEX IF NOT EXISTS idx_students_group ON students ("group");
+"""
+
+# Champs d'un exercice de resultat.json propres à l'activité (agrégés par les requêtes)
+_ACTIVITY_FIELDS = ("n", "average_score", "max_score", "min_score", "activities")
+
+# Bases écrites avant cell_stats et student_activities, ouvertes en lecture seule :
+# les mêmes lignes sont calculées à partir de scores
+_CELL_STATS_FROM_SCORES = ("(SELECT student, super_id, COUNT(*) AS count, SUM(score) AS sum, "
+                           "SUM(score * score) AS sumsq FROM scores GROUP BY student, super_id)")
+_STUDENT_ACTIVITIES_FROM_SCORES = ("(SELECT student, activity, MAX(run_at) AS run_at FROM scores "
+                                   "GROUP BY student, activity)")
+
+
+class SynthesisDatabase:
+    """
+    Synthesis stored in an SQLite database.
+
+    Attributes:
+        path (str): Database file.
+        connection (sqlite3.Connection): Open connection.
+    """
+
+    def __init__(self, path: str, read_only: bool = False, timeout: float = 30.0):
+        self.path = path
+        if read_only:
+            self.connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True, timeout=timeout)
+        else:
+            self.connection = sqlite3.connect(path, timeout=timeout)
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+            self.connection.executescript(SCHEMA)
+            self._backfill()
+        tables = {row[0] for row in self.connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        self._cell_stats = "cell_stats" if "cell_stats" in tables else _CELL_STATS_FROM_SCORES
+        self._student_activities = ("student_activities" if "student_activities" in tables
+                                    else _STUDENT_ACTIVITIES_FROM_SCORES)
+
+    def _backfill(self) -> None:
+        """Fill cell_stats and student_activities in a database written before them"""
+        with self.connection:
+            if self.connection.execute("SELECT 1 FROM scores LIMIT 1").fetchone() is None:
+                return
+            if self.connection.execute("SELECT 1 FROM cell_stats LIMIT 1").fetchone() is None:
+                self.connection.execute(f"INSERT INTO cell_stats SELECT * FROM {_CELL_STATS_FROM_SCORES}")
+            if self.connection.execute("SELECT 1 FROM student_activities LIMIT 1").fetchone() is None:
+                self.connection.execute(
+                    f"INSERT INTO student_activities SELECT * FROM {_STUDENT_ACTIVITIES_FROM_SCORES}")
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def upsert_activity(self, activity_name: str, new_data: Dict[str, Any]) -> None:
+        """
+        Merge an activity's resultat.json data in one transaction.
+
+        Rows of the activity are upserted and the rows a previous run of the same
+        activity produced but this one did not are deleted, so re-running an
+        activity replaces its contribution instead of adding to it. The statistics
+        of the cells the activity touched (before or now) are recomputed, and the
+        exercises and students left without any activity are deleted.
+        """
+        run_at = datetime.now().isoformat()
+        with self.connection:
+            # Cellules de la contribution précédente, dont les statistiques changent aussi
+            self.connection.execute("CREATE TEMP TABLE IF NOT EXISTS touched_cells "
+                                    "(student TEXT, super_id TEXT, PRIMARY KEY (student, super_id))")
+            self.connection.execute("DELETE FROM temp.touched_cells")
+            self.connection.execute("INSERT OR IGNORE INTO temp.touched_cells "
+                                    "SELECT student, super_id FROM scores WHERE activity = ?", (activity_name,))
+            self.connection.execute(
+                "INSERT INTO activities (name, synthesized_at, tags) VALUES (?, ?, ?) "
+                "ON CONFLICT (name) DO UPDATE SET synthesized_at = excluded.synthesized_at, tags = excluded.tags",
+                (activity_name, run_at, json.dumps(new_data.get("tags", {}), ensure_ascii=False)),
+            )
+            self.connection.executemany(
+                "INSERT INTO exercises (super_id, attributes) VALUES (?, ?) ON CONFLICT (super_id) DO NOTHING",
+                [
+                    (exercise_id, json.dumps({k: v for k, v in info.items() if k not in _ACTIVITY_FIELDS},
+                                             ensure_ascii=False))
+                    for exercise_id, info in new_data["exercises"].items()
+                ],
+            )
+            self.connection.executemany(
+                "INSERT INTO exercise_activities (super_id, activity, n, average_score, max_score, min_score, run_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (super_id, activity) DO UPDATE SET "
+                "n = excluded.n, average_score = excluded.average_score, max_score = excluded.max_score, "
+                "min_score = excluded.min_score, run_at = excluded.run_at",
+                [
+                    (exercise_id, activity_name, int(info.get("n") or 0), _real(info.get("average_score")),
+                     _real(info.get("max_score")), _real(info.get("min_score")), run_at)
+                    for exercise_id, info in new_data["exercises"].items()
+                ],
+            )
+            self.connection.executemany(
+                'INSERT INTO students (name, class, "group") VALUES (?, ?, ?) '
+                'ON CONFLICT (name) DO UPDATE SET class = excluded.class, "group" = excluded."group"',
+                [
+                    (student, _text(info.get("class")), _text(info.get("group")))
+                    for student, info in new_data["students"].items()
+                ],
+            )
+            self.connection.executemany(
+                "INSERT INTO scores (student, super_id, activity, score, run_at) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (student, super_id, activity) DO UPDATE SET score = excluded.score, run_at = excluded.run_at",
+                [
+                    (student, exercise_id, activity_name, score, run_at)
+                    for student, info in new_data["students"].items()
+                    for exercise_id, score in info["scores"].items()
+                    if _real(score) is not None
+                ],
+            )
+            self.connection.executemany(
+                "INSERT INTO student_activities (student, activity, run_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (student, activity) DO UPDATE SET run_at = excluded.run_at",
+                [(student, activity_name, run_at) for student in new_data["students"]],
+            )
+            for table in ("scores", "exercise_activities", "student_activities"):
+                self.connection.execute(f"DELETE FROM {table} WHERE activity = ? AND run_at <> ?",
+                                        (activity_name, run_at))
+
+            self.connection.execute("INSERT OR IGNORE INTO temp.touched_cells "
+                                    "SELECT student, super_id FROM scores WHERE activity = ?", (activity_name,))
+            self.connection.execute("DELETE FROM cell_stats WHERE (student, super_id) IN "
+                                    "(SELECT student, super_id FROM temp.touched_cells)")
+            self.connection.execute(
+                "INSERT INTO cell_stats (student, super_id, count, sum, sumsq) "
+                "SELECT sc.student, sc.super_id, COUNT(*), SUM(sc.score), SUM(sc.score * sc.score) "
+                "FROM scores sc JOIN temp.touched_cells t ON t.student = sc.student AND t.super_id = sc.super_id "
+                "GROUP BY sc.student, sc.super_id"
+            )
+            self.connection.execute("DELETE FROM exercises WHERE super_id NOT IN "
+                                    "(SELECT super_id FROM exercise_activities)")
+            self.connection.execute("DELETE FROM students WHERE name NOT IN (SELECT student FROM student_activities)")
+
+    def synthesized_activities(self) -> List[str]:
+        return [row[0] for row in self.connection.execute("SELECT name FROM activities ORDER BY synthesized_at")]
+
+    def scores_for_class(self, class_name: str) -> List[Tuple[str, str, float]]:
+        """(student, super_id, synthesized score) of every student of a class"""
+        return self.connection.execute(
+            "SELECT s.name, sc.super_id, AVG(sc.score) FROM students s "
+            "JOIN scores sc ON sc.student = s.name WHERE s.class = ? "
+            "GROUP BY s.name, sc.super_id ORDER BY s.name, sc.super_id",
+            (class_name,),
+        ).fetchall()
+
+    def scores_for_group(self, group: str) -> List[Tuple[str, str, float]]:
+        """(student, super_id, synthesized score) of every student of a group"""
+        return self.connection.execute(
+            'SELECT s.name, sc.super_id, AVG(sc.score) FROM students s '
+            'JOIN scores sc ON sc.student = s.name WHERE s."group" = ? '
+            'GROUP BY s.name, sc.super_id ORDER BY s.name, sc.super_id',
+            (group,),
+        ).fetchall()
+
+    def student_scores(self, student: str) -> Dict[str, float]:
+        """Synthesized score of a student for each exercise"""
+        return dict(self.connection.execute(
+            "SELECT super_id, AVG(score) FROM scores WHERE student = ? GROUP BY super_id", (student,)
+        ))
+
+    def exercise_scores(self, super_id: str) -> Dict[str, float]:
+        """Synthesized score of each student for an exercise"""
+        return dict(self.connection.execute(
+            "SELECT student, AVG(score) FROM scores WHERE super_id = ? GROUP BY student", (super_id,)
+        ))
+
+    def to_sparse(self) -> SparseScoreMatrix:
+        """Score matrix for matrix_completion"""
+        students = self.connection.execute('SELECT name, class, "group" FROM students ORDER BY rowid').fetchall()
+        exercises = [row[0] for row in self.connection.execute("SELECT super_id FROM exercises ORDER BY rowid")]
+        student_index = {name: i for i, (name, _, _) in enumerate(students)}
+        exercise_index = {exercise_id: j for j, exercise_id in enumerate(exercises)}
+        rows, cols, values = [], [], []
+        for student, exercise_id, score in self.connection.execute(
+            f"SELECT student, super_id, sum / count FROM {self._cell_stats}"
+        ):
+            if exercise_id not in exercise_index:
+                continue
+            rows.append(student_index[student])
+            cols.append(exercise_index[exercise_id])
+            values.append(score)
+        return SparseScoreMatrix(rows, cols, values, [s[0] for s in students], exercises,
+                                 [s[1] for s in students], [s[2] for s in students])
+
+    def to_synthesis(self) -> Dict[str, Any]:
+        """
+        Rebuild the nested synthesis dictionary (the synthesis.json structure), with the
+        same statistics and per-activity contributions as synthesis_utils.merge_activity.
+        """
+        exercises = {}
+        for super_id, attributes in self.connection.execute("SELECT super_id, attributes FROM exercises ORDER BY rowid"):
+            exercises[super_id] = dict(json.loads(attributes), n=0, activities=[], stats=[0, 0.0, 0.0],
+                                       average_score=None, variance=None, max_score=None, min_score=None)
+        contributions: Dict[str, Dict[str, Any]] = {}
+        for super_id, activity, n, maximum, minimum in self.connection.execute(
+            "SELECT super_id, activity, n, max_score, min_score FROM exercise_activities ORDER BY run_at, rowid"
+        ):
+            exercise = exercises[super_id]
+            exercise["n"] += n
+            exercise["activities"].append(activity)
+            if maximum is not None:
+                exercise["max_score"] = maximum if exercise["max_score"] is None else max(exercise["max_score"], maximum)
+            if minimum is not None:
+                exercise["min_score"] = minimum if exercise["min_score"] is None else min(exercise["min_score"], minimum)
+            contribution = contributions.setdefault(activity, {"exercises": {}, "students": {}})
+            contribution["exercises"][super_id] = {"n": n, "max_score": maximum, "min_score": minimum}
+
+        students = {
+            name: {"class": classe, "group": group, "scores": {}, "activities": [], "stats": {}}
+            for name, classe, group in self.connection.execute('SELECT name, class, "group" FROM students ORDER BY rowid')
+        }
+        for student, activity in self.connection.execute(
+            f"SELECT student, activity FROM {self._student_activities} ORDER BY run_at"
+        ):
+            students[student]["activities"].append(activity)
+            contributions.setdefault(activity, {"exercises": {}, "students": {}})["students"][student] = {}
+        for student, super_id, activity, score in self.connection.execute(
+            "SELECT student, super_id, activity, score FROM scores"
+        ):
+            if super_id not in exercises:
+                continue
+            contributions[activity]["students"][student][super_id] = score
+        for student, super_id, count, total, total_squares in self.connection.execute(
+            f"SELECT student, super_id, count, sum, sumsq FROM {self._cell_stats}"
+        ):
+            if super_id not in exercises:
+                continue
+            students[student]["stats"][super_id] = [count, total, total_squares]
+            students[student]["scores"][super_id] = total / count
+            stats = exercises[super_id]["stats"]
+            stats[0] += count
+            stats[1] += total
+            stats[2] += total_squares
+
+        for exercise in exercises.values():
+            count, total, _ = exercise["stats"]
+            exercise["average_score"] = total / count if count else None
+            exercise["variance"] = score_variance(exercise["stats"])
+
+        synthesis_data = {
+            "tags": {},
+            "exercises": exercises,
+            "students": students,
+            "metadata": {
+                "updated_at": datetime.now().isoformat(),
+                "synthesized_activities": self.synthesized_activities(),
+            },
+            "contributions": contributions,
+        }
+        update_statistics(synthesis_data)
+        return synthesis_data
+
+
+def _real(value: Any) -> Optional[float]:
+    """Float value, or None for missing/NaN values"""
+    if value is None:
+        return None
+    value = float(value)
+    return None if value != value else value
+
+
+def _text(value: Any) -> Optional[str]:
+    """Text value, or None for missing/NaN values"""
+    if value is None or (isinstance(value, float) and value != value):
+        return None
+    return str(value)
@@ -0,0 +1,326 @@
+"""
+Columnar synthesis store.
+
+The synthesis is kept as a long-format scores table (one row per student x exercise
+score) plus student and exercise dimension tables, each column in its own file, in a
+version directory named by the CURRENT pointer:
+
+    synthesis_store/
+        CURRENT                 name of the current version
+        v000004/
+            scores.student.npy      int32, row of the student (sorted, then by exercise)
+            scores.exercise.npy     int32, row of the exercise
+            scores.value.npy        float64, the score
+            scores.count.npy        int32, number of scores merged into the cell
+            scores.sum.npy          float64, their sum
+            scores.sumsq.npy        float64, the sum of their squares
+            students.name.json      one list per dimension column
+            students.class.json
+            students.group.json
+            students.activities.json
+            exercises.super_id.json
+            exercises.attributes.json   the remaining exercise fields (stats, URL params, activities)
+            synthesis.meta.json     tags, metadata and per-activity contributions
+
+A save writes a whole new version before CURRENT is replaced by a rename, so readers
+and a crash mid-save always see a complete store, the previous or the new one. The
+previous version is kept for the readers that resolved CURRENT just before the switch.
+
+The score columns are loaded memory-mapped and any subset of dimension columns can be
+read on its own, so matrix_completion only pays for the scores and the index maps.
+synthesis.json and synthesis.csv are export targets produced from the store on demand.
+"""
+
+import fcntl
+import json
+import os
+import shutil
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, List, Optional
+import numpy as np
+from src.db.sparse_scores import SparseScoreMatrix
+from src.db.synthesis_utils import write_synthesis_csv, write_synthesis_json
+
+STUDENT_COLUMNS = ("name", "class", "group", "activities")
+EXERCISE_COLUMNS = ("super_id", "attributes")
+
+CURRENT = "CURRENT"
+_VERSION_PREFIX = "v"
+
+
+class SynthesisStore:
+    """
+    Read and write the columnar synthesis store in a directory.
+
+    Attributes:
+        path (str): Directory of the store.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        # Version dont viennent toutes les lectures d'un même appel (voir _read)
+        self._pinned_path: Optional[str] = None
+
+    def exists(self) -> bool:
+        return os.path.exists(os.path.join(self._current_path(), "synthesis.meta.json"))
+
+    def save(self, synthesis_data: Dict[str, Any], keep: int = 2) -> None:
+        """
+        Write a synthesis dictionary to the store as a new version.
+
+        The version is written in full in its own directory, then CURRENT is replaced
+        by a rename, so a crash mid-save leaves the previous version current.
+
+        Args:
+            synthesis_data (Dict[str, Any]): The synthesis.json structure.
+            keep (int): Versions kept, the new one included.
+        """
+        os.makedirs(self.path, exist_ok=True)
+        with self._lock():
+            versions = _versions(self.path)
+            number = int(versions[-1][len(_VERSION_PREFIX):]) + 1 if versions else 1
+            version = f"{_VERSION_PREFIX}{number:06d}"
+            tmp_path = os.path.join(self.path, f".{version}.tmp")
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            os.makedirs(tmp_path)
+            self._write_version(tmp_path, synthesis_data)
+            _fsync_dir(tmp_path)
+            os.replace(tmp_path, os.path.join(self.path, version))
+
+            pointer_tmp = os.path.join(self.path, f"{CURRENT}.tmp")
+            with open(pointer_tmp, "w", encoding="utf-8") as f:
+                f.write(version)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(pointer_tmp, os.path.join(self.path, CURRENT))
+            _fsync_dir(self.path)
+
+            for old_version in (versions + [version])[:-max(keep, 1)]:
+                shutil.rmtree(os.path.join(self.path, old_version), ignore_errors=True)
+            self._remove_unversioned()
+
+    def _write_version(self, tmp_path: str, synthesis_data: Dict[str, Any]) -> None:
+        """Write the columns of synthesis_data into a version directory"""
+        exercises = synthesis_data.get("exercises", {})
+        exercise_index = {exercise_id: j for j, exercise_id in enumerate(exercises)}
+        students = synthesis_data.get("students", {})
+
+        rows, cols, values, stats = [], [], [], []
+        for i, student_info in enumerate(students.values()):
+            student_stats = student_info.get("stats", {})
+            student_scores = sorted(
+                (exercise_index[exercise_id], score, student_stats.get(exercise_id, [1, score, score * score]))
+                for exercise_id, score in student_info.get("scores", {}).items()
+                if exercise_id in exercise_index and score is not None
+            )
+            rows.extend([i] * len(student_scores))
+            cols.extend(j for j, _, _ in student_scores)
+            values.extend(score for _, score, _ in student_scores)
+            stats.extend(cell for _, _, cell in student_scores)
+
+        stats = np.asarray(stats, dtype=np.float64).reshape(-1, 3)
+        np.save(os.path.join(tmp_path, "scores.student.npy"), np.asarray(rows, dtype=np.int32))
+        np.save(os.path.join(tmp_path, "scores.exercise.npy"), np.asarray(cols, dtype=np.int32))
+        np.save(os.path.join(tmp_path, "scores.value.npy"), np.asarray(values, dtype=np.float64))
+        np.save(os.path.join(tmp_path, "scores.count.npy"), stats[:, 0].astype(np.int32))
+        np.save(os.path.join(tmp_path, "scores.sum.npy"), stats[:, 1])
+        np.save(os.path.join(tmp_path, "scores.sumsq.npy"), stats[:, 2])
+
+        student_columns = {
+            "name": list(students),
+            "class": [info.get("class") for info in students.values()],
+            "group": [info.get("group") for info in students.values()],
+            "activities": [info.get("activities", []) for info in students.values()],
+        }
+        exercise_columns = {
+            "super_id": list(exercises),
+            "attributes": list(exercises.values()),
+        }
+        for table, columns in (("students", student_columns), ("exercises", exercise_columns)):
+            for column, column_values in columns.items():
+                _write_json(os.path.join(tmp_path, f"{table}.{column}.json"), column_values)
+
+        # Le fichier de métadonnées est écrit en dernier : il marque un store complet
+        _write_json(os.path.join(tmp_path, "synthesis.meta.json"), {
+            "tags": synthesis_data.get("tags", {}),
+            "metadata": synthesis_data.get("metadata", {}),
+            "contributions": synthesis_data.get("contributions", {}),
+        })
+
+    def _current_path(self) -> str:
+        """
+        Directory of the current version.
+
+        A store written before the versions keeps its files in the store directory
+        itself, or in <path>.old if a save was interrupted while it was swapped.
+        """
+        try:
+            with open(os.path.join(self.path, CURRENT), "r", encoding="utf-8") as f:
+                version = f.read().strip()
+        except FileNotFoundError:
+            version = ""
+        if version:
+            return os.path.join(self.path, version)
+        old_path = f"{self.path}.old"
+        if not os.path.exists(os.path.join(self.path, "synthesis.meta.json")) and os.path.isdir(old_path):
+            return old_path
+        return self.path
+
+    def _remove_unversioned(self) -> None:
+        """Remove the files of a store written before the versions, once a version is current"""
+        for entry in os.scandir(self.path):
+            if entry.is_file() and (entry.name.endswith(".npy") or entry.name.endswith(".json")):
+                os.remove(entry.path)
+        for leftover in (f"{self.path}.old", f"{self.path}.tmp"):
+            shutil.rmtree(leftover, ignore_errors=True)
+
+    @contextmanager
+    def _lock(self):
+        """Exclusive lock between writers, held while a version is chosen, written and pruned"""
+        with open(os.path.join(self.path, "store.lock"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read(self, read: Callable[["SynthesisStore"], Any]) -> Any:
+        """
+        Run read on this store pinned to its current version, so all its files come
+        from the same version. If a later save pruned that version meanwhile, read
+        again from the new current one.
+        """
+        if self._pinned_path is not None:
+            return read(self)
+        while True:
+            store = SynthesisStore(self.path)
+            store._pinned_path = self._current_path()
+            try:
+                return read(store)
+            except FileNotFoundError:
+                if store._pinned_path == self._current_path():
+                    raise
+
+    def load_scores(self, mmap: bool = True):
+        """
+        Long-format scores table.
+
+        Returns:
+            tuple: (student rows, exercise rows, values), memory-mapped read-only by default.
+        """
+        return self._read(lambda store: store._load_arrays(("student", "exercise", "value"), mmap))
+
+    def load_stats(self, mmap: bool = True):
+        """
+        Sufficient statistics of each score of the long-format table.
+
+        Returns:
+            tuple: (counts, sums, sums of squares), aligned with load_scores().
+        """
+        return self._read(lambda store: store._load_arrays(("count", "sum", "sumsq"), mmap))
+
+    def load_students(self, columns: Iterable[str] = STUDENT_COLUMNS) -> Dict[str, list]:
+        """Only the requested columns of the student dimension table"""
+        return self._read(lambda store: {
+            column: _read_json(os.path.join(store._pinned_path, f"students.{column}.json")) for column in columns
+        })
+
+    def load_exercises(self, columns: Iterable[str] = EXERCISE_COLUMNS) -> Dict[str, list]:
+        """Only the requested columns of the exercise dimension table"""
+        return self._read(lambda store: {
+            column: _read_json(os.path.join(store._pinned_path, f"exercises.{column}.json")) for column in columns
+        })
+
+    def load_meta(self) -> Dict[str, Any]:
+        return self._read(lambda store: _read_json(os.path.join(store._pinned_path, "synthesis.meta.json")))
+
+    def to_sparse(self) -> SparseScoreMatrix:
+        """Score matrix for matrix_completion, without reading the exercise attributes"""
+        return self._read(SynthesisStore._to_sparse)
+
+    def to_synthesis(self) -> Dict[str, Any]:
+        """Rebuild the nested synthesis dictionary (the synthesis.json structure)"""
+        return self._read(SynthesisStore._to_synthesis)
+
+    def _load_arrays(self, columns: Iterable[str], mmap: bool) -> tuple:
+        mmap_mode = "r" if mmap else None
+        return tuple(
+            np.load(os.path.join(self._pinned_path, f"scores.{column}.npy"), mmap_mode=mmap_mode)
+            for column in columns
+        )
+
+    def _to_sparse(self) -> SparseScoreMatrix:
+        rows, cols, values = self.load_scores()
+        students = self.load_students(("name", "class", "group"))
+        exercises = self.load_exercises(("super_id",))
+        return SparseScoreMatrix(rows, cols, values, students["name"], exercises["super_id"],
+                                 students["class"], students["group"])
+
+    def _to_synthesis(self) -> Dict[str, Any]:
+        meta = self.load_meta()
+        rows, cols, values = self.load_scores(mmap=False)
+        students = self.load_students()
+        exercises = self.load_exercises()
+
+        exercise_ids = exercises["super_id"]
+        synthesis_data = {
+            "tags": meta.get("tags", {}),
+            "exercises": dict(zip(exercise_ids, exercises["attributes"])),
+            "students": {},
+            "metadata": meta.get("metadata", {}),
+            "contributions": meta.get("contributions", {}),
+        }
+        counts, sums, squares = (column.tolist() for column in self.load_stats(mmap=False))
+        bounds = np.searchsorted(rows, np.arange(len(students["name"]) + 1)).tolist()
+        cols, values = cols.tolist(), values.tolist()
+        for i, name in enumerate(students["name"]):
+            start, stop = bounds[i], bounds[i + 1]
+            synthesis_data["students"][name] = {
+                "class": students["class"][i],
+                "group": students["group"][i],
+                "scores": {exercise_ids[j]: value for j, value in zip(cols[start:stop], values[start:stop])},
+                "activities": students["activities"][i],
+                "stats": {exercise_ids[j]: [count, total, total_squares] for j, count, total, total_squares
+                          in zip(cols[start:stop], counts[start:stop], sums[start:stop], squares[start:stop])},
+            }
+        return synthesis_data
+
+    def export_json(self, json_path: str, synthesis_data: Optional[Dict[str, Any]] = None) -> None:
+        """Write synthesis.json from the store"""
+        write_synthesis_json(synthesis_data or self.to_synthesis(), json_path)
+
+    def export_csv(self, csv_path: str, synthesis_data: Optional[Dict[str, Any]] = None) -> None:
+        """Write the wide synthesis.csv from the store"""
+        write_synthesis_csv(synthesis_data or self.to_synthesis(), csv_path)
+
+
+def _versions(path: str) -> List[str]:
+    return sorted(
+        name for name in os.listdir(path)
+        if name.startswith(_VERSION_PREFIX) and name[len(_VERSION_PREFIX):].isdigit()
+        and os.path.isdir(os.path.join(path, name))
+    )
+
+
+def _fsync_dir(path: str) -> None:
+    """Persist the entries of a directory (no-op where directories cannot be opened)"""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _write_json(path: str, data) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+
+
+def _read_json(path: str):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
@@ -0,0 +1,272 @@
+import json
+import csv
+import os
+from datetime import datetime
+
+
+def new_synthesis_data():
+    """Empty synthesis structure"""
+    return {
+        "tags": {},
+        "exercises": {},
+        "students": {},
+        "metadata": {
+            "created_at": datetime.now().isoformat(),
+            "updated_at": datetime.now().isoformat(),
+            "synthesized_activities": []
+        }
+    }
+
+
+def load_synthesis(synthesis_json):
+    """Load synthesis.json, or an empty synthesis if it does not exist yet"""
+    try:
+        with open(synthesis_json, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return new_synthesis_data()
+
+
+def merge_activity(synthesis_data, new_data, activity_name, force=False):
+    """
+    Merge the resultat.json data of an activity into the synthesis, in memory.
+
+    Every student x exercise cell and every exercise keeps sufficient statistics
+    [count, sum, sum of squares] of the scores merged into it, so a merge is an exact
+    O(1) update per cell whatever the merge order, and the variance comes for free.
+    The activity's own contribution is recorded, so merging an activity that was
+    already synthesized first retracts its previous contribution, then adds the new one.
+
+    An activity synthesized before the contributions were recorded (see
+    is_legacy_activity) cannot be retracted: it is skipped, unless force is set, in
+    which case its scores are added to the previous ones.
+
+    The global statistics are not recomputed here, call update_statistics once
+    all the activities have been merged.
+
+    :return: True si l'activité a été fusionnée, False si elle a été ignorée
+    """
+    _ensure_stats(synthesis_data)
+    contributions = synthesis_data.setdefault('contributions', {})
+    if activity_name in contributions:
+        retract_activity(synthesis_data, activity_name)
+    elif is_legacy_activity(synthesis_data, activity_name) and not force:
+        return False
+
+    contribution = {'exercises': {}, 'students': {}}
+    touched_exercises = set()
+
+    # Mettre à jour les exercices
+    for exercise_id, exercise_info in new_data['exercises'].items():
+        n = int(exercise_info.get('n') or 0)
+        contribution['exercises'][exercise_id] = {
+            'n': n,
+            'max_score': exercise_info.get('max_score'),
+            'min_score': exercise_info.get('min_score'),
+        }
+        if exercise_id not in synthesis_data['exercises']:
+            exercise = dict(exercise_info, n=0, activities=[], stats=[0, 0.0, 0.0])
+            synthesis_data['exercises'][exercise_id] = exercise
+        exercise = synthesis_data['exercises'][exercise_id]
+        exercise['n'] += n
+        if activity_name not in exercise['activities']:
+            exercise['activities'].append(activity_name)
+        touched_exercises.add(exercise_id)
+
+    # Mettre à jour les étudiants
+    for student, student_info in new_data['students'].items():
+        if student not in synthesis_data['students']:
+            synthesis_data['students'][student] = {
+                'class': student_info['class'],
+                'group': student_info['group'],
+                'scores': {},
+                'activities': [],
+                'stats': {},
+            }
+        synthesized_student = synthesis_data['students'][student]
+        if activity_name not in synthesized_student['activities']:
+            synthesized_student['activities'].append(activity_name)
+
+        contributed_scores = {}
+        for exercise_id, score in student_info['scores'].items():
+            if score is None or score != score or exercise_id not in synthesis_data['exercises']:
+                continue
+            cell = synthesized_student['stats'].setdefault(exercise_id, [0, 0.0, 0.0])
+            _add_observation(cell, score, 1)
+            synthesized_student['scores'][exercise_id] = cell[1] / cell[0]
+            _add_observation(synthesis_data['exercises'][exercise_id]['stats'], score, 1)
+            contributed_scores[exercise_id] = score
+        contribution['students'][student] = contributed_scores
+
+    contributions[activity_name] = contribution
+    for exercise_id in touched_exercises:
+        _refresh_exercise(synthesis_data, exercise_id)
+
+    synthesis_data['metadata']['updated_at'] = datetime.now().isoformat()
+    if activity_name not in synthesis_data['metadata']['synthesized_activities']:
+        synthesis_data['metadata']['synthesized_activities'].append(activity_name)
+    return True
+
+
+def is_legacy_activity(synthesis_data, activity_name):
+    """True if the activity was synthesized before the contributions were recorded"""
+    _ensure_stats(synthesis_data)
+    return activity_name in synthesis_data['metadata'].get('legacy_activities', [])
+
+
+def retract_activity(synthesis_data, activity_name):
+    """
+    Remove the contribution of a synthesized activity from the synthesis.
+
+    Each contributed score is subtracted from its cell and exercise statistics; cells,
+    exercises and students left without any score are removed. The scores of an
+    activity synthesized before the contributions were recorded stay, with its name.
+    """
+    _ensure_stats(synthesis_data)
+    contribution = synthesis_data.get('contributions', {}).pop(activity_name, None)
+    if contribution is None:
+        return
+    # Les scores antérieurs au suivi des contributions restent sous le nom de l'activité
+    legacy = is_legacy_activity(synthesis_data, activity_name)
+
+    for student, scores in contribution['students'].items():
+        synthesized_student = synthesis_data['students'].get(student)
+        if synthesized_student is None:
+            continue
+        for exercise_id, score in scores.items():
+            cell = synthesized_student['stats'].get(exercise_id)
+            if cell is not None:
+                _add_observation(cell, score, -1)
+                if cell[0] <= 0:
+                    del synthesized_student['stats'][exercise_id]
+                    synthesized_student['scores'].pop(exercise_id, None)
+                else:
+                    synthesized_student['scores'][exercise_id] = cell[1] / cell[0]
+            if exercise_id in synthesis_data['exercises']:
+                _add_observation(synthesis_data['exercises'][exercise_id]['stats'], score, -1)
+        if not legacy and activity_name in synthesized_student['activities']:
+            synthesized_student['activities'].remove(activity_name)
+        if not synthesized_student['activities'] and not synthesized_student['stats']:
+            del synthesis_data['students'][student]
+
+    for exercise_id, exercise_contribution in contribution['exercises'].items():
+        exercise = synthesis_data['exercises'].get(exercise_id)
+        if exercise is None:
+            continue
+        exercise['n'] -= exercise_contribution['n']
+        if not legacy and activity_name in exercise['activities']:
+            exercise['activities'].remove(activity_name)
+        if not exercise['activities'] and exercise['stats'][0] <= 0:
+            del synthesis_data['exercises'][exercise_id]
+        else:
+            _refresh_exercise(synthesis_data, exercise_id)
+
+    if not legacy and activity_name in synthesis_data['metadata']['synthesized_activities']:
+        synthesis_data['metadata']['synthesized_activities'].remove(activity_name)
+
+
+def score_variance(stats):
+    """Population variance of the scores summarized by [count, sum, sum of squares]"""
+    count, total, total_squares = stats
+    if count <= 0:
+        return None
+    mean = total / count
+    return max(total_squares / count - mean * mean, 0.0)
+
+
+def _add_observation(stats, score, weight):
+    """Add (weight=1) or remove (weight=-1) a score from [count, sum, sum of squares]"""
+    stats[0] += weight
+    stats[1] += weight * score
+    stats[2] += weight * score * score
+    if stats[0] <= 0:
+        stats[:] = [0, 0.0, 0.0]
+
+
+def _refresh_exercise(synthesis_data, exercise_id):
+    """Derive the exercise's average, variance, max and min from its statistics and contributions"""
+    exercise = synthesis_data['exercises'][exercise_id]
+    count, total, _ = exercise['stats']
+    exercise['average_score'] = total / count if count else None
+    exercise['variance'] = score_variance(exercise['stats'])
+    per_activity = [
+        contribution['exercises'][exercise_id]
+        for contribution in synthesis_data.get('contributions', {}).values()
+        if exercise_id in contribution['exercises']
+    ]
+    maxima = [c['max_score'] for c in per_activity if c['max_score'] is not None]
+    minima = [c['min_score'] for c in per_activity if c['min_score'] is not None]
+    if maxima:
+        exercise['max_score'] = max(maxima)
+    if minima:
+        exercise['min_score'] = min(minima)
+
+
+def _ensure_stats(synthesis_data):
+    """
+    Give a synthesis built before the statistics layer its statistics: each existing
+    score counts as one observation. Activities merged before have no recorded
+    contribution and cannot be retracted; they are listed in the metadata as
+    legacy_activities.
+    """
+    if 'contributions' in synthesis_data:
+        return
+    synthesis_data['contributions'] = {}
+    synthesis_data['metadata']['legacy_activities'] = list(dict.fromkeys(
+        synthesis_data['metadata']['synthesized_activities']))
+    for exercise in synthesis_data['exercises'].values():
+        exercise['stats'] = [0, 0.0, 0.0]
+    for student_info in synthesis_data['students'].values():
+        student_info['stats'] = {}
+        for exercise_id, score in student_info['scores'].items():
+            student_info['stats'][exercise_id] = [1, score, score * score]
+            if exercise_id in synthesis_data['exercises']:
+                _add_observation(synthesis_data['exercises'][exercise_id]['stats'], score, 1)
+
+
+def update_statistics(synthesis_data):
+    """Recompute the global statistics stored in the synthesis metadata"""
+    # Calculer la somme de tous les "n" des exercices
+    total_n = sum(exercise['n'] for exercise in synthesis_data['exercises'].values())
+    synthesis_data['metadata']['total_n'] = total_n
+
+    # Calculer des statistiques globales
+    total_exercises = len(synthesis_data['exercises'])
+    total_students = len(synthesis_data['students'])
+    averages = [ex['average_score'] for ex in synthesis_data['exercises'].values() if ex['average_score'] is not None]
+    average_score_all_exercises = sum(averages) / len(averages) if averages else None
+
+    synthesis_data['metadata']['statistics'] = {
+        'total_exercises': total_exercises,
+        'total_students': total_students,
+        'average_score_all_exercises': average_score_all_exercises,
+        'total_n': total_n
+    }
+
+
+def write_synthesis_json(synthesis_data, synthesis_json, indent=2):
+    """
+    Save the synthesis as JSON.
+
+    The file is written next to the target, flushed to disk and renamed over it, so
+    a crash mid-write leaves the previous version intact.
+    """
+    tmp_path = f"{synthesis_json}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(synthesis_data, f, indent=indent)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, synthesis_json)
+
+
+def write_synthesis_csv(synthesis_data, synthesis_csv):
+    """Save the synthesis as a wide CSV: one row per student, one column per exercise"""
+    exercise_ids = list(synthesis_data['exercises'].keys())
+    headers = ['Élève', 'Classe', 'Groupe'] + exercise_ids
+    with open(synthesis_csv, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(headers)
+        for student, student_info in synthesis_data['students'].items():
+            scores = student_info['scores']
+            writer.writerow([student, student_info['class'], student_info['group']]
+                            + [scores.get(exercise_id, '') for exercise_id in exercise_ids])
@@ -0,0 +1,303 @@
+"""
+Low-Rank Factor Model Module
+
+This module keeps the student and exercise factors learned by ALS on disk so that
+students and exercises added by a new activity can be served without recomputing
+the whole factorization:
+
+- new students are projected onto the existing exercise factors (and new exercises
+  onto the student factors) by a ridge solve over their observed scores only;
+- a few partial ALS sweeps refine the rows and columns whose scores changed;
+- the RMSE on a set of held-out scores is compared with the one measured at the
+  last full fit, and a full recompute only happens when it drifted too far.
+
+Classes:
+    LowRankModel: Persisted factors with fit, fold-in update and prediction.
+
+Functions:
+    main: Entry point of the script.
+"""
+
+import os
+import sys
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+import numpy as np
+from src.config import Config
+from src.db.sparse_scores import SparseScoreMatrix
+from src.matrix_completion import _als_factors, _als_solve_block
+
+
+@dataclass(eq=False)
+class LowRankModel:
+    """
+    Student/exercise factors of a completed score matrix.
+
+    Attributes:
+        student_factors (np.ndarray): One row of factors per student.
+        exercise_factors (np.ndarray): One row of factors per exercise.
+        mean (float): Global mean the factors are centered on.
+        students (List[str]): Student name of each factor row.
+        exercises (List[str]): Exercise super_id of each factor row.
+        student_counts (np.ndarray): Observed scores per student when last fitted.
+        exercise_counts (np.ndarray): Observed scores per exercise when last fitted.
+        student_sums (np.ndarray): Sum and sum of squares of each student's scores when last fitted.
+        exercise_sums (np.ndarray): Sum and sum of squares of each exercise's scores when last fitted.
+        held_out_students (np.ndarray): Student of each held-out score.
+        held_out_exercises (np.ndarray): Exercise of each held-out score.
+        held_out_values (np.ndarray): Held-out scores, never used for fitting.
+        baseline_rmse (float): Held-out RMSE measured at the last full fit.
+        reg (float): L2 regularization of the ALS solves.
+    """
+
+    student_factors: np.ndarray
+    exercise_factors: np.ndarray
+    mean: float
+    students: List[str]
+    exercises: List[str]
+    student_counts: np.ndarray
+    exercise_counts: np.ndarray
+    held_out_students: np.ndarray
+    held_out_exercises: np.ndarray
+    held_out_values: np.ndarray
+    baseline_rmse: float
+    reg: float = 0.1
+    student_sums: Optional[np.ndarray] = None
+    exercise_sums: Optional[np.ndarray] = None
+
+    def __post_init__(self):
+        # Modèles enregistrés sans les sommes : toutes les lignes passent pour modifiées
+        if self.student_sums is None:
+            self.student_sums = np.full((len(self.students), 2), np.nan)
+        if self.exercise_sums is None:
+            self.exercise_sums = np.full((len(self.exercises), 2), np.nan)
+
+    @property
+    def rank(self) -> int:
+        return self.exercise_factors.shape[1]
+
+    @classmethod
+    def fit(cls, scores: SparseScoreMatrix, rank: int, reg: float = 0.1, held_out_fraction: float = 0.05,
+            seed: int = 0, **als_kwargs) -> "LowRankModel":
+        """
+        Full factorization of the observed scores, minus a held-out sample kept to measure drift.
+        """
+        rank = max(1, min(rank, min(scores.shape)))
+        train, held_out = scores.split(held_out_fraction, seed=seed)
+        student_factors, exercise_factors, mean = _als_factors(train, rank, reg=reg, random_state=seed,
+                                                               **als_kwargs)
+        model = cls(
+            student_factors=student_factors,
+            exercise_factors=exercise_factors,
+            mean=mean,
+            students=list(scores.students),
+            exercises=list(scores.exercises),
+            student_counts=np.bincount(train.rows, minlength=train.shape[0]),
+            exercise_counts=np.bincount(train.cols, minlength=train.shape[1]),
+            student_sums=_score_sums(train.rows, train.values, train.shape[0]),
+            exercise_sums=_score_sums(train.cols, train.values, train.shape[1]),
+            held_out_students=np.array([scores.students[i] for i in held_out.rows], dtype=object),
+            held_out_exercises=np.array([scores.exercises[j] for j in held_out.cols], dtype=object),
+            held_out_values=held_out.values,
+            baseline_rmse=float("nan"),
+            reg=reg,
+        )
+        model.baseline_rmse = model.held_out_rmse()
+        return model
+
+    def update(self, scores: SparseScoreMatrix, drift_threshold: float = 1.2, refit_sweeps: int = 2,
+               **als_kwargs) -> Tuple["LowRankModel", str]:
+        """
+        Bring the model up to date with a newer version of the observed scores.
+
+        Rows and columns follow the order of scores. New students and exercises are
+        folded in, the rows and columns whose observed scores changed are refitted
+        with a few partial ALS sweeps, and the whole factorization is recomputed only
+        if the held-out RMSE exceeds drift_threshold times the baseline.
+
+        Returns:
+            Tuple[LowRankModel, str]: The updated model and "unchanged", "fold_in" or "full_refit".
+        """
+        student_position = {student: i for i, student in enumerate(self.students)}
+        exercise_position = {exercise: j for j, exercise in enumerate(self.exercises)}
+        old_rows = np.array([student_position.get(s, -1) for s in scores.students], dtype=np.intp)
+        old_cols = np.array([exercise_position.get(e, -1) for e in scores.exercises], dtype=np.intp)
+
+        held_out_selection = self._held_out_selection(scores)
+        train = scores.subset(~held_out_selection)
+        # Les scores réservés suivent aussi les corrections, pour mesurer la dérive sur les valeurs actuelles
+        held_out = scores.subset(held_out_selection)
+        current = {(scores.students[i], scores.exercises[j]): value
+                   for i, j, value in zip(held_out.rows, held_out.cols, held_out.values.tolist())}
+        held_out_values = np.array([
+            current.get(pair, value)
+            for pair, value in zip(zip(self.held_out_students, self.held_out_exercises), self.held_out_values.tolist())
+        ], dtype=np.float64)
+        student_counts = np.bincount(train.rows, minlength=train.shape[0])
+        exercise_counts = np.bincount(train.cols, minlength=train.shape[1])
+        student_sums = _score_sums(train.rows, train.values, train.shape[0])
+        exercise_sums = _score_sums(train.cols, train.values, train.shape[1])
+        # Une activité corrigée puis refusionnée change les valeurs sans changer les effectifs
+        changed_rows = np.flatnonzero(
+            (old_rows < 0) | (student_counts != self.student_counts[old_rows])
+            | ~_same_sums(student_sums, self.student_sums[old_rows])
+        )
+        changed_cols = np.flatnonzero(
+            (old_cols < 0) | (exercise_counts != self.exercise_counts[old_cols])
+            | ~_same_sums(exercise_sums, self.exercise_sums[old_cols])
+        )
+
+        student_factors = np.where((old_rows >= 0)[:, np.newaxis], self.student_factors[old_rows], 0.0)
+        exercise_factors = np.where((old_cols >= 0)[:, np.newaxis], self.exercise_factors[old_cols], 0.0)
+        model = LowRankModel(
+            student_factors=student_factors,
+            exercise_factors=exercise_factors,
+            mean=self.mean,
+            students=list(scores.students),
+            exercises=list(scores.exercises),
+            student_counts=student_counts,
+            exercise_counts=exercise_counts,
+            student_sums=student_sums,
+            exercise_sums=exercise_sums,
+            held_out_students=self.held_out_students,
+            held_out_exercises=self.held_out_exercises,
+            held_out_values=held_out_values,
+            baseline_rmse=self.baseline_rmse,
+            reg=self.reg,
+        )
+        if changed_rows.size == 0 and changed_cols.size == 0:
+            return model, "unchanged"
+
+        # Projection des nouvelles lignes sur les facteurs exercices existants, puis
+        # des nouvelles colonnes, puis quelques passes partielles sur ce qui a changé
+        centered = train.values - self.mean
+        row_view = (train.indptr, train.cols, centered)
+        col_order = np.argsort(train.cols, kind="stable")
+        col_ptr = np.concatenate(([0], np.cumsum(exercise_counts)))
+        col_view = (col_ptr, train.rows[col_order], centered[col_order])
+        for _ in range(max(1, refit_sweeps)):
+            model.student_factors[changed_rows] = _solve_selected(row_view, changed_rows,
+                                                                  model.exercise_factors, self.reg)
+            model.exercise_factors[changed_cols] = _solve_selected(col_view, changed_cols,
+                                                                   model.student_factors, self.reg)
+
+        rmse = model.held_out_rmse()
+        if np.isfinite(self.baseline_rmse) and rmse > drift_threshold * self.baseline_rmse:
+            return LowRankModel.fit(scores, self.rank, reg=self.reg, **als_kwargs), "full_refit"
+        return model, "fold_in"
+
+    def predict(self) -> np.ndarray:
+        """Dense students x exercises matrix of predicted scores"""
+        completed = self.student_factors @ self.exercise_factors.T
+        completed += self.mean
+        return completed
+
+    def held_out_rmse(self) -> float:
+        """RMSE of the model on the held-out scores of known students and exercises"""
+        student_position = {student: i for i, student in enumerate(self.students)}
+        exercise_position = {exercise: j for j, exercise in enumerate(self.exercises)}
+        rows = np.array([student_position.get(s, -1) for s in self.held_out_students], dtype=np.intp)
+        cols = np.array([exercise_position.get(e, -1) for e in self.held_out_exercises], dtype=np.intp)
+        known = (rows >= 0) & (cols >= 0)
+        if not known.any():
+            return float("nan")
+        predictions = np.einsum("ij,ij->i", self.student_factors[rows[known]],
+                                self.exercise_factors[cols[known]]) + self.mean
+        return float(np.sqrt(np.mean((predictions - self.held_out_values[known]) ** 2)))
+
+    def save(self, path: str) -> None:
+        """Save the model to an .npz file (written to a temporary file, then renamed)"""
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(
+            tmp_path,
+            student_factors=self.student_factors,
+            exercise_factors=self.exercise_factors,
+            mean=self.mean,
+            students=np.array(self.students, dtype=str),
+            exercises=np.array(self.exercises, dtype=str),
+            student_counts=self.student_counts,
+            exercise_counts=self.exercise_counts,
+            student_sums=self.student_sums,
+            exercise_sums=self.exercise_sums,
+            held_out_students=self.held_out_students.astype(str),
+            held_out_exercises=self.held_out_exercises.astype(str),
+            held_out_values=self.held_out_values,
+            baseline_rmse=self.baseline_rmse,
+            reg=self.reg,
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "LowRankModel":
+        """Load a model saved with save"""
+        with np.load(path) as data:
+            return cls(
+                student_factors=data["student_factors"],
+                exercise_factors=data["exercise_factors"],
+                mean=float(data["mean"]),
+                students=data["students"].tolist(),
+                exercises=data["exercises"].tolist(),
+                student_counts=data["student_counts"],
+                exercise_counts=data["exercise_counts"],
+                held_out_students=data["held_out_students"].astype(object),
+                held_out_exercises=data["held_out_exercises"].astype(object),
+                held_out_values=data["held_out_values"],
+                baseline_rmse=float(data["baseline_rmse"]),
+                reg=float(data["reg"]),
+                student_sums=data["student_sums"] if "student_sums" in data.files else None,
+                exercise_sums=data["exercise_sums"] if "exercise_sums" in data.files else None,
+            )
+
+    def _held_out_selection(self, scores: SparseScoreMatrix) -> np.ndarray:
+        """Boolean selection of the observed scores that belong to the held-out sample"""
+        held_out = set(zip(self.held_out_students, self.held_out_exercises))
+        if not held_out:
+            return np.zeros(scores.nnz, dtype=bool)
+        return np.fromiter(
+            ((scores.students[i], scores.exercises[j]) in held_out for i, j in zip(scores.rows, scores.cols)),
+            dtype=bool, count=scores.nnz,
+        )
+
+
+def _score_sums(indices: np.ndarray, values: np.ndarray, n: int) -> np.ndarray:
+    """Sum and sum of squares of the scores of each row (or column), as an n x 2 array"""
+    return np.column_stack((np.bincount(indices, weights=values, minlength=n),
+                            np.bincount(indices, weights=values * values, minlength=n)))
+
+
+def _same_sums(sums: np.ndarray, previous: np.ndarray) -> np.ndarray:
+    """Rows whose sums match the previous ones, up to the order of the additions"""
+    return np.isclose(sums, previous, rtol=1e-9, atol=1e-12).all(axis=1)
+
+
+def _solve_selected(view, selected: np.ndarray, fixed: np.ndarray, reg: float) -> np.ndarray:
+    """Ridge solve of the selected rows of a CSR (or CSC) view against fixed factors"""
+    indptr, indices, values = view
+    starts, stops = indptr[selected], indptr[selected + 1]
+    sub_indptr = np.concatenate(([0], np.cumsum(stops - starts)))
+    take = np.concatenate([np.arange(a, b) for a, b in zip(starts, stops)]) if selected.size else np.array([], int)
+    return _als_solve_block(sub_indptr, indices[take], values[take], fixed, reg)
+
+
+def main():
+    """
+    Update the persisted factor model with the current synthesis (fit it if missing).
+    """
+    config = Config()
+    synthesis_dir = os.path.join(config.data_dir, config.synthesis_data_dir)
+    model_path = os.path.join(synthesis_dir, config.factor_model_filename)
+    rank = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+
+    scores = SparseScoreMatrix.from_config(config)
+    if os.path.exists(model_path):
+        model, action = LowRankModel.load(model_path).update(scores)
+    else:
+        model, action = LowRankModel.fit(scores, rank), "full_fit"
+
+    model.save(model_path)
+    print(f"Modèle {action} : {len(model.students)} élèves, {len(model.exercises)} exercices, "
+          f"RMSE hors échantillon {model.held_out_rmse():.4f} (référence {model.baseline_rmse:.4f})")
+
+
+if __name__ == "__main__":
+    main()
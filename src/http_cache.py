@@ -0,0 +1,214 @@
+"""
+HTTP Cache Module
+
+This module provides a small HTTP client for the remote MathALEA catalogs. It keeps
+one requests.Session for all the downloads, with a connection pool sized for
+concurrent requests from several threads, applies a timeout to every request and
+stores each response body on disk with its ETag and Last-Modified headers. The next
+request for the same URL is sent with If-None-Match / If-Modified-Since, so an
+unchanged catalog costs a 304 instead of a full download. When the server cannot be
+reached, the cached body is served instead.
+
+    http_cache/
+        <key>.body          last body received for the URL
+        <key>.meta.json     URL, ETag, Last-Modified and download date
+
+Classes:
+    CachedResponse: Body of a response and where it came from.
+    CachedHttpClient: HTTP client with a persistent session and an on-disk cache.
+"""
+
+import hashlib
+import json
+import logging
+import os
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, Optional
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+FETCHED = "fetched"
+NOT_MODIFIED = "not_modified"
+OFFLINE = "offline"
+
+
+@dataclass
+class CachedResponse:
+    """
+    Body of a response served by CachedHttpClient.
+
+    Attributes:
+        url (str): Requested URL.
+        path (str): Cached body file.
+        status (str): FETCHED (new body downloaded), NOT_MODIFIED (304, cached body)
+            or OFFLINE (server unreachable, cached body).
+    """
+    url: str
+    path: str
+    status: str
+
+    @property
+    def content(self) -> bytes:
+        with open(self.path, "rb") as f:
+            return f.read()
+
+    def json(self) -> Any:
+        with open(self.path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+
+class CachedHttpClient:
+    """
+    HTTP client with a persistent session, conditional requests and an on-disk cache.
+
+    Attributes:
+        cache_dir (str): Directory of the cached bodies and their headers.
+        timeout (float): Timeout of each request, in seconds.
+        session (requests.Session): Session reused by every request.
+    """
+
+    def __init__(self, cache_dir: str, timeout: float = 30.0, session: Optional[requests.Session] = None,
+                 pool_size: int = 4):
+        """
+        Initialize the client.
+
+        Args:
+            cache_dir (str): Directory of the cache, created if needed.
+            timeout (float): Timeout of each request, in seconds.
+            session (requests.Session, optional): Session to use instead of a new one.
+            pool_size (int): Connections kept open per host, for concurrent requests.
+        """
+        self.cache_dir = cache_dir
+        self.timeout = timeout
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+        self.session = session
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def close(self) -> None:
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def get(self, url: str) -> CachedResponse:
+        """
+        Get a URL, revalidating the cached copy when there is one.
+
+        Args:
+            url (str): URL to download.
+
+        Returns:
+            CachedResponse: The cached body, refreshed if the server sent a new one.
+
+        Raises:
+            requests.RequestException: If the request fails and nothing is cached for the URL.
+        """
+        body_path, meta_path = self._paths(url)
+        meta = self._load_meta(meta_path) if os.path.exists(body_path) else None
+
+        headers = {}
+        if meta is not None:
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+
+        try:
+            # Fermée dans tous les cas, y compris en erreur : sa connexion retourne au pool
+            with self.session.get(url, headers=headers, timeout=self.timeout, stream=True) as response:
+                if response.status_code == 304:
+                    if meta is None:
+                        # Rien en cache à réutiliser : la requête n'était pas conditionnelle
+                        raise requests.HTTPError(f"304 Not Modified without a cached copy: {url}",
+                                                 response=response)
+                    logger.info(f"Not modified, using cached copy: {url}")
+                    return CachedResponse(url, body_path, NOT_MODIFIED)
+                response.raise_for_status()
+                self._store(response, body_path, meta_path)
+        except requests.RequestException as e:
+            if meta is None:
+                raise
+            logger.warning(f"Could not reach {url} ({e}), using cached copy from {meta.get('fetched_at')}")
+            return CachedResponse(url, body_path, OFFLINE)
+
+        logger.info(f"Downloaded {url}")
+        return CachedResponse(url, body_path, FETCHED)
+
+    def get_json(self, url: str) -> Any:
+        """Decoded JSON body of a URL (see get)"""
+        return self.get(url).json()
+
+    def is_fresh(self, url: str) -> Optional[bool]:
+        """
+        Whether the cached copy of a URL is still the server's, without downloading it.
+
+        A conditional HEAD request is sent with the cached validators.
+
+        Returns:
+            Optional[bool]: True if the server answers 304 (or the same ETag), False if
+            the resource changed or nothing is cached, None if the server cannot be reached.
+        """
+        body_path, meta_path = self._paths(url)
+        meta = self._load_meta(meta_path) if os.path.exists(body_path) else None
+        if meta is None:
+            return False
+
+        headers = {}
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+        if not headers:
+            return False
+        try:
+            response = self.session.head(url, headers=headers, timeout=self.timeout, allow_redirects=True)
+        except requests.RequestException as e:
+            logger.warning(f"Could not reach {url} ({e})")
+            return None
+        if response.status_code == 304:
+            return True
+        if not response.ok:
+            return None
+        etag = response.headers.get("ETag")
+        return etag is not None and etag == meta.get("etag")
+
+    def _paths(self, url: str):
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()[:24]
+        return os.path.join(self.cache_dir, f"{key}.body"), os.path.join(self.cache_dir, f"{key}.meta.json")
+
+    @staticmethod
+    def _load_meta(meta_path: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    @staticmethod
+    def _store(response: requests.Response, body_path: str, meta_path: str) -> None:
+        """Stream the body to the cache, then record its validators; both files are replaced atomically"""
+        tmp_path = f"{body_path}.tmp"
+        with response, open(tmp_path, "wb") as f:
+            for chunk in response.iter_content(chunk_size=1 << 16):
+                f.write(chunk)
+        os.replace(tmp_path, body_path)
+
+        meta = {
+            "url": response.url,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "fetched_at": datetime.now().isoformat(),
+        }
+        with open(f"{meta_path}.tmp", "w", encoding="utf-8") as f:
+            json.dump(meta, f, indent=2)
+        os.replace(f"{meta_path}.tmp", meta_path)
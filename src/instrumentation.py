@@ -0,0 +1,282 @@
+"""
+Instrumentation Module
+
+This module times the stages of a pipeline run (loading res.csv, joining the roster,
+normalizing, exporting, merging into the synthesis...) and collects them in a
+structured run report: wall time, rows and columns processed and, when memory
+tracking is on, the peak of traced memory of each stage. Any stage can also be run
+under cProfile, its statistics dumped to a .prof file readable with pstats.
+
+Code only declares its stages with the module-level stage() context manager. They
+are recorded in the report activated by the caller, or just logged at DEBUG level
+when no report is active. Work submitted to other threads through
+submit_in_context records its stages in the same report, nested under the stage
+that submitted it; memory is only tracked on the thread that created the report.
+
+Classes:
+    StageRecord: Measurements of one stage.
+    ReportOptions: What a run report records (picklable, for worker processes).
+    RunReport: Stages of one run and their measurements.
+
+Functions:
+    activate: Make a report the one stages are recorded in.
+    stage: Measure a stage in the active report.
+    submit_in_context: Submit a function to an executor within the active report.
+    add_instrumentation_arguments: Add the logging and report options to a command.
+    report_options_from_args: ReportOptions requested on the command line, or None.
+"""
+
+import argparse
+import cProfile
+import json
+import logging
+import os
+import threading
+import time
+import tracemalloc
+from concurrent.futures import Executor, Future
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+ALL_STAGES = "all"
+
+
+@dataclass
+class StageRecord:
+    """
+    Measurements of one stage.
+
+    Attributes:
+        name (str): Stage name.
+        seconds (float): Wall time.
+        rows (int, optional): Rows processed, set by the stage.
+        cols (int, optional): Columns processed, set by the stage.
+        peak_memory_bytes (int, optional): Peak of traced memory, when memory tracking is on.
+        profile_path (str, optional): cProfile statistics, when the stage is profiled.
+        depth (int): Nesting level, 0 for a stage not run inside another one.
+    """
+    name: str
+    seconds: float = 0.0
+    rows: Optional[int] = None
+    cols: Optional[int] = None
+    peak_memory_bytes: Optional[int] = None
+    profile_path: Optional[str] = None
+    depth: int = 0
+
+    def set_shape(self, shape) -> None:
+        """Record the (rows, columns) of a DataFrame or array"""
+        self.rows, self.cols = (list(shape) + [None])[:2]
+
+
+@dataclass
+class ReportOptions:
+    """
+    What a run report records.
+
+    Attributes:
+        track_memory (bool): Measure the peak memory of each stage with tracemalloc.
+        profile_stages (List[str]): Stages run under cProfile ("all" for every stage).
+    """
+    track_memory: bool = True
+    profile_stages: List[str] = field(default_factory=list)
+
+    def new_report(self, name: str, profile_dir: Optional[str] = None) -> "RunReport":
+        return RunReport(name, self.track_memory, self.profile_stages, profile_dir)
+
+
+class RunReport:
+    """
+    Stages of one run and their measurements.
+
+    Attributes:
+        name (str): Run name (e.g. the activity).
+        started_at (str): Start date of the run.
+        stages (List[StageRecord]): Measured stages, in completion order.
+    """
+
+    def __init__(self, name: str, track_memory: bool = False, profile_stages: Iterable[str] = (),
+                 profile_dir: Optional[str] = None):
+        """
+        Initialize an empty report.
+
+        Args:
+            name (str): Run name.
+            track_memory (bool): Measure peak memory with tracemalloc (slows allocations down).
+            profile_stages (Iterable[str]): Stages run under cProfile ("all" for every stage).
+            profile_dir (str, optional): Directory of the .prof files (default: current directory).
+        """
+        self.name = name
+        self.started_at = datetime.now().isoformat()
+        self.track_memory = track_memory
+        self.profile_stages = set(profile_stages)
+        self.profile_dir = profile_dir or "."
+        self.stages: List[StageRecord] = []
+        # Pic mémoire courant de chaque étape ouverte, pour les étapes imbriquées
+        self._open_peaks: List[int] = []
+        # Niveau d'imbrication propre au contexte, hérité par submit_in_context
+        self._depth: ContextVar[int] = ContextVar(f"depth_{id(self)}", default=0)
+        self._profiling = False
+        self._thread_id = threading.get_ident()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str, rows: Optional[int] = None, cols: Optional[int] = None) -> Iterator[StageRecord]:
+        """
+        Measure the enclosed block as a stage of this report.
+
+        Yields:
+            StageRecord: The record, whose rows and cols the block can set.
+        """
+        record = StageRecord(name, rows=rows, cols=cols, depth=self._depth.get())
+        depth_token = self._depth.set(record.depth + 1)
+        # tracemalloc mesure tout le processus : seul le thread du rapport s'en sert
+        tracing = self.track_memory and tracemalloc.is_tracing() and threading.get_ident() == self._thread_id
+        if tracing:
+            if self._open_peaks:
+                self._open_peaks[-1] = max(self._open_peaks[-1], tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+            self._open_peaks.append(0)
+
+        profiler = None
+        if name in self.profile_stages or ALL_STAGES in self.profile_stages:
+            with self._lock:
+                if not self._profiling:
+                    profiler = cProfile.Profile()
+                    self._profiling = True
+            if profiler is not None:
+                profiler.enable()
+
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record.seconds = time.perf_counter() - start
+            self._depth.reset(depth_token)
+            if profiler is not None:
+                profiler.disable()
+                self._profiling = False
+                os.makedirs(self.profile_dir, exist_ok=True)
+                record.profile_path = os.path.join(self.profile_dir, f"{self.name}.{name}.prof")
+                profiler.dump_stats(record.profile_path)
+            if tracing:
+                record.peak_memory_bytes = max(self._open_peaks.pop(), tracemalloc.get_traced_memory()[1])
+                if self._open_peaks:
+                    self._open_peaks[-1] = max(self._open_peaks[-1], record.peak_memory_bytes)
+                tracemalloc.reset_peak()
+            with self._lock:
+                self.stages.append(record)
+            logger.debug(f"Stage {name}: {record.seconds:.3f}s")
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "started_at": self.started_at,
+            "total_seconds": sum(record.seconds for record in self.stages if record.depth == 0),
+            "stages": [asdict(record) for record in self.stages],
+        }
+
+    def write(self, path: str) -> None:
+        """Save the report as JSON"""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=2)
+        os.replace(tmp_path, path)
+
+    def summary(self) -> str:
+        """One line per stage"""
+        lines = [f"Run report {self.name}:"]
+        for record in self.stages:
+            line = f"  {'  ' * record.depth}{record.name:<16} {record.seconds:8.3f}s"
+            if record.rows is not None:
+                line += f"  {record.rows} x {record.cols if record.cols is not None else '-'}"
+            if record.peak_memory_bytes is not None:
+                line += f"  peak {record.peak_memory_bytes / 1e6:.1f} MB"
+            if record.profile_path:
+                line += f"  profile {record.profile_path}"
+            lines.append(line)
+        return "\n".join(lines)
+
+
+_active_report: ContextVar[Optional[RunReport]] = ContextVar("active_report", default=None)
+
+
+@contextmanager
+def activate(report: Optional[RunReport]) -> Iterator[Optional[RunReport]]:
+    """
+    Record the stages run in the enclosed block in report (no-op for None).
+
+    Memory tracking starts here when the report asks for it and tracemalloc is not
+    already running, and stops at the end of the block.
+    """
+    if report is None:
+        yield None
+        return
+    token = _active_report.set(report)
+    started_tracing = report.track_memory and not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    try:
+        yield report
+    finally:
+        if started_tracing:
+            tracemalloc.stop()
+        _active_report.reset(token)
+
+
+@contextmanager
+def stage(name: str, rows: Optional[int] = None, cols: Optional[int] = None) -> Iterator[StageRecord]:
+    """
+    Measure the enclosed block as a stage of the active report.
+
+    Without an active report the wall time is only logged at DEBUG level.
+
+    Yields:
+        StageRecord: The record, whose rows and cols the block can set.
+    """
+    report = _active_report.get()
+    if report is not None:
+        with report.stage(name, rows, cols) as record:
+            yield record
+        return
+
+    record = StageRecord(name, rows=rows, cols=cols)
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record.seconds = time.perf_counter() - start
+        logger.debug(f"Stage {name}: {record.seconds:.3f}s")
+
+
+def submit_in_context(executor: Executor, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Future:
+    """
+    Submit fn to an executor, its stages recorded in the active report.
+
+    The stages run in the worker are nested under the stage open at submission.
+    """
+    return executor.submit(copy_context().run, fn, *args, **kwargs)
+
+
+def add_instrumentation_arguments(parser: argparse.ArgumentParser) -> None:
+    """Add --log-level, --report, --profile and --no-memory to a command"""
+    parser.add_argument("--log-level", default="WARNING", choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+                        help="Verbosity of the progress messages (default: WARNING)")
+    parser.add_argument("--report", action="store_true",
+                        help="Measure each stage (time, rows/columns, peak memory) and save a run report")
+    parser.add_argument("--profile", default="", metavar="STAGE[,STAGE]",
+                        help=f"Run these stages under cProfile ('{ALL_STAGES}' for every stage); implies --report")
+    parser.add_argument("--no-memory", action="store_true",
+                        help="Do not measure peak memory in the run report (tracemalloc slows allocations down)")
+
+
+def report_options_from_args(args: argparse.Namespace) -> Optional[ReportOptions]:
+    """ReportOptions requested by the options of add_instrumentation_arguments, or None"""
+    profile_stages = [name for name in args.profile.split(",") if name]
+    if not args.report and not profile_stages:
+        return None
+    return ReportOptions(track_memory=not args.no_memory, profile_stages=profile_stages)
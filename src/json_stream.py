@@ -0,0 +1,253 @@
+"""
+JSON Stream Module
+
+This module parses JSON incrementally from a file object, chunk by chunk, as a
+stream of events, so a large document such as allExercice.json never has to be held
+in memory as a whole:
+
+    ("start_map", None), ("map_key", key), ("end_map", None),
+    ("start_array", None), ("end_array", None), ("value", scalar)
+
+Functions:
+    iter_events: Parse a JSON file object into events.
+    build_value: Rebuild the value whose first event has just been read.
+    iter_ref_records: Yield the ref-keyed exercise records of a catalog file.
+"""
+
+import logging
+import re
+from json.decoder import scanstring
+from typing import Any, Dict, Iterator, TextIO, Tuple
+
+logger = logging.getLogger(__name__)
+
+Event = Tuple[str, Any]
+
+# Les séparateurs "," et ":" sont absorbés avec les blancs : la position d'une chaîne
+# dans son objet (clé ou valeur) suffit à la classer
+_TOKEN = re.compile(r"""
+    [ \t\n\r,:]*
+    (?:
+        (?P<open_map>\{)
+      | (?P<close_map>\})
+      | (?P<open_array>\[)
+      | (?P<close_array>\])
+      | (?P<string>"(?:[^"\\]|\\.)*")
+      | (?P<literal>true|false|null)
+      | (?P<number>-?(?:0|[1-9][0-9]*)(?:\.[0-9]+)?(?:[eE][+-]?[0-9]+)?)
+      | (?P<error>.)
+    )
+""", re.VERBOSE)
+# Un nombre n'est complet que suivi d'un délimiteur ("12" peut encore devenir "12.5e3")
+_AFTER_NUMBER = re.compile(r"[ \t\n\r,\]}]")
+_LITERALS = {"true": True, "false": False, "null": None}
+
+
+def iter_events(fp: TextIO, chunk_size: int = 1 << 16) -> Iterator[Event]:
+    """
+    Parse a JSON document incrementally.
+
+    Only one chunk, plus a token left unfinished by the previous one, is held in
+    memory at a time. Commas and colons are skipped rather than checked.
+
+    Args:
+        fp (TextIO): File object opened in text mode.
+        chunk_size (int): Number of characters read at a time.
+
+    Yields:
+        Event: Parsing events, in document order.
+
+    Raises:
+        ValueError: If the document is malformed.
+    """
+    # Pile des conteneurs ouverts : True pour un objet, False pour un tableau
+    containers = []
+    expect_key = False
+    buffer = ""
+    while True:
+        chunk = fp.read(chunk_size)
+        eof = not chunk
+        buffer += chunk
+        size = len(buffer)
+        rest = size
+        for match in _TOKEN.finditer(buffer):
+            kind = match.lastgroup
+            # Un jeton qui touche la fin du bloc peut continuer dans le suivant
+            if not eof and (kind == "error" or match.end() == size
+                            or (kind == "number" and not _AFTER_NUMBER.match(buffer, match.end()))):
+                rest = match.start()
+                break
+            if kind == "error":
+                raise ValueError(f"Invalid JSON near {buffer[match.start():match.start() + 40]!r}")
+            text = match.group(kind)
+            if kind == "open_map":
+                containers.append(True)
+                expect_key = True
+                yield "start_map", None
+            elif kind == "open_array":
+                containers.append(False)
+                yield "start_array", None
+            elif kind == "close_map" or kind == "close_array":
+                if not containers or containers.pop() != (kind == "close_map"):
+                    raise ValueError(f"Unexpected {text!r}")
+                expect_key = bool(containers) and containers[-1]
+                yield ("end_map" if kind == "close_map" else "end_array"), None
+            elif expect_key:
+                if kind != "string":
+                    raise ValueError(f"Expected an object key, got {text!r}")
+                expect_key = False
+                yield "map_key", scanstring(text, 1)[0]
+            else:
+                if kind == "string":
+                    value = scanstring(text, 1)[0]
+                elif kind == "literal":
+                    value = _LITERALS[text]
+                elif "." in text or "e" in text or "E" in text:
+                    value = float(text)
+                else:
+                    value = int(text)
+                expect_key = bool(containers) and containers[-1]
+                yield "value", value
+        buffer = buffer[rest:]
+        if eof:
+            if containers:
+                raise ValueError("Unexpected end of JSON document")
+            return
+
+
+def build_value(event: Event, events: Iterator[Event]) -> Any:
+    """
+    Rebuild the value that starts with event, consuming its remaining events.
+
+    Args:
+        event (Event): First event of the value (already read).
+        events (Iterator[Event]): The event stream, positioned right after event.
+
+    Returns:
+        Any: The decoded value.
+    """
+    kind, value = event
+    if kind == "value":
+        return value
+    root = {} if kind == "start_map" else []
+    stack, keys = [root], [None]
+    for kind, value in events:
+        if kind == "map_key":
+            keys[-1] = value
+            continue
+        if kind in ("end_map", "end_array"):
+            stack.pop()
+            keys.pop()
+            if not stack:
+                return root
+            continue
+        item = value if kind == "value" else ({} if kind == "start_map" else [])
+        parent = stack[-1]
+        if isinstance(parent, dict):
+            parent[keys[-1]] = item
+        else:
+            parent.append(item)
+        if kind != "value":
+            stack.append(item)
+            keys.append(None)
+    raise ValueError("Unexpected end of JSON document")
+
+
+def iter_ref_records(path: str, chunk_size: int = 1 << 16) -> Iterator[Tuple[Any, Dict[str, Any]]]:
+    """
+    Yield the exercise records of a catalog such as allExercice.json.
+
+    A record is an object that has a "ref" key and is the value of a key of another
+    object; objects nested in a record are not searched, exactly like
+    ExerciseManager.process_exercices_all_json. The file is read twice: a first pass
+    finds the records (only their position and ref are kept), the second builds them
+    one at a time. When several records share a ref, the last one is yielded at the
+    position of the first, as when they are assigned to a dictionary in turn; those
+    last records are built beforehand by an extra pass, only when there are duplicates.
+
+    Args:
+        path (str): Catalog file.
+        chunk_size (int): Number of characters read at a time.
+
+    Yields:
+        Tuple[Any, Dict[str, Any]]: (ref, record) pairs in document order.
+    """
+    with open(path, "r", encoding="utf-8") as fp:
+        records = _locate_ref_records(_CountedMaps(iter_events(fp, chunk_size)))
+
+    first_of_ref, last_of_ref = {}, {}
+    for ordinal, ref in records.items():
+        first_of_ref.setdefault(ref, ordinal)
+        last_of_ref[ref] = ordinal
+    duplicates = len(records) - len(last_of_ref)
+
+    # Dernier enregistrement de chaque ref en double, rendu à la place du premier
+    replacements = {}
+    if duplicates:
+        logger.warning(f"{duplicates} duplicate exercise ref(s) in {path}, keeping the last record of each "
+                       f"at the position of the first")
+        duplicated = {last_of_ref[ref]: first_of_ref[ref]
+                      for ref in last_of_ref if last_of_ref[ref] != first_of_ref[ref]}
+        with open(path, "r", encoding="utf-8") as fp:
+            events = _CountedMaps(iter_events(fp, chunk_size))
+            for event in events:
+                if event[0] == "start_map" and events.ordinal in duplicated:
+                    first = duplicated[events.ordinal]
+                    replacements[first] = build_value(event, events)
+    selected = set(first_of_ref.values())
+
+    with open(path, "r", encoding="utf-8") as fp:
+        events = _CountedMaps(iter_events(fp, chunk_size))
+        for event in events:
+            if event[0] == "start_map" and events.ordinal in selected:
+                # Le premier enregistrement d'une ref en double n'est pas construit : ses
+                # objets ne sont pas sélectionnés, aucun enregistrement n'étant imbriqué
+                record = replacements.pop(events.ordinal, None) or build_value(event, events)
+                yield record["ref"], record
+
+
+class _CountedMaps:
+    """Event iterator that numbers the objects of the document (ordinal of the last start_map)"""
+
+    def __init__(self, events: Iterator[Event]):
+        self.events = events
+        self.ordinal = -1
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> Event:
+        event = next(self.events)
+        if event[0] == "start_map":
+            self.ordinal += 1
+        return event
+
+
+def _locate_ref_records(events: _CountedMaps) -> Dict[int, Any]:
+    """
+    Ordinal and ref of each record, in document order.
+
+    Records found inside another record are dropped, since the walk does not enter records.
+    """
+    records = {}
+    # Un cadre par conteneur ouvert : [ordinal (None pour un tableau), parent est un objet, ref]
+    stack = []
+    for kind, value in events:
+        if kind == "start_map" or kind == "start_array":
+            parent_is_map = bool(stack) and stack[-1][0] is not None
+            stack.append([events.ordinal if kind == "start_map" else None, parent_is_map, _NO_REF])
+        elif kind == "map_key":
+            if value == "ref":
+                frame = stack[-1]
+                frame[2] = build_value(next(events), events)
+        elif kind == "end_map" or kind == "end_array":
+            ordinal, parent_is_map, ref = stack.pop()
+            if ref is not _NO_REF and parent_is_map:
+                # Les objets d'un sous-arbre ont des ordinaux contigus, plus grands que sa racine
+                while records and next(reversed(records)) > ordinal:
+                    records.popitem()
+                records[ordinal] = ref
+    return records
+
+
+_NO_REF = object()
@@ -1,15 +1,13 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import numpy as np
-import pandas as pd
-from sklearn.impute import SimpleImputer
-from sklearn.decomposition import TruncatedSVD
-from sklearn.experimental import enable_iterative_imputer
-from sklearn.impute import IterativeImputer
+from src.db.sparse_scores import SparseScoreMatrix
 
 def svd_matrix_completion(matrix, rank=None, tol=1e-5, max_iter=100):
     """
     Complète une matrice avec des valeurs manquantes en utilisant la décomposition SVD tronquée.
     
-    :param matrix: La matrice d'entrée avec des NaN pour les valeurs manquantes
+    :param matrix: La matrice d'entrée avec des NaN pour les valeurs manquantes, ou une SparseScoreMatrix
     :param rank: Le rang de l'approximation (par défaut, min(n_rows, n_cols) / 2)
     :param tol: La tolérance pour la convergence
     :param max_iter: Le nombre maximum d'itérations
@@ -19,10 +17,12 @@ def svd_matrix_completion(matrix, rank=None, tol=1e-5, max_iter=100):
         rank = min(matrix.shape) // 2
 
     # Initialiser les valeurs manquantes avec la moyenne de chaque colonne
-    imputer = SimpleImputer(strategy='mean')
-    filled_matrix = imputer.fit_transform(matrix)
+    filled_matrix, mask = _initial_fill(matrix)
+    known_values = filled_matrix[~mask]
+
+    # scikit-learn n'est importé que par les moteurs qui s'en servent
+    from sklearn.decomposition import TruncatedSVD
 
-    mask = np.isnan(matrix)
     for _ in range(max_iter):
         old_matrix = filled_matrix.copy()
         
@@ -32,7 +32,7 @@ def svd_matrix_completion(matrix, rank=None, tol=1e-5, max_iter=100):
         filled_matrix = svd.inverse_transform(svd.transform(filled_matrix))
         
         # Remplacer les valeurs connues
-        filled_matrix[~mask] = matrix[~mask]
+        filled_matrix[~mask] = known_values
         
         # Vérifier la convergence
         if np.linalg.norm(filled_matrix - old_matrix) < tol:
@@ -40,73 +40,271 @@ def svd_matrix_completion(matrix, rank=None, tol=1e-5, max_iter=100):
 
     return filled_matrix
 
-def iterative_imputer_completion(matrix):
+def soft_impute_completion(matrix, rank=None, tol=1e-5, max_iter=100, shrinkage=0.0,
+                           oversampling=5, random_state=0):
+    """
+    Complète une matrice avec des valeurs manquantes par itérations de rang faible
+    (soft-impute) avec SVD randomisée réutilisant les facteurs de l'itération précédente.
+
+    Contrairement à svd_matrix_completion, aucun TruncatedSVD n'est réajusté à chaque
+    itération : le sous-espace droit de l'itération précédente sert de point de départ,
+    seules les entrées manquantes sont mises à jour et le test de convergence (variation
+    relative des entrées manquantes) travaille dans des tampons préalloués.
+
+    :param matrix: La matrice d'entrée avec des NaN pour les valeurs manquantes, ou une SparseScoreMatrix
+    :param rank: Le rang de l'approximation (par défaut, min(n_rows, n_cols) / 2)
+    :param tol: La tolérance relative pour la convergence
+    :param max_iter: Le nombre maximum d'itérations
+    :param shrinkage: Seuillage doux appliqué aux valeurs singulières (0 = rang dur)
+    :param oversampling: Nombre de directions supplémentaires du sous-espace randomisé
+    :param random_state: Graine du sous-espace initial
+    :return: La matrice complétée
+    """
+    if rank is None:
+        rank = min(matrix.shape) // 2
+    rank = max(1, min(rank, min(matrix.shape)))
+    n_components = min(rank + oversampling, min(matrix.shape))
+
+    # Initialiser les valeurs manquantes avec la moyenne de chaque colonne
+    filled_matrix, mask = _initial_fill(matrix)
+
+    missing = np.flatnonzero(mask)
+    if missing.size == 0:
+        return filled_matrix
+
+    rng = np.random.default_rng(random_state)
+    basis = rng.standard_normal((matrix.shape[1], n_components))
+    low_rank = np.empty_like(filled_matrix)
+    old_values = filled_matrix.ravel()[missing]
+    new_values = np.empty_like(old_values)
+
+    for iteration in range(max_iter):
+        # Quelques itérations de puissance au départ, puis une seule par tour
+        # puisque la base est déjà proche du sous-espace recherché
+        q = _randomized_range(filled_matrix, basis, n_power_iter=2 if iteration == 0 else 0)
+        u_small, s, vt = np.linalg.svd(q.T @ filled_matrix, full_matrices=False)
+        basis = vt.T
+
+        s = s[:rank]
+        if shrinkage:
+            s = np.maximum(s - shrinkage, 0.0)
+        np.matmul(q @ (u_small[:, :rank] * s), vt[:rank], out=low_rank)
+
+        # Remplacer uniquement les valeurs manquantes
+        np.take(low_rank, missing, out=new_values)
+        np.put(filled_matrix, missing, new_values)
+
+        # Vérifier la convergence : ||nouveau - ancien|| <= tol * ||nouveau||
+        np.subtract(old_values, new_values, out=old_values)
+        delta = np.dot(old_values, old_values)
+        norm = np.dot(new_values, new_values)
+        old_values, new_values = new_values, old_values
+        if delta <= tol * tol * norm:
+            break
+
+    return filled_matrix
+
+def _initial_fill(matrix):
+    """
+    Matrice dense où les valeurs manquantes valent la moyenne de leur colonne (moyenne
+    globale si la colonne est vide), et masque booléen des valeurs manquantes.
+
+    Une SparseScoreMatrix est remplie directement depuis ses valeurs observées, sans
+    passer par une matrice dense de NaN.
+    """
+    if isinstance(matrix, SparseScoreMatrix):
+        filled_matrix = np.repeat(matrix.column_means()[np.newaxis, :], matrix.shape[0], axis=0)
+        filled_matrix[matrix.rows, matrix.cols] = matrix.values
+        return filled_matrix, ~matrix.observed_mask()
+
+    matrix = np.asarray(matrix, dtype=float)
+    mask = np.isnan(matrix)
+    counts = (~mask).sum(axis=0)
+    sums = np.where(mask, 0.0, matrix).sum(axis=0)
+    global_mean = sums.sum() / counts.sum() if counts.sum() else 0.0
+    means = np.divide(sums, counts, out=np.full(matrix.shape[1], global_mean), where=counts > 0)
+    return np.where(mask, means, matrix), mask
+
+def _randomized_range(matrix, basis, n_power_iter=0):
+    """
+    Base orthonormée approchant l'image de matrix @ basis (Halko et al.).
+    """
+    q, _ = np.linalg.qr(matrix @ basis)
+    for _ in range(n_power_iter):
+        q, _ = np.linalg.qr(matrix.T @ q)
+        q, _ = np.linalg.qr(matrix @ q)
+    return q
+
+# Rang par défaut de l'ALS : le coût d'une résolution croît en rang^3 par ligne, et
+# les rangs utiles sur ces données sont faibles (voir model_selection)
+_DEFAULT_ALS_RANK = 10
+
+def als_matrix_completion(matrix, rank=None, tol=1e-5, max_iter=100, reg=0.1,
+                          n_workers=None, backend="thread", random_state=0):
+    """
+    Complète une matrice avec des valeurs manquantes par moindres carrés alternés (ALS).
+
+    Seules les valeurs observées interviennent dans les résolutions : le coût d'une
+    itération dépend du nombre de scores enregistrés et non de élèves x exercices.
+    Les résolutions par ligne puis par colonne sont réparties par blocs sur un pool
+    de threads ou de processus.
+
+    :param matrix: La matrice d'entrée avec des NaN pour les valeurs manquantes, ou une SparseScoreMatrix
+    :param rank: Le rang des facteurs (par défaut, _DEFAULT_ALS_RANK borné par la taille de la matrice)
+    :param tol: La tolérance relative sur l'erreur d'apprentissage pour la convergence
+    :param max_iter: Le nombre maximum d'itérations (une itération = lignes puis colonnes)
+    :param reg: Le coefficient de régularisation L2 des facteurs
+    :param n_workers: Le nombre de workers (par défaut, le nombre de cœurs)
+    :param backend: "thread" ou "process"
+    :param random_state: Graine de l'initialisation des facteurs
+    :return: La matrice complétée
+    """
+    scores = matrix if isinstance(matrix, SparseScoreMatrix) else SparseScoreMatrix.from_dense(matrix)
+    if rank is None:
+        rank = _DEFAULT_ALS_RANK
+    rank = max(1, min(rank, min(scores.shape)))
+
+    student_factors, exercise_factors, mean = _als_factors(
+        scores, rank, tol=tol, max_iter=max_iter, reg=reg,
+        n_workers=n_workers, backend=backend, random_state=random_state
+    )
+    completed_matrix = student_factors @ exercise_factors.T
+    completed_matrix += mean
+
+    # Remplacer les valeurs connues
+    completed_matrix[scores.rows, scores.cols] = scores.values
+    return completed_matrix
+
+def _als_factors(scores, rank, tol=1e-5, max_iter=100, reg=0.1, n_workers=None,
+                 backend="thread", random_state=0, exercise_factors=None):
+    """
+    Facteurs élèves et exercices (centrés sur la moyenne globale) appris par ALS.
+
+    :param exercise_factors: Facteurs exercices de départ (démarrage à chaud), optionnel
+    :return: (facteurs élèves, facteurs exercices, moyenne globale)
+    """
+    n_rows, n_cols = scores.shape
+    mean = float(scores.values.mean()) if scores.nnz else 0.0
+    centered = scores.values - mean
+
+    # Vue par lignes (CSR) et par colonnes (CSC) des valeurs observées
+    row_ptr = scores.indptr
+    col_order = np.argsort(scores.cols, kind="stable")
+    col_ptr = np.concatenate(([0], np.cumsum(np.bincount(scores.cols, minlength=n_cols))))
+    col_rows, col_values = scores.rows[col_order], centered[col_order]
+
+    if exercise_factors is None:
+        rng = np.random.default_rng(random_state)
+        exercise_factors = rng.normal(scale=0.1, size=(n_cols, rank))
+    student_factors = np.zeros((n_rows, rank))
+
+    n_workers = n_workers or os.cpu_count() or 1
+    executor_class = ProcessPoolExecutor if backend == "process" else ThreadPoolExecutor
+    previous_loss = None
+    with executor_class(max_workers=n_workers) as executor:
+        for _ in range(max_iter):
+            student_factors = _als_solve_side(executor, n_workers, row_ptr, scores.cols, centered,
+                                              exercise_factors, reg)
+            exercise_factors = _als_solve_side(executor, n_workers, col_ptr, col_rows, col_values,
+                                               student_factors, reg)
+
+            # Vérifier la convergence sur l'erreur quadratique des valeurs observées
+            predictions = np.einsum("ij,ij->i", student_factors[scores.rows], exercise_factors[scores.cols])
+            loss = float(np.mean((predictions - centered) ** 2)) if scores.nnz else 0.0
+            if previous_loss is not None and abs(previous_loss - loss) <= tol * max(previous_loss, 1e-12):
+                break
+            previous_loss = loss
+
+    return student_factors, exercise_factors, mean
+
+def _als_solve_side(executor, n_workers, indptr, indices, values, fixed, reg):
+    """
+    Résout les moindres carrés régularisés de chaque ligne de indptr, par blocs parallèles.
+    """
+    n_targets = len(indptr) - 1
+    # Blocs de taille comparable en nombre de valeurs observées
+    n_blocks = max(1, min(n_targets, 4 * n_workers))
+    bounds = np.searchsorted(indptr, np.linspace(0, indptr[-1], n_blocks + 1), side="left")
+    bounds[0], bounds[-1] = 0, n_targets
+    bounds = np.unique(np.minimum(bounds, n_targets))
+
+    futures = []
+    for start, stop in zip(bounds[:-1], bounds[1:]):
+        lo, hi = indptr[start], indptr[stop]
+        futures.append(executor.submit(
+            _als_solve_block, indptr[start:stop + 1] - lo, indices[lo:hi], values[lo:hi], fixed, reg
+        ))
+    result = np.zeros((n_targets, fixed.shape[1]))
+    for (start, stop), future in zip(zip(bounds[:-1], bounds[1:]), futures):
+        result[start:stop] = future.result()
+    return result
+
+# Éléments (float64) au plus du tableau temporaire des produits observés d'une tranche
+_GRAM_CHUNK_ELEMENTS = 1 << 22
+
+def _als_solve_block(indptr, indices, values, fixed, reg):
+    """
+    Pour chaque ligne du bloc : (F^T F + reg I) x = F^T y sur ses seules valeurs observées.
+    Les lignes sans valeur observée gardent des facteurs nuls.
+    """
+    rank = fixed.shape[1]
+    factors = np.zeros((len(indptr) - 1, rank))
+    counts = np.diff(indptr)
+    nonempty = np.flatnonzero(counts)
+    if nonempty.size == 0:
+        return factors
+
+    # Les produits observés (nnz x rang x rang) sont accumulés par tranches de lignes
+    # consécutives dont le volume reste sous _GRAM_CHUNK_ELEMENTS
+    max_nnz = max(1, _GRAM_CHUNK_ELEMENTS // (rank * rank))
+    starts, stops = indptr[nonempty], indptr[nonempty + 1]
+    gram = np.empty((nonempty.size, rank, rank))
+    rhs = np.empty((nonempty.size, rank))
+    k = 0
+    while k < nonempty.size:
+        end = max(k + 1, int(np.searchsorted(stops, starts[k] + max_nnz, side="right")))
+        lo, hi = starts[k], stops[end - 1]
+        observed = fixed[indices[lo:hi]]
+        offsets = starts[k:end] - lo
+        if end - k == 1:
+            # Ligne seule trop longue pour la tranche : produit matriciel direct
+            gram[k] = observed.T @ observed
+        else:
+            gram[k:end] = np.add.reduceat(observed[:, :, np.newaxis] * observed[:, np.newaxis, :], offsets, axis=0)
+        rhs[k:end] = np.add.reduceat(observed * values[lo:hi, np.newaxis], offsets, axis=0)
+        k = end
+    gram += reg * np.eye(rank)
+    factors[nonempty] = np.linalg.solve(gram, rhs[:, :, np.newaxis])[:, :, 0]
+    return factors
+
+def iterative_imputer_completion(matrix, tol=1e-3, max_iter=10):
     """
     Complète une matrice avec des valeurs manquantes en utilisant l'imputation itérative.
     
-    :param matrix: La matrice d'entrée avec des NaN pour les valeurs manquantes
+    IterativeImputer ne travaille que sur des matrices denses : une SparseScoreMatrix
+    est donc densifiée (NaN pour les valeurs manquantes) avant l'imputation.
+
+    :param matrix: La matrice d'entrée avec des NaN pour les valeurs manquantes, ou une SparseScoreMatrix
+    :param tol: La tolérance pour la convergence
+    :param max_iter: Le nombre maximum d'itérations
     :return: La matrice complétée
     """
-    imputer = IterativeImputer(max_iter=10, random_state=0)
+    if isinstance(matrix, SparseScoreMatrix):
+        matrix = matrix.to_dense()
+    from sklearn.experimental import enable_iterative_imputer  # noqa: F401
+    from sklearn.impute import IterativeImputer
+    imputer = IterativeImputer(max_iter=max_iter, tol=tol, random_state=0, keep_empty_features=True)
     return imputer.fit_transform(matrix)
 
-# Exemple d'utilisation
+# Moteurs de complétion disponibles, par nom
+COMPLETION_ENGINES = {
+    "svd": svd_matrix_completion,
+    "soft_impute": soft_impute_completion,
+    "als": als_matrix_completion,
+    "iterative": iterative_imputer_completion,
+}
+
+# Banc d'essai des moteurs (voir src/benchmarks/completion.py pour les options)
 if __name__ == "__main__":
-    
-    # data/synthesis_data/synthesis.csv
-    matrix_orig = pd.read_csv("data/synthesis_data/synthesis.csv", index_col=0)
-    print("Matrice originale:")
-    print(matrix_orig)
-    cols_to_drop = ["Classe", "Groupe"]
-    matrix_orig = matrix_orig.drop(cols_to_drop, axis=1).to_numpy()
-    # randomly about 1% of the values to NaN
-    np.random.seed(0)
-    mask = np.random.rand(*matrix_orig.shape) < 0.3
-    matrix_nan = matrix_orig.copy()
-    matrix_nan[mask] = np.nan
-    print("\nMatrice avec des valeurs manquantes:")
-    print(matrix_nan)
-    # remove cols/rows if all values are NaN
-    matrix_nan = matrix_nan[~np.all(np.isnan(matrix_nan), axis=1)]
-    matrix_nan = matrix_nan[:, ~np.all(np.isnan(matrix_nan), axis=0)]
-
-
-    completed_matrix_svd = svd_matrix_completion(matrix_nan)
-    print("\nMatrice complétée avec SVD:")
-    # print(completed_matrix_svd)
-
-    completed_matrix_iterative = iterative_imputer_completion(matrix_nan)
-    print("\nMatrice complétée avec imputation itérative:")
-    # print(completed_matrix_iterative)
-
-    # Comparer les résultats sur des colonnes aléatoires
-    # set seed for reproducibility
-    np.random.seed(10)
-    random_cols = np.random.choice(matrix_nan.shape[1], 10, replace=False)
-    for col in random_cols:
-        print(f"\nComparaison pour la colonne {col}:")
-        # Créer un DataFrame pour une meilleure présentation
-        # print("matrice_nan")
-        # print(matrix_nan[:, col])
-        comparison_df = pd.DataFrame({
-            'Valeurs originales': matrix_orig[:, col],
-            'Valeurs réelles nan': matrix_nan[:, col],
-            'SVD': completed_matrix_svd[:, col],
-            'Imputation itérative': completed_matrix_iterative[:, col]
-        })
-        
-        # Afficher uniquement les lignes où il y avait des valeurs manquantes et ou la valeur orinale est connue
-        missing_mask = np.isnan(matrix_nan[:, col]) & ~np.isnan(matrix_orig[:, col])
-        comparison_df_missing = comparison_df[missing_mask]
-        
-        # Afficher le DataFrame avec un formatage amélioré
-        pd.set_option('display.float_format', '{:.2f}'.format)
-        print(comparison_df_missing.to_string(index=False))
-        
-        # Calculer et afficher les erreurs moyennes
-        mse_svd = np.mean((matrix_nan[:, col][~np.isnan(matrix_nan[:, col])] - completed_matrix_svd[:, col][~np.isnan(matrix_nan[:, col])])**2)
-        mse_iterative = np.mean((matrix_nan[:, col][~np.isnan(matrix_nan[:, col])] - completed_matrix_iterative[:, col][~np.isnan(matrix_nan[:, col])])**2)
-        
-        print(f"\nErreur quadratique moyenne (MSE) :")
-        print(f"SVD : {mse_svd:.6f}")
-        print(f"Imputation itérative : {mse_iterative:.6f}")
+    from src.benchmarks.completion import main
+    main()
@@ -0,0 +1,204 @@
+"""
+Model Selection Module
+
+This module picks the completion engine, rank and tolerance by k-fold hold-out
+masking over the observed scores. Fold assignments are computed once and handed to
+each worker process a single time through the pool initializer; every (engine, rank,
+tol, fold) evaluation then runs in parallel and only returns its RMSE and wall time.
+
+Classes:
+    ModelSelectionResult: Best configuration and the full timing/quality table.
+
+Functions:
+    make_folds: Assign each observed score to a fold.
+    select_model: Evaluate a grid of configurations and pick the best one.
+    load_best_config: Read the configuration saved by a previous selection.
+    main: Entry point of the script.
+"""
+
+import argparse
+import inspect
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, Optional
+import numpy as np
+import pandas as pd
+from src.config import Config
+from src.db.sparse_scores import SparseScoreMatrix
+from src.matrix_completion import COMPLETION_ENGINES
+
+# Données partagées en lecture seule par les workers (voir _init_worker)
+_worker_scores: Optional[SparseScoreMatrix] = None
+_worker_folds: Optional[np.ndarray] = None
+
+
+@dataclass
+class ModelSelectionResult:
+    """
+    Outcome of a model selection run.
+
+    Attributes:
+        best (Dict[str, Any]): Best configuration: engine, rank and tol.
+        table (pd.DataFrame): Mean/std held-out RMSE and mean wall time of each configuration.
+    """
+    best: Dict[str, Any]
+    table: pd.DataFrame
+
+
+def make_folds(scores: SparseScoreMatrix, n_folds: int = 5, seed: int = 0) -> np.ndarray:
+    """
+    Assign each observed score to one of n_folds balanced folds.
+
+    Returns:
+        np.ndarray: Fold number of each observed score (read-only).
+    """
+    folds = np.random.default_rng(seed).permutation(scores.nnz) % n_folds
+    folds = folds.astype(np.int8)
+    folds.flags.writeable = False
+    return folds
+
+
+def select_model(scores: SparseScoreMatrix, engines: Iterable[str] = ("soft_impute", "als"),
+                 ranks: Iterable[int] = (2, 5, 10, 20), tols: Iterable[float] = (1e-3, 1e-5),
+                 n_folds: int = 5, n_workers: Optional[int] = None, seed: int = 0) -> ModelSelectionResult:
+    """
+    Evaluate every (engine, rank, tol) configuration on every fold in a process pool.
+
+    Engines that do not take a rank (iterative) are evaluated once per tolerance.
+    Ranks larger than the matrix allows are clipped, and duplicates dropped.
+
+    Args:
+        scores (SparseScoreMatrix): Observed scores.
+        engines (Iterable[str]): Names from COMPLETION_ENGINES.
+        ranks (Iterable[int]): Candidate ranks.
+        tols (Iterable[float]): Candidate tolerances.
+        n_folds (int): Number of hold-out folds.
+        n_workers (int, optional): Worker processes (default: number of cores).
+        seed (int): Seed of the fold assignment.
+
+    Returns:
+        ModelSelectionResult: Best configuration (lowest mean RMSE, then fastest) and the table.
+    """
+    folds = make_folds(scores, n_folds, seed)
+    max_rank = min(scores.shape)
+    configurations = []
+    for engine in engines:
+        if "rank" in inspect.signature(COMPLETION_ENGINES[engine]).parameters:
+            engine_ranks = sorted({max(1, min(rank, max_rank)) for rank in ranks})
+        else:
+            engine_ranks = [None]
+        configurations.extend(itertools.product([engine], engine_ranks, tols))
+
+    tasks = [(engine, rank, tol, fold) for (engine, rank, tol) in configurations for fold in range(n_folds)]
+    with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker,
+                             initargs=(scores, folds)) as executor:
+        rows = list(executor.map(_evaluate, tasks))
+
+    results = pd.DataFrame(rows, columns=["engine", "rank", "tol", "fold", "rmse", "seconds"])
+    table = (
+        results.groupby(["engine", "rank", "tol"], dropna=False)
+        .agg(rmse=("rmse", "mean"), rmse_std=("rmse", "std"), seconds=("seconds", "mean"))
+        .reset_index()
+        .sort_values(["rmse", "seconds"])
+        .reset_index(drop=True)
+    )
+    best = table.iloc[0]
+    return ModelSelectionResult(
+        best={
+            "engine": best["engine"],
+            "rank": None if pd.isna(best["rank"]) else int(best["rank"]),
+            "tol": float(best["tol"]),
+        },
+        table=table,
+    )
+
+
+def load_best_config(config: Config) -> Optional[Dict[str, Any]]:
+    """Configuration saved by the last model selection run, or None"""
+    path = os.path.join(config.data_dir, config.synthesis_data_dir, config.completion_config_filename)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _init_worker(scores: SparseScoreMatrix, folds: np.ndarray):
+    """Keep the observed scores and the folds for every task of this worker"""
+    global _worker_scores, _worker_folds
+    _worker_scores, _worker_folds = scores, folds
+
+
+def _evaluate(task):
+    """Train on all folds but one and measure the RMSE on the held-out fold"""
+    engine_name, rank, tol, fold = task
+    held_out_mask = _worker_folds == fold
+    train, held_out = _worker_scores.subset(~held_out_mask), _worker_scores.subset(held_out_mask)
+
+    engine = COMPLETION_ENGINES[engine_name]
+    parameters = inspect.signature(engine).parameters
+    kwargs = {"tol": tol}
+    if rank is not None:
+        kwargs["rank"] = rank
+    if "n_workers" in parameters:
+        # Le parallélisme est déjà assuré par le pool de processus
+        kwargs["n_workers"] = 1
+
+    start = time.perf_counter()
+    completed = engine(train, **kwargs)
+    seconds = time.perf_counter() - start
+    errors = completed[held_out.rows, held_out.cols] - held_out.values
+    rmse = float(np.sqrt(np.mean(errors ** 2))) if held_out.nnz else float("nan")
+    return engine_name, rank, tol, fold, rmse, seconds
+
+
+def _parse_list(value: str, cast):
+    return [cast(item) for item in value.split(",") if item]
+
+
+def main():
+    """
+    Run a model selection on the synthesis and save the best configuration.
+    """
+    config = Config()
+    synthesis_dir = os.path.join(config.data_dir, config.synthesis_data_dir)
+
+    parser = argparse.ArgumentParser(description="Select the completion engine, rank and tolerance")
+    parser.add_argument("--synthesis", default=None,
+                        help="synthesis.json to use instead of the configured synthesis store")
+    parser.add_argument("--engines", default="soft_impute,als", help="Comma-separated engine names")
+    parser.add_argument("--ranks", default="2,5,10,20", help="Comma-separated ranks")
+    parser.add_argument("--tols", default="1e-3,1e-5", help="Comma-separated tolerances")
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--table", default=None, help="Also write the timing/quality table to this CSV")
+    args = parser.parse_args()
+
+    if args.synthesis:
+        scores = SparseScoreMatrix.from_synthesis_json(args.synthesis)
+    else:
+        scores = SparseScoreMatrix.from_config(config)
+    result = select_model(
+        scores,
+        engines=_parse_list(args.engines, str),
+        ranks=_parse_list(args.ranks, int),
+        tols=_parse_list(args.tols, float),
+        n_folds=args.folds,
+        n_workers=args.workers,
+    )
+
+    print(result.table.to_string(index=False))
+    print(f"Meilleure configuration : {result.best}")
+    if args.table:
+        result.table.to_csv(args.table, index=False)
+
+    os.makedirs(synthesis_dir, exist_ok=True)
+    with open(os.path.join(synthesis_dir, config.completion_config_filename), "w") as f:
+        json.dump(result.best, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
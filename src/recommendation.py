@@ -0,0 +1,242 @@
+"""
+Exercise Recommendation Module
+
+This module turns a completed student x exercise score matrix into exercise
+recommendations. The completed matrix, the observed-score mask and the exercise
+metadata (super_id, theme and sub-theme from exercices.csv, URL parameters) are kept
+in memory as numpy arrays so that a query is a handful of vectorized operations; the
+completed matrix can also be memory-mapped from a published completion artifact.
+
+Classes:
+    Recommendation: A recommended exercise with its predicted score and metadata.
+    RecommendationService: Answers top-k queries for one student or a whole class.
+"""
+
+import csv
+import os
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from pydantic import ValidationError
+from src.models.url_model import UrlParamsModel
+
+UNKNOWN = "Unknown"
+
+
+@dataclass
+class Recommendation:
+    """A recommended exercise for a student"""
+    super_id: str
+    predicted_score: float
+    theme: str
+    sub_theme: str
+    url_params: Optional[UrlParamsModel]
+
+
+class RecommendationService:
+    """
+    In-memory top-k recommendation over a completed score matrix.
+
+    An exercise is eligible for a student when its predicted score falls in the
+    requested band (and, by default, when the student has no recorded score for it).
+    Eligible exercises are ranked by distance to the middle of the band, i.e. the
+    exercises the student is predicted to half-master come first.
+
+    Attributes:
+        completed (np.ndarray): Completed students x exercises score matrix.
+        students (List[str]): Student name of each row.
+        exercises (List[str]): Exercise super_id of each column.
+        themes (np.ndarray): Theme of each exercise.
+        sub_themes (np.ndarray): Sub-theme of each exercise.
+        url_params (List[Optional[UrlParamsModel]]): URL parameters of each exercise.
+        observed (np.ndarray): Boolean mask of the scores actually recorded.
+        classes (List[Any]): Class of each student, when known.
+    """
+
+    def __init__(self, completed: np.ndarray, students: Sequence[str], exercises: Sequence[str],
+                 themes: Sequence[str], sub_themes: Sequence[str],
+                 url_params: Sequence[Optional[UrlParamsModel]],
+                 observed: Optional[np.ndarray] = None, classes: Optional[Sequence[Any]] = None):
+        self.completed = np.asarray(completed, dtype=np.float64)
+        self.students = list(students)
+        self.exercises = list(exercises)
+        self.themes = np.asarray(themes, dtype=object)
+        self.sub_themes = np.asarray(sub_themes, dtype=object)
+        self.url_params = list(url_params)
+        self.observed = observed if observed is not None else np.zeros(self.completed.shape, dtype=bool)
+        self.classes = list(classes) if classes else []
+
+        self.student_index = {student: i for i, student in enumerate(self.students)}
+        self._all_exercises = np.ones(len(self.exercises), dtype=bool)
+        self._theme_masks: Dict[Tuple[Optional[str], Optional[str]], np.ndarray] = {}
+
+    @classmethod
+    def from_synthesis(cls, completed: np.ndarray, scores, synthesis_data: Dict[str, Any],
+                       exercices_csv_path: str) -> "RecommendationService":
+        """
+        Build the service from a completion result and the synthesis metadata.
+
+        Args:
+            completed (np.ndarray): Output of one of the matrix_completion engines.
+            scores (SparseScoreMatrix): The observed scores the matrix was completed from.
+            synthesis_data (Dict[str, Any]): Loaded synthesis.json (URL parameters of each exercise).
+            exercices_csv_path (str): Path to exercices.csv (theme and sub-theme of each exercise).
+        """
+        themes, sub_themes, url_params = _exercise_metadata(scores.exercises, synthesis_data, exercices_csv_path)
+        return cls(completed, scores.students, scores.exercises, themes, sub_themes, url_params,
+                   observed=scores.observed_mask(), classes=scores.classes)
+
+    @classmethod
+    def from_artifact(cls, artifact, synthesis_data: Dict[str, Any],
+                      exercices_csv_path: str) -> "RecommendationService":
+        """
+        Build the service on a published completion artifact.
+
+        The completed matrix and the observed mask stay memory-mapped, so the
+        processes serving recommendations share a single copy of them.
+
+        Args:
+            artifact (CompletionArtifact): Opened artifact (see src.completion_artifact).
+            synthesis_data (Dict[str, Any]): Loaded synthesis.json (URL parameters of each exercise).
+            exercices_csv_path (str): Path to exercices.csv (theme and sub-theme of each exercise).
+        """
+        themes, sub_themes, url_params = _exercise_metadata(artifact.exercises, synthesis_data, exercices_csv_path)
+        return cls(artifact.matrix, artifact.students, artifact.exercises, themes, sub_themes, url_params,
+                   observed=artifact.observed, classes=artifact.classes)
+
+    def students_of_class(self, class_name: Any) -> List[str]:
+        """Names of the students of a class"""
+        return [student for student, classe in zip(self.students, self.classes) if classe == class_name]
+
+    def recommend(self, student: str, k: int = 5, band: Tuple[float, float] = (0.4, 0.8),
+                  theme: Optional[str] = None, sub_theme: Optional[str] = None,
+                  include_observed: bool = False) -> List[Recommendation]:
+        """
+        Top-k exercises for a student in a target predicted-score band.
+
+        Args:
+            student (str): Student name.
+            k (int): Maximum number of recommendations.
+            band (Tuple[float, float]): Inclusive (low, high) predicted-score band.
+            theme (str, optional): Only recommend exercises of this theme.
+            sub_theme (str, optional): Only recommend exercises of this sub-theme.
+            include_observed (bool): Also recommend exercises the student already did.
+
+        Returns:
+            List[Recommendation]: Recommendations, best first.
+        """
+        i = self.student_index[student]
+        low, high = band
+        row = self.completed[i]
+        eligible = (row >= low) & (row <= high) & self._theme_mask(theme, sub_theme)
+        if not include_observed:
+            eligible &= ~self.observed[i]
+
+        candidates = np.flatnonzero(eligible)
+        distance = np.abs(row[candidates] - (low + high) / 2)
+        if candidates.size > k:
+            best = np.argpartition(distance, k - 1)[:k]
+            candidates, distance = candidates[best], distance[best]
+        return [self._recommendation(row, j) for j in candidates[np.argsort(distance, kind="stable")]]
+
+    def recommend_many(self, students: Sequence[str], k: int = 5, band: Tuple[float, float] = (0.4, 0.8),
+                       theme: Optional[str] = None, sub_theme: Optional[str] = None,
+                       include_observed: bool = False) -> Dict[str, List[Recommendation]]:
+        """
+        Top-k exercises for several students (e.g. a class) in one vectorized pass.
+
+        Takes the same arguments as recommend, with a list of student names.
+
+        Returns:
+            Dict[str, List[Recommendation]]: Recommendations of each student, best first.
+        """
+        if not students:
+            return {}
+        rows_index = np.fromiter((self.student_index[s] for s in students), dtype=np.intp, count=len(students))
+        low, high = band
+        rows = self.completed[rows_index]
+        eligible = (rows >= low) & (rows <= high) & self._theme_mask(theme, sub_theme)
+        if not include_observed:
+            eligible &= ~self.observed[rows_index]
+
+        distance = np.where(eligible, np.abs(rows - (low + high) / 2), np.inf)
+        k = min(k, distance.shape[1])
+        if k <= 0:
+            return {student: [] for student in students}
+        top = np.argpartition(distance, k - 1, axis=1)[:, :k]
+        top_distance = np.take_along_axis(distance, top, axis=1)
+        order = np.argsort(top_distance, axis=1, kind="stable")
+        top = np.take_along_axis(top, order, axis=1)
+        top_distance = np.take_along_axis(top_distance, order, axis=1)
+
+        return {
+            student: [self._recommendation(rows[n], j) for j in top[n][np.isfinite(top_distance[n])]]
+            for n, student in enumerate(students)
+        }
+
+    def recommend_class(self, class_name: Any, **kwargs) -> Dict[str, List[Recommendation]]:
+        """Recommendations for every student of a class (see recommend_many)"""
+        return self.recommend_many(self.students_of_class(class_name), **kwargs)
+
+    def _theme_mask(self, theme: Optional[str], sub_theme: Optional[str]) -> np.ndarray:
+        """Boolean mask of the exercises matching the theme filters (cached)"""
+        if theme is None and sub_theme is None:
+            return self._all_exercises
+        key = (theme, sub_theme)
+        if key not in self._theme_masks:
+            mask = self._all_exercises.copy()
+            if theme is not None:
+                mask &= self.themes == theme
+            if sub_theme is not None:
+                mask &= self.sub_themes == sub_theme
+            self._theme_masks[key] = mask
+        return self._theme_masks[key]
+
+    def _recommendation(self, row: np.ndarray, j: int) -> Recommendation:
+        return Recommendation(
+            super_id=self.exercises[j],
+            predicted_score=float(row[j]),
+            theme=self.themes[j],
+            sub_theme=self.sub_themes[j],
+            url_params=self.url_params[j],
+        )
+
+
+def load_exercise_catalog(exercices_csv_path: str) -> Tuple[Dict[str, Dict], Dict[str, Dict]]:
+    """
+    Load exercices.csv indexed by uuid and by reference.
+
+    Returns:
+        Tuple[Dict[str, Dict], Dict[str, Dict]]: (rows by uuid, rows by ref), empty if the file is missing.
+    """
+    by_uuid, by_ref = {}, {}
+    if not os.path.exists(exercices_csv_path):
+        return by_uuid, by_ref
+    with open(exercices_csv_path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            by_uuid.setdefault(row["uuid"], row)
+            by_ref.setdefault(row["refs"], row)
+    return by_uuid, by_ref
+
+
+def _exercise_metadata(exercises: Sequence[str], synthesis_data: Dict[str, Any], exercices_csv_path: str):
+    """Theme, sub-theme and URL parameters of each exercise"""
+    catalog_by_uuid, catalog_by_ref = load_exercise_catalog(exercices_csv_path)
+    themes, sub_themes, url_params = [], [], []
+    for super_id in exercises:
+        info = synthesis_data.get("exercises", {}).get(super_id, {})
+        entry = catalog_by_uuid.get(info.get("uuid")) or catalog_by_ref.get(
+            info.get("id", super_id.split("_")[0]), {}
+        )
+        themes.append(entry.get("theme", UNKNOWN))
+        sub_themes.append(entry.get("sub_theme", UNKNOWN))
+        url_params.append(_url_params(info))
+    return themes, sub_themes, url_params
+
+
+def _url_params(exercise_info: Dict[str, Any]) -> Optional[UrlParamsModel]:
+    """URL parameters of a synthesized exercise, or None when they are incomplete"""
+    try:
+        return UrlParamsModel(**exercise_info)
+    except ValidationError:
+        return None
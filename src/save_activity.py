@@ -1,53 +1,89 @@
+import argparse
+import logging
 import os
-import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
 from src.config import Config
 from src.db.data_processor import DataProcessor, URLProcessor, DataAnalyzer
 from src.db.json_utils import generate_json_data, update_or_create_json
 from src.db.data_processing import process_and_analyze_data
-from src.user_interaction import get_optional_tags
+from src.db.fingerprint import compute_fingerprint, is_up_to_date, save_fingerprint
+from src.instrumentation import activate, add_instrumentation_arguments, report_options_from_args, stage
+from src.user_interaction import get_optional_tags, load_tags_manifest, parse_tag_options
 
 from src.models.url_model import UrlParamsModel
 
-def process_single_activity(config, activity):
+def process_single_activity(config, activity, tags=None, force=False, report_options=None):
+    """
+    Process one activity and save its results.
+
+    When tags is None the tags are asked interactively, before the fingerprint is
+    computed, otherwise they are used as is. The activity is skipped, and its existing
+    results kept, when its inputs, configuration and tags have not changed since the
+    last run, unless force is set.
+    With report_options, the stages of the run are measured and the run report is
+    saved next to the results (profiles too, for the profiled stages).
+    Returns True on success (or skip), False on failure.
+    """
     activity_dir = os.path.join(config.activity_dir, activity)
     source_data_dir = os.path.join(activity_dir, "source_data")
 
     if not os.path.exists(activity_dir):
         print(f"Error: Activity folder '{activity}' does not exist in {config.activity_dir}")
-        return
+        return False
 
     if not os.path.exists(source_data_dir):
         print(f"Error: 'source_data' folder does not exist in {activity_dir}")
-        return
+        return False
+
+    # Les tags font partie de l'empreinte : ils sont demandés avant
+    if tags is None:
+        tags = ask_activity_tags(activity)
+
+    output_dir = os.path.join(config.activity_dir, activity, config.final_data_dir)
+    fingerprint = compute_fingerprint(source_data_dir, config, tags)
+    if not force and is_up_to_date(output_dir, config, fingerprint):
+        print(f"Activity {activity} is unchanged since its last processing, skipping (use --force to rebuild)")
+        return True
 
     print(f"Processing data for activity: {activity}")
 
+    report = report_options.new_report(activity, profile_dir=output_dir) if report_options else None
+    with activate(report):
+        success = _process_activity_data(config, activity, source_data_dir, output_dir, fingerprint, tags)
+    if report is not None and success:
+        report_path = os.path.join(output_dir, config.run_report_filename)
+        report.write(report_path)
+        logging.getLogger(__name__).info(report.summary())
+        print(f"Run report: {report_path}")
+    return success
+
+def _process_activity_data(config, activity, source_data_dir, output_dir, fingerprint, tags):
     try:
         final_df, url_infos = process_and_analyze_data(source_data_dir, config)
 
-        # Get optional tags from user
-        print(f"Enter optional tags for the activity {activity}:")
-        tags = get_optional_tags()
-
-        # Generate JSON data
-        url_infos = [UrlParamsModel(**url_info) for url_info in url_infos]
-        json_data = generate_json_data(final_df, tags, url_infos)
-
         # Prepare output directory
-        output_dir = os.path.join(config.activity_dir, activity, config.final_data_dir)
         os.makedirs(output_dir, exist_ok=True)
 
         # Save CSV
         csv_output_path = os.path.join(output_dir, config.resultat_csv_filename)
-        final_df.to_csv(csv_output_path, index=False)
+        with stage("csv_export") as record:
+            final_df.to_csv(csv_output_path, index=False)
+            record.set_shape(final_df.shape)
 
-        # Save or update JSON
+        # Generate JSON data, then save or update JSON
         json_output_path = os.path.join(output_dir, f"{os.path.splitext(config.resultat_csv_filename)[0]}.json")
-        update_or_create_json(json_output_path, json_data)
+        with stage("json_export") as record:
+            url_infos = [UrlParamsModel(**url_info) for url_info in url_infos]
+            json_data = generate_json_data(final_df, tags, url_infos)
+            update_or_create_json(json_output_path, json_data)
+            record.set_shape(final_df.shape)
+        save_fingerprint(output_dir, config, fingerprint)
 
         print(f"Data successfully processed and saved to:")
         print(f"CSV: {csv_output_path}")
         print(f"JSON: {json_output_path}")
+        return True
 
     except FileNotFoundError as e:
         print(f"Error: File not found - {e}")
@@ -55,21 +91,94 @@ def process_single_activity(config, activity):
         print(f"Error: An unexpected error occurred - {str(e)}")
         import traceback
         traceback.print_exc()
+    return False
+
+def ask_activity_tags(activity, cli_tags=None):
+    """Tags of an activity in interactive mode: asked to the user, overridden by the command-line tags"""
+    print(f"Enter optional tags for the activity {activity}:")
+    tags = get_optional_tags()
+    tags.update(cli_tags or {})
+    return tags
+
+def get_activity_tags(config, activity, cli_tags=None):
+    """Tags of an activity in batch mode: its manifest, overridden by the command-line tags"""
+    manifest_path = os.path.join(config.activity_dir, activity, config.tags_manifest_filename)
+    tags = load_tags_manifest(manifest_path)
+    tags.update(cli_tags or {})
+    return tags
+
+def process_activity_job(config, activity, cli_tags, force=False, report_options=None):
+    """Non-interactive processing of one activity in a worker process"""
+    start = time.perf_counter()
+    config.activity = activity
+    try:
+        tags = get_activity_tags(config, activity, cli_tags)
+        success = process_single_activity(config, activity, tags, force, report_options)
+        error = None if success else "processing failed (see log above)"
+    except Exception as e:
+        success, error = False, str(e)
+    return activity, success, error, time.perf_counter() - start
+
+def process_activities_batch(config, activities, cli_tags=None, workers=None, force=False, report_options=None):
+    """
+    Process activities concurrently without prompting, then print a summary.
+
+    Returns the list of (activity, success, error, seconds) results.
+    """
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(process_activity_job, config, activity, cli_tags, force, report_options)
+                   for activity in activities]
+        results = [future.result() for future in futures]
+
+    print("\nBatch summary:")
+    for activity, success, error, seconds in results:
+        status = "OK" if success else f"FAILED - {error}"
+        print(f"  {activity}: {status} ({seconds:.1f}s)")
+    n_failed = sum(1 for _, success, _, _ in results if not success)
+    print(f"{len(results) - n_failed} succeeded, {n_failed} failed")
+    return results
 
 def main():
+    parser = argparse.ArgumentParser(description="Process MathALEA activity results")
+    parser.add_argument("activity", nargs="?", help="Activity to process (default: all activities)")
+    parser.add_argument("--batch", action="store_true",
+                        help="Process concurrently without prompting; tags come from each activity's "
+                             "tags manifest and --tag options")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes in batch mode")
+    parser.add_argument("--tag", action="append", default=[], metavar="KEY=VALUE",
+                        help="Tag added to every activity, over the tags of its manifest in batch mode "
+                             "or the tags entered otherwise (repeatable)")
+    parser.add_argument("--force", action="store_true",
+                        help="Rebuild activities even if their inputs did not change")
+    add_instrumentation_arguments(parser)
+    args = parser.parse_args()
+    logging.basicConfig(level=args.log_level, format='%(asctime)s - %(levelname)s - %(message)s')
+    report_options = report_options_from_args(args)
+    try:
+        cli_tags = parse_tag_options(args.tag)
+    except ValueError as e:
+        parser.error(str(e))
+
+    config = Config()
+
     # Check if an activity is provided as a command-line argument
-    if len(sys.argv) > 1:
-        activities = [sys.argv[1]]
+    if args.activity:
+        activities = [args.activity]
     else:
-        config = Config()
         activities = [d for d in os.listdir(config.activity_dir) 
                       if os.path.isdir(os.path.join(config.activity_dir, d))]
 
-    config = Config()
+    if args.batch:
+        results = process_activities_batch(config, activities, cli_tags, args.workers,
+                                           args.force, report_options)
+        if not all(success for _, success, _, _ in results):
+            raise SystemExit(1)
+        return
 
     for activity in activities:
         config.activity = activity
-        process_single_activity(config, activity)
+        process_single_activity(config, activity, ask_activity_tags(activity, cli_tags), args.force,
+                                report_options)
 
 if __name__ == "__main__":
     main()
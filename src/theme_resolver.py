@@ -0,0 +1,101 @@
+"""
+Theme Resolver Module
+
+This module maps exercise references to their theme and sub-theme from themes.json.
+The themes are loaded once and indexed by key, and the sub-themes of each theme by
+a prefix trie, so resolving a reference costs O(len(ref)) instead of a scan of every
+theme and sub-theme.
+
+Classes:
+    ThemeResolver: Resolves exercise references to themes and sub-themes.
+"""
+
+import json
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+UNKNOWN = "Unknown"
+
+# Marque, dans un nœud du trie, le rang et la valeur du sous-thème qui s'y termine
+_TERMINAL = ""
+
+
+class ThemeResolver:
+    """
+    Resolve exercise references to their theme and sub-theme.
+
+    The rules are those of ExerciseManager.process_exercise_reference: the theme is
+    the first key, in file order, that starts with the level (ref[0]) and is a prefix
+    of ref[:3]; the sub-theme is the first key of that theme's sousThemes, in file
+    order, that is a prefix of the reference.
+
+    Attributes:
+        themes (Dict[str, Tuple[int, str, Dict]]): Rank, title and sub-theme trie of each theme key.
+    """
+
+    def __init__(self, themes_data: Dict[str, Any]):
+        """
+        Index the themes.
+
+        Args:
+            themes_data (Dict[str, Any]): Content of themes.json.
+        """
+        self.themes = {}
+        for rank, (key, value) in enumerate(themes_data.items()):
+            # Une clé vide ou plus longue que ref[:3] ne peut jamais correspondre
+            if key and len(key) <= 3:
+                self.themes[key] = (rank, value['titre'], self._build_trie(value['sousThemes']))
+
+    @classmethod
+    def from_file(cls, themes_json_path: str) -> "ThemeResolver":
+        """Load and index themes.json"""
+        with open(themes_json_path, 'r', encoding='utf-8') as f:
+            return cls(json.load(f))
+
+    def resolve(self, ref: str) -> Dict[str, str]:
+        """
+        Theme and sub-theme of an exercise reference.
+
+        Args:
+            ref (str): Exercise reference, e.g. "6C10".
+
+        Returns:
+            Dict[str, str]: {'theme': ..., 'sub_theme': ...}, "Unknown" when not found.
+        """
+        match = None
+        for length in range(1, min(len(ref), 3) + 1):
+            candidate = self.themes.get(ref[:length])
+            if candidate is not None and (match is None or candidate[0] < match[0]):
+                match = candidate
+        if match is None:
+            return {'theme': UNKNOWN, 'sub_theme': UNKNOWN}
+        _, theme, trie = match
+        sub_theme = self._first_prefix(trie, ref)
+        return {'theme': theme, 'sub_theme': UNKNOWN if sub_theme is None else sub_theme}
+
+    def resolve_many(self, refs: Iterable[str]) -> List[Dict[str, str]]:
+        """Theme and sub-theme of each reference (see resolve)"""
+        return [self.resolve(ref) for ref in refs]
+
+    @staticmethod
+    def _build_trie(sub_themes: Dict[str, str]) -> Dict[str, Any]:
+        trie = {}
+        for rank, (sub_key, sub_value) in enumerate(sub_themes.items()):
+            node = trie
+            for char in sub_key:
+                node = node.setdefault(char, {})
+            node[_TERMINAL] = (rank, sub_value)
+        return trie
+
+    @staticmethod
+    def _first_prefix(trie: Dict[str, Any], ref: str) -> Optional[str]:
+        """Value of the earliest-ranked sub-theme key that is a prefix of ref, or None"""
+        best: Optional[Tuple[int, str]] = trie.get(_TERMINAL)
+        node = trie
+        for char in ref:
+            node = node.get(char)
+            if node is None:
+                break
+            terminal = node.get(_TERMINAL)
+            if terminal is not None and (best is None or terminal[0] < best[0]):
+                best = terminal
+        return best[1] if best is not None else None
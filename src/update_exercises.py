@@ -16,9 +16,14 @@ import os
 import json
 import csv
 import logging
-from typing import Dict, Any
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Iterable, Iterator, Tuple
 import requests
 from src.config import Config
+from src.http_cache import CachedHttpClient
+from src.instrumentation import RunReport, activate, stage, submit_in_context
+from src.json_stream import iter_ref_records
+from src.theme_resolver import ThemeResolver
 
 logger = logging.getLogger(__name__)
 
@@ -34,6 +39,7 @@ class ExerciseManager:
         exercices_json_path (str): Path to the JSON file storing exercise data.
         exercices_csv_path (str): Path to the CSV file for storing interactive exercises.
         themes_json_path (str): Path to the JSON file storing themes data.
+        http (CachedHttpClient): Client used to download the remote catalogs.
     """
 
     def __init__(self, config: Config):
@@ -47,13 +53,23 @@ class ExerciseManager:
         self.exercices_json_path = os.path.join(config.data_dir, config.exercices_dir, config.exercices_json_filename)
         self.exercices_csv_path = os.path.join(config.data_dir, config.exercices_dir, 'exercices.csv')
         self.themes_json_path = os.path.join(config.data_dir, config.exercices_dir, 'themes.json')
+        self.http = CachedHttpClient(
+            os.path.join(config.data_dir, config.exercices_dir, config.http_cache_dirname),
+            timeout=config.http_timeout,
+            pool_size=config.http_pool_size,
+        )
+        self._theme_resolver = None
+
+    def catalog_url(self, filename: str) -> str:
+        """URL of a remote catalog file under config.catalog_base_url"""
+        return f"{self.config.catalog_base_url.rstrip('/')}/{filename}"
 
     def process_exercices_all_json(self, exercices: Dict[str, Any]) -> Dict[str, Any]:
         """
         Process the raw JSON data of exercises into a simplified dictionary format.
 
-        This method recursively searches through the input dictionary to find
-        exercise entries and restructures them into a flat dictionary with
+        This method walks the input dictionary depth-first with an explicit stack
+        to find exercise entries and restructures them into a flat dictionary with
         exercise references as keys.
 
         Args:
@@ -63,42 +79,52 @@ class ExerciseManager:
             Dict[str, Any]: Processed dictionary with exercise references as keys.
         """
         result = {}
-
-        def process_item(item: Any):
-            """
-            Recursively process items in the exercise dictionary.
-
-            Args:
-                item (Any): The current item being processed.
-            """
+        # Les enfants sont empilés à l'envers pour être visités dans l'ordre du document
+        stack = [exercices]
+        while stack:
+            item = stack.pop()
             if isinstance(item, dict):
-                for key, value in item.items():
+                for value in reversed(list(item.values())):
                     if isinstance(value, dict) and "ref" in value:
-                        result[value["ref"]] = value
+                        stack.append(_Record(value))
                     else:
-                        process_item(value)
+                        stack.append(value)
             elif isinstance(item, list):
-                for element in item:
-                    process_item(element)
-
-        process_item(exercices)
+                stack.extend(reversed(item))
+            elif isinstance(item, _Record):
+                result[item.value["ref"]] = item.value
         return result
 
+    def iter_latest_exercices(self) -> Iterator[Tuple[Any, Dict[str, Any]]]:
+        """
+        Stream the exercises of the latest allExercice.json.
+
+        The catalog is revalidated through the HTTP cache, then parsed incrementally
+        from the cached file, so only one exercise record is in memory at a time.
+
+        Yields:
+            Tuple[Any, Dict[str, Any]]: (reference, exercise) pairs.
+
+        Raises:
+            requests.RequestException: If the catalog cannot be fetched and is not cached.
+            ValueError: If the catalog is not valid JSON.
+        """
+        response = self.http.get(self.catalog_url("allExercice.json"))
+        return iter_ref_records(response.path)
+
     def fetch_latest_exercices(self) -> Dict[str, Any]:
         """
         Fetch the latest exercises from the remote source.
 
-        This method sends a GET request to the specified URL and processes
-        the returned JSON data.
+        This method revalidates the cached allExercice.json (downloading it only
+        if it changed, or falling back to the cached copy when offline) and
+        processes the JSON data.
 
         Returns:
             Dict[str, Any]: Processed dictionary of latest exercises, or an empty dict if an error occurs.
         """
-        url = "https://forge.apps.education.fr/coopmaths/mathalea/-/raw/main/src/json/allExercice.json"
         try:
-            response = requests.get(url)
-            response.raise_for_status()
-            return self.process_exercices_all_json(response.json())
+            return self.process_exercices_all_json(self.http.get_json(self.catalog_url("allExercice.json")))
         except requests.RequestException as e:
             logger.error(f"Error fetching exercises: {e}")
             return {}
@@ -110,32 +136,70 @@ class ExerciseManager:
         """
         Update the local JSON file with the latest exercises.
 
-        This method fetches the latest exercises and writes them to the local JSON file.
-        If the fetch operation fails, no update is performed.
+        This method streams the latest exercises into the local JSON file. If the
+        fetch operation fails, or the catalog holds no exercise, no update is performed.
         """
         logger.info(f"Updating exercises from {self.exercices_json_path}")
-        
-        latest_exercices = self.fetch_latest_exercices()
-        if not latest_exercices:
+
+        try:
+            written = self.write_exercices_json(self.iter_latest_exercices())
+        except requests.RequestException as e:
+            logger.error(f"Error fetching exercises: {e}")
+            return
+        except ValueError as e:
+            logger.error(f"Error decoding JSON response: {e}")
+            return
+        if not written:
             return
 
-        with open(self.exercices_json_path, 'w') as f:
-            json.dump(latest_exercices, f, indent=4)
+        logger.info(f"{written} exercises updated successfully to {self.exercices_json_path}")
 
-        logger.info(f"Exercises updated successfully to {self.exercices_json_path}")
+    def write_exercices_json(self, exercices: Iterable[Tuple[Any, Dict[str, Any]]]) -> int:
+        """
+        Write (reference, exercise) pairs to the local JSON file as they come.
+
+        The output is the same as json.dump of the whole dictionary with indent=4. It is
+        written next to the target and renamed over it once complete, so the previous
+        file stays in place if the stream fails or is empty.
 
-    def create_themes_json(self):
+        Args:
+            exercices (Iterable[Tuple[Any, Dict[str, Any]]]): Exercises to write.
+
+        Returns:
+            int: Number of exercises written.
+        """
+        tmp_path = f"{self.exercices_json_path}.tmp"
+        written = 0
+        try:
+            with open(tmp_path, 'w') as f:
+                for ref, exercice in exercices:
+                    f.write("{\n    " if not written else ",\n    ")
+                    f.write(json.dumps(ref if isinstance(ref, str) else json.dumps(ref)))
+                    f.write(": ")
+                    f.write(json.dumps(exercice, indent=4).replace("\n", "\n    "))
+                    written += 1
+                f.write("\n}" if written else "{}")
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        if written:
+            os.replace(tmp_path, self.exercices_json_path)
+        else:
+            os.remove(tmp_path)
+        return written
+
+    def create_themes_json(self) -> bool:
         """
         Create a themes.json file based on the levelsThemesList.json from the remote source.
 
         This method fetches the JSON data from the specified URL, processes it to extract
         themes and sub-themes, and writes the result to a themes.json file.
+
+        Returns:
+            bool: Whether themes.json was written.
         """
-        url = "https://forge.apps.education.fr/coopmaths/mathalea/-/raw/main/src/json/levelsThemesList.json"
         try:
-            response = requests.get(url)
-            response.raise_for_status()
-            data = response.json()
+            data = self.http.get_json(self.catalog_url("levelsThemesList.json"))
 
             themes = {}
             for key, value in data.items():
@@ -147,43 +211,33 @@ class ExerciseManager:
 
             with open(self.themes_json_path, 'w', encoding='utf-8') as f:
                 json.dump(themes, f, ensure_ascii=False, indent=2)
+            self._theme_resolver = None
 
             logger.info(f"Themes JSON file created successfully: {self.themes_json_path}")
+            return True
         except requests.RequestException as e:
             logger.error(f"Error fetching themes data: {e}")
         except json.JSONDecodeError:
             logger.error("Error decoding JSON response for themes")
         except IOError as e:
             logger.error(f"Error writing themes JSON file: {e}")
+        return False
+
 
+    def theme_resolver(self) -> ThemeResolver:
+        """
+        Theme resolver over themes.json, loaded on first use.
+
+        Returns:
+            ThemeResolver: The resolver, rebuilt after create_themes_json rewrites the file.
+        """
+        if self._theme_resolver is None:
+            self._theme_resolver = ThemeResolver.from_file(self.themes_json_path)
+        return self._theme_resolver
 
     def process_exercise_reference(self, ref):
-        # Charge les données de thèmes
-        with open(self.themes_json_path, 'r', encoding='utf-8') as f:
-            themes_data = json.load(f)
-
-        theme = "Unknown"
-        sub_theme = "Unknown"
-
-        # Extrait le niveau et la clé de thème
-        level = ref[0]
-        theme_key = ref[:3]
-
-        # Cherche le thème correspondant pour le niveau
-        for key, value in themes_data.items():
-            if key.startswith(level) and theme_key.startswith(key):
-                theme = value['titre']
-                # Cherche le sous-thème correspondant
-                for sub_key, sub_value in value['sousThemes'].items():
-                    if ref.startswith(sub_key):
-                        sub_theme = sub_value
-                        break
-                break
-
-        return {
-            'theme': theme,
-            'sub_theme': sub_theme
-        }
+        # Le fichier des thèmes est chargé et indexé une seule fois
+        return self.theme_resolver().resolve(ref)
 
     def create_exercices_csv(self):
         """
@@ -200,11 +254,12 @@ class ExerciseManager:
             logger.error(f"JSON file not found: {self.exercices_json_path}")
             return
 
+        interactive = [(ref, data) for ref, data in exercices.items() if data.get('tags', {}).get('interactif') == True]
+        theme_infos = self.theme_resolver().resolve_many(ref for ref, _ in interactive)
+
         csv_data = [['refs', 'titre', 'uuid', 'theme', 'sub_theme']]
-        for ref, data in exercices.items():
-            if data.get('tags', {}).get('interactif') == True:
-                theme_info = self.process_exercise_reference(ref)
-                csv_data.append([ref, data['titre'], data['uuid'], theme_info['theme'], theme_info['sub_theme']])
+        for (ref, data), theme_info in zip(interactive, theme_infos):
+            csv_data.append([ref, data['titre'], data['uuid'], theme_info['theme'], theme_info['sub_theme']])
 
         try:
             with open(self.exercices_csv_path, 'w', newline='', encoding='utf-8') as csv_file:
@@ -214,19 +269,109 @@ class ExerciseManager:
         except IOError as e:
             logger.error(f"Error writing CSV file: {e}")
 
+    def refresh_catalogs(self) -> RunReport:
+        """
+        Refresh exercices.json, themes.json and exercices.csv in one pipeline.
+
+        Both catalogs are fetched concurrently through the pooled HTTP client. The
+        theme index is built as soon as the themes arrive, and the exercise catalog
+        is streamed once: each record goes to exercices.json and, if it is
+        interactive, straight to exercices.csv. The CSV only waits for the theme
+        index when it reaches its first interactive exercise. If the exercise catalog
+        cannot be fetched, the CSV is rebuilt from the existing exercices.json, as
+        create_exercices_csv does.
+
+        Returns:
+            RunReport: Wall time of each stage, nested under the total.
+        """
+        report = RunReport("catalog_refresh")
+
+        def fetch_exercices():
+            with stage('fetch_exercices'):
+                return self.http.get(self.catalog_url("allExercice.json"))
+
+        def fetch_themes():
+            with stage('fetch_themes'):
+                written = self.create_themes_json()
+            if not written and not os.path.exists(self.themes_json_path):
+                return None
+            with stage('theme_index'):
+                return self.theme_resolver()
+
+        with activate(report), stage('total'), ThreadPoolExecutor(max_workers=2) as executor:
+            exercices_future = submit_in_context(executor, fetch_exercices)
+            themes_future = submit_in_context(executor, fetch_themes)
+            try:
+                catalog = exercices_future.result()
+            except requests.RequestException as e:
+                logger.error(f"Error fetching exercises: {e}")
+                catalog = None
+
+            if catalog is None:
+                if themes_future.result() is not None:
+                    with stage('create_csv'):
+                        self.create_exercices_csv()
+            else:
+                with stage('stream_outputs'):
+                    self._stream_catalog(iter_ref_records(catalog.path), themes_future)
+
+        logger.info(report.summary())
+        return report
+
+    def _stream_catalog(self, records: Iterator[Tuple[Any, Dict[str, Any]]], themes_future) -> None:
+        """Write exercices.json and exercices.csv from a single pass over the records"""
+        tmp_csv_path = f"{self.exercices_csv_path}.tmp"
+        with open(tmp_csv_path, 'w', newline='', encoding='utf-8') as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(['refs', 'titre', 'uuid', 'theme', 'sub_theme'])
+            resolver = None
+
+            def tee():
+                nonlocal resolver
+                for ref, data in records:
+                    if data.get('tags', {}).get('interactif') == True:
+                        if resolver is None:
+                            # Premier exercice interactif : il faut l'index des thèmes
+                            resolver = themes_future.result()
+                            if resolver is None:
+                                raise FileNotFoundError(f"Themes file not found: {self.themes_json_path}")
+                        theme_info = resolver.resolve(ref)
+                        writer.writerow([ref, data['titre'], data['uuid'], theme_info['theme'], theme_info['sub_theme']])
+                    yield ref, data
+
+            try:
+                written = self.write_exercices_json(tee())
+            except (ValueError, IOError) as e:
+                logger.error(f"Error streaming the exercise catalog: {e}")
+                written = 0
+        if not written:
+            os.remove(tmp_csv_path)
+            return
+        os.replace(tmp_csv_path, self.exercices_csv_path)
+        logger.info(f"{written} exercises updated successfully to {self.exercices_json_path}")
+        logger.info(f"CSV file with interactive exercises created successfully: {self.exercices_csv_path}")
+
+
+class _Record:
+    """Exercise found by process_exercices_all_json, kept on the walk stack until its turn"""
+    __slots__ = ("value",)
+
+    def __init__(self, value: Dict[str, Any]):
+        self.value = value
+
+
 def main():
     """
     Main function to run the exercise update and file creation processes.
 
     This function initializes logging, creates an ExerciseManager instance,
-    and calls the methods to update exercises, create the themes JSON file, and create the CSV file.
+    and refreshes the exercises JSON, themes JSON and CSV files in one concurrent pipeline.
     """
     logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
     config = Config()
     manager = ExerciseManager(config)
-    manager.update_exercices()
-    manager.create_themes_json()
-    manager.create_exercices_csv()
+    manager.refresh_catalogs()
+    manager.http.close()
 
 if __name__ == "__main__":
     main()
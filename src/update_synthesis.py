@@ -1,121 +1,174 @@
+import argparse
 import json
-import sys
+import logging
 import os
-import csv
-from collections import defaultdict
-from datetime import datetime
 from src.config import Config
-
-
-def update_synthesis_files(synthesis_csv, synthesis_json, new_json, activity_name):
-    # Charger les données existantes
-    try:
-        with open(synthesis_json, 'r') as f:
-            synthesis_data = json.load(f)
-    except FileNotFoundError:
-        synthesis_data = {
-            "tags": {},
-            "exercises": {},
-            "students": {},
-            "metadata": {
-                "created_at": datetime.now().isoformat(),
-                "updated_at": datetime.now().isoformat(),
-                "synthesized_activities": []
-            }
-        }
-
-    # Charger les nouvelles données
-    with open(new_json, 'r') as f:
-        new_data = json.load(f)
-
-    # Vérifier si l'activité a déjà été synthétisée
-    # Si oui, demander à l'utilisateur s'il veut continuer
-    if activity_name in synthesis_data['metadata']['synthesized_activities']:
-        print(f"L'activité {activity_name} a déjà été synthétisée. Voulez-vous continuer ? (o-y/n")
-        response = input()
-        if response.lower() not in ['o', 'y']:
-            return
-        
-
-    # Mettre à jour les exercices
-    for exercise_id, exercise_info in new_data['exercises'].items():
-        if  exercise_id not in synthesis_data['exercises']:
-            synthesis_data['exercises'][exercise_id] = exercise_info
-            synthesis_data['exercises'][exercise_id]['activities'] = [activity_name]
+from src.db.synthesis_backend import SYNTHESIS_BACKENDS, record_backend, recorded_backend, writer_backend
+from src.db.synthesis_journal import SynthesisJournal
+from src.db.synthesis_sqlite import SynthesisDatabase
+from src.db.synthesis_store import SynthesisStore
+from src.db.synthesis_utils import (
+    is_legacy_activity,
+    load_synthesis,
+    merge_activity,
+    update_statistics,
+    write_synthesis_csv,
+    write_synthesis_json,
+)
+from src.instrumentation import activate, add_instrumentation_arguments, report_options_from_args, stage
+
+
+def _report_resynthesis(synthesis_data, activity_name, force=False):
+    # Une activité déjà synthétisée remplace sa contribution précédente ; celles
+    # fusionnées avant le suivi des contributions ne sont rajoutées qu'avec --force
+    if activity_name in synthesis_data.get('contributions', {}):
+        print(f"L'activité {activity_name} a déjà été synthétisée : sa contribution est remplacée")
+    elif is_legacy_activity(synthesis_data, activity_name):
+        if force:
+            print(f"L'activité {activity_name} a été synthétisée avant le suivi des contributions : "
+                  f"ses scores s'ajoutent aux précédents")
         else:
-            synthesis_data['exercises'][exercise_id]['n'] += exercise_info['n']
-            if activity_name not in synthesis_data['exercises'][exercise_id]['activities']:
-                synthesis_data['exercises'][exercise_id]['activities'].append(activity_name)
-            # Mise à jour de la moyenne glissante
-            old_avg = synthesis_data['exercises'][exercise_id]['average_score']
-            old_n = int(synthesis_data['exercises'][exercise_id]['n']) - int(exercise_info['n'])
-            new_avg = exercise_info['average_score']
-            updated_avg = (old_avg * old_n + new_avg * exercise_info['n']) / synthesis_data['exercises'][exercise_id]['n']
-            synthesis_data['exercises'][exercise_id]['average_score'] = updated_avg
-
-    # Mettre à jour les étudiants
-    for student, student_info in new_data['students'].items():
-        if student not in synthesis_data['students']:
-            synthesis_data['students'][student] = student_info
-            synthesis_data['students'][student]['activities'] = [activity_name]
-        else:
-            if activity_name not in synthesis_data['students'][student]['activities']:
-                synthesis_data['students'][student]['activities'].append(activity_name)
-            for exercise_id, score in student_info['scores'].items():
-                if exercise_id not in synthesis_data['students'][student]['scores']:
-                    synthesis_data['students'][student]['scores'][exercise_id] = score
-                else:
-                    # Mise à jour de la moyenne glissante pour le score de l'étudiant
-                    old_score = synthesis_data['students'][student]['scores'][exercise_id]
-                    n = synthesis_data['exercises'][exercise_id]['n']
-                    updated_score = (old_score * (n-1) + score) / n
-                    synthesis_data['students'][student]['scores'][exercise_id] = updated_score
+            print(f"L'activité {activity_name} a été synthétisée avant le suivi des contributions : "
+                  f"ignorée (--force pour ajouter ses scores aux précédents)")
 
-    # Calculer la somme de tous les "n" des exercices
-    total_n = sum(exercise['n'] for exercise in synthesis_data['exercises'].values())
 
-    # Mettre à jour les métadonnées
-    synthesis_data['metadata']['updated_at'] = datetime.now().isoformat()
-    synthesis_data['metadata']['synthesized_activities'].append(activity_name)
-    synthesis_data['metadata']['total_n'] = total_n
+def update_synthesis_files(synthesis_csv, synthesis_json, new_json, activity_name, force=False):
+    update_synthesis_batch(synthesis_csv, synthesis_json, [(activity_name, new_json)], force=force)
 
-    # Calculer des statistiques globales
-    total_exercises = len(synthesis_data['exercises'])
-    total_students = len(synthesis_data['students'])
-    average_score_all_exercises = sum(ex['average_score'] for ex in synthesis_data['exercises'].values()) / total_exercises
 
-    synthesis_data['metadata']['statistics'] = {
-        'total_exercises': total_exercises,
-        'total_students': total_students,
-        'average_score_all_exercises': average_score_all_exercises,
-        'total_n': total_n
-    }
-    
+def update_synthesis_batch(synthesis_csv, synthesis_json, activity_jsons, store_dir=None,
+                           export_formats=("json", "csv"), force=False):
+    """
+    Merge several activities into the synthesis in a single pass.
 
-    # Sauvegarder le JSON mis à jour
-    with open(synthesis_json, 'w') as f:
-        json.dump(synthesis_data, f, indent=2)
+    The synthesis is loaded once, every activity's resultat.json is merged in memory
+    and the outputs are written once at the end.
 
-    # Mettre à jour le CSV
-    headers = ['Élève', 'Classe', 'Groupe'] + list(synthesis_data['exercises'].keys())
-    rows = []
-    for student, student_info in synthesis_data['students'].items():
-        row = [student, student_info['class'], student_info['group']]
-        for exercise_id in synthesis_data['exercises'].keys():
-            row.append(student_info['scores'].get(exercise_id, ''))
-        rows.append(row)
+    Without store_dir, synthesis.json is the primary copy and both synthesis.json and
+    synthesis.csv are rewritten. With store_dir, the columnar store is the primary
+    copy (initialised from synthesis.json the first time) and synthesis.json /
+    synthesis.csv are only exported for the formats listed in export_formats.
 
-    
+    :param activity_jsons: Liste de couples (nom de l'activité, chemin de son resultat.json)
+    :param store_dir: Dossier du store colonnaire, ou None
+    :param export_formats: Formats exportés quand store_dir est utilisé ("json", "csv")
+    :param force: Ajouter aussi les activités synthétisées avant le suivi des contributions
+    :return: Le nombre d'activités fusionnées
+    """
+    # Charger les données existantes
+    store = SynthesisStore(store_dir) if store_dir else None
+    if store is not None and store.exists():
+        synthesis_data = store.to_synthesis()
+    else:
+        synthesis_data = load_synthesis(synthesis_json)
 
-    print(f"Synthèse mise à jour avec l'activité {activity_name}")
+    merged = 0
+    for activity_name, new_json in activity_jsons:
+        # Charger les nouvelles données
+        with open(new_json, 'r') as f:
+            new_data = json.load(f)
+
+        _report_resynthesis(synthesis_data, activity_name, force)
+        if not merge_activity(synthesis_data, new_data, activity_name, force):
+            continue
+        merged += 1
+        print(f"Synthèse mise à jour avec l'activité {activity_name}")
 
-  
+    if not merged:
+        return 0
 
-    with open(synthesis_csv, 'w', newline='') as f:
-        writer = csv.writer(f)
-        writer.writerow(headers)
-        writer.writerows(rows)
+    update_statistics(synthesis_data)
 
+    with stage("synthesis_write", rows=len(synthesis_data['students']), cols=len(synthesis_data['exercises'])):
+        if store is None:
+            # Sauvegarder le JSON et le CSV mis à jour
+            write_synthesis_json(synthesis_data, synthesis_json)
+            write_synthesis_csv(synthesis_data, synthesis_csv)
+        else:
+            store.save(synthesis_data)
+            export_synthesis(store, synthesis_csv, synthesis_json, export_formats, synthesis_data)
+    return merged
+
+
+def update_synthesis_database(db_path, activity_jsons):
+    """
+    Merge activities into the SQLite synthesis database.
+
+    Each activity is upserted in its own transaction and only touches its own rows;
+    re-running an activity replaces its previous contribution.
+
+    :param activity_jsons: Liste de couples (nom de l'activité, chemin de son resultat.json)
+    :return: Le nombre d'activités fusionnées
+    """
+    with SynthesisDatabase(db_path) as database:
+        for activity_name, new_json in activity_jsons:
+            with open(new_json, 'r') as f:
+                database.upsert_activity(activity_name, json.load(f))
+            print(f"Synthèse mise à jour avec l'activité {activity_name}")
+    return len(activity_jsons)
+
+
+def update_synthesis_journal(journal_dir, activity_jsons, compact=False):
+    """
+    Append activities to the synthesis journal, each as one O(delta) entry.
+
+    :param activity_jsons: Liste de couples (nom de l'activité, chemin de son resultat.json)
+    :param compact: Replier le journal dans un nouveau snapshot après les ajouts
+    :return: Le nombre d'activités ajoutées
+    """
+    journal = SynthesisJournal(journal_dir)
+    for activity_name, new_json in activity_jsons:
+        with open(new_json, 'r') as f:
+            seq = journal.append(activity_name, json.load(f))
+        print(f"Synthèse mise à jour avec l'activité {activity_name} (entrée {seq} du journal)")
+    if compact:
+        seq = journal.compact()
+        if seq is not None:
+            print(f"Journal compacté jusqu'à l'entrée {seq}")
+    return len(activity_jsons)
+
+
+def merge_into_synthesis(config, backend, activity_jsons, export_formats=(), compact=False, force=False):
+    """
+    Merge activities into the primary copy of the synthesis chosen by backend, and
+    record backend as the copy the readers load.
+
+    :param backend: "store", "sqlite", "journal" ou "json"
+    :param activity_jsons: Liste de couples (nom de l'activité, chemin de son resultat.json)
+    :param export_formats: Formats exportés depuis le store ("json", "csv")
+    :param compact: Avec le backend journal, replier le journal après les ajouts
+    :param force: Ajouter aussi les activités synthétisées avant le suivi des contributions
+    :return: Le nombre d'activités fusionnées
+    """
+    synthesis_data_dir = os.path.join(config.data_dir, config.synthesis_data_dir)
+    if backend == "sqlite":
+        merged = update_synthesis_database(os.path.join(synthesis_data_dir, config.synthesis_db_filename),
+                                           activity_jsons)
+    elif backend == "journal":
+        merged = update_synthesis_journal(os.path.join(synthesis_data_dir, config.synthesis_journal_dirname),
+                                          activity_jsons, compact=compact)
+    else:
+        # Fusionner toutes les activités en une seule passe
+        store_dir = os.path.join(synthesis_data_dir, config.synthesis_store_dirname) if backend == "store" else None
+        merged = update_synthesis_batch(os.path.join(synthesis_data_dir, config.synthesis_csv_filename),
+                                        os.path.join(synthesis_data_dir, config.synthesis_json_filename),
+                                        activity_jsons, store_dir, export_formats, force)
+    if merged:
+        record_backend(config, backend)
+    return merged
+
+
+def export_synthesis(store, synthesis_csv, synthesis_json, export_formats, synthesis_data=None):
+    """Export the synthesis (the columnar store, or synthesis_data when given) to synthesis.json and/or synthesis.csv"""
+    if not export_formats:
+        return
+    synthesis_data = synthesis_data or store.to_synthesis()
+    if "json" in export_formats:
+        write_synthesis_json(synthesis_data, synthesis_json)
+        print(f"Synthèse exportée : {synthesis_json}")
+    if "csv" in export_formats:
+        write_synthesis_csv(synthesis_data, synthesis_csv)
+        print(f"Synthèse exportée : {synthesis_csv}")
 
 
 # @dataclass
@@ -141,9 +194,49 @@ def main():
     synthesis_data_dir = os.path.join(config.data_dir, config.synthesis_data_dir)
     synthesis_csv = os.path.join(synthesis_data_dir, config.synthesis_csv_filename)
     synthesis_json = os.path.join(synthesis_data_dir, config.synthesis_json_filename)
+    store_dir = os.path.join(synthesis_data_dir, config.synthesis_store_dirname)
+
+    parser = argparse.ArgumentParser(description="Merge activity results into the synthesis")
+    parser.add_argument("activity", nargs="?", help="Activité à synthétiser (par défaut : toutes)")
+    parser.add_argument("--backend", choices=SYNTHESIS_BACKENDS, default=None,
+                        help="Copie principale de la synthèse : store colonnaire, base SQLite, "
+                             "journal append-only ou synthesis.json (par défaut : celle de la dernière "
+                             "fusion, ou le store)")
+    parser.add_argument("--compact", action="store_true",
+                        help="Avec --backend journal : replier le journal dans un nouveau snapshot")
+    parser.add_argument("--force", action="store_true",
+                        help="Ajouter aussi les scores des activités synthétisées avant le suivi des "
+                             "contributions (ils s'ajoutent à ceux déjà présents)")
+    parser.add_argument("--export", default="",
+                        help="Formats exportés depuis le store ou la base, séparés par des virgules (json,csv)")
+    parser.add_argument("--export-only", action="store_true",
+                        help="Exporter la synthèse sans fusionner d'activité")
+    add_instrumentation_arguments(parser)
+    args = parser.parse_args()
+    logging.basicConfig(level=args.log_level, format='%(asctime)s - %(levelname)s - %(message)s')
+    report_options = report_options_from_args(args)
+    export_formats = tuple(f for f in args.export.split(",") if f)
+    db_path = os.path.join(synthesis_data_dir, config.synthesis_db_filename)
+    journal_dir = os.path.join(synthesis_data_dir, config.synthesis_journal_dirname)
+    backend = writer_backend(config, args.backend)
+    if config.synthesis_backend and backend != config.synthesis_backend:
+        print(f"Attention : MATHALEA_SYNTHESIS_BACKEND désigne {config.synthesis_backend}, "
+              f"les lecteurs de la synthèse ne verront pas cette mise à jour de {backend}")
+
+    if args.export_only:
+        if backend == "sqlite":
+            with SynthesisDatabase(db_path, read_only=True) as database:
+                synthesis_data = database.to_synthesis()
+            export_synthesis(None, synthesis_csv, synthesis_json, export_formats, synthesis_data)
+        elif backend == "journal":
+            export_synthesis(None, synthesis_csv, synthesis_json, export_formats,
+                             SynthesisJournal(journal_dir).load())
+        else:
+            export_synthesis(SynthesisStore(store_dir), synthesis_csv, synthesis_json, export_formats)
+        return
 
     # Récupérer l'argument : le nom de l'activité ou None
-    activity = sys.argv[1] if len(sys.argv) > 1 else None
+    activity = args.activity
 
     # Si aucune activité n'est spécifiée, on traite toutes les activités
     if activity is None:
@@ -152,6 +245,7 @@ def main():
     else:
         activities = [activity]
 
+    activity_jsons = []
     for activity in activities:
         activity_dir = os.path.join(config.activity_dir, activity)
         source_data_activity_dir = os.path.join(activity_dir, config.source_data_dir)
@@ -165,30 +259,36 @@ def main():
             print(f"Le dossier 'source_data' n'existe pas dans {activity_dir}")
             continue
 
-        if not os.path.exists(synthesis_data_dir):
-            os.makedirs(synthesis_data_dir)
-
-        if not os.path.exists(synthesis_csv):
-            with open(synthesis_csv, 'w', newline='') as f:
-                writer = csv.writer(f)
-                writer.writerow(['Élève', 'Classe', 'Groupe'])
-
-        if not os.path.exists(synthesis_json):
-            with open(synthesis_json, 'w') as f:
-                json.dump({
-                    "tags": {},
-                    "exercises": {},
-                    "students": {},
-                    "metadata": {
-                        "created_at": datetime.now().isoformat(),
-                        "updated_at": datetime.now().isoformat(),
-                        "synthesized_activities": []
-                    }
-                }, f, indent=2)
-
-        update_synthesis_files(synthesis_csv, synthesis_json, activity_json, activity)
+        activity_jsons.append((activity, activity_json))
+
+    if not os.path.exists(synthesis_data_dir):
+        os.makedirs(synthesis_data_dir)
+
+    previous = recorded_backend(config)
+    if previous is not None and previous != backend:
+        print(f"La copie principale de la synthèse passe de {previous} à {backend}")
+
+    report = report_options.new_report("synthesis", profile_dir=synthesis_data_dir) if report_options else None
+    with activate(report):
+        with stage("synthesis_merge", rows=len(activity_jsons)):
+            merge_into_synthesis(config, backend, activity_jsons, export_formats, compact=args.compact,
+                                 force=args.force)
+
+        if export_formats and backend in ("sqlite", "journal"):
+            with stage("synthesis_export"):
+                if backend == "sqlite":
+                    with SynthesisDatabase(db_path, read_only=True) as database:
+                        synthesis_data = database.to_synthesis()
+                else:
+                    synthesis_data = SynthesisJournal(journal_dir).load()
+                export_synthesis(None, synthesis_csv, synthesis_json, export_formats, synthesis_data)
 
     print("Mise à jour de la synthèse terminée.")
+    if report is not None:
+        report_path = os.path.join(synthesis_data_dir, config.run_report_filename)
+        report.write(report_path)
+        logging.getLogger(__name__).info(report.summary())
+        print(f"Rapport d'exécution : {report_path}")
 
 if __name__ == "__main__":
     main()
@@ -1,3 +1,7 @@
+import json
+import os
+
+
 def get_optional_tags():
     tags = {}
     while True:
@@ -7,3 +11,25 @@ def get_optional_tags():
         value = input(f"Enter value for {tag}: ").strip()
         tags[tag] = value
     return tags
+
+
+def load_tags_manifest(manifest_path):
+    """Read the tags of an activity from its JSON manifest ({} if there is none)"""
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        tags = json.load(f)
+    if not isinstance(tags, dict):
+        raise ValueError(f"Tags manifest must contain a JSON object: {manifest_path}")
+    return {str(tag): str(value) for tag, value in tags.items()}
+
+
+def parse_tag_options(options):
+    """Parse KEY=VALUE command-line tag options into a dict"""
+    tags = {}
+    for option in options or []:
+        tag, sep, value = option.partition('=')
+        if not sep or not tag.strip():
+            raise ValueError(f"Invalid tag '{option}', expected KEY=VALUE")
+        tags[tag.strip()] = value.strip()
+    return tags
@@ -0,0 +1,287 @@
+"""
+Watch Module
+
+This module runs the pipeline continuously: it watches the activities tree and,
+when a teacher drops a new res.csv or mathAlea.html into an activity's source_data
+(or edits its tags manifest), processes that activity and merges its results into
+the synthesis, without anyone running save_activity and update_synthesis by hand.
+
+Changes are detected by polling the modification time and size of each activity's
+inputs, which only costs a few stat calls per activity and needs no extra
+dependency. A change is acted upon once the activity's inputs have stayed unchanged
+for the debounce delay, so a burst of writes (a copy in progress, both files
+replaced one after the other) gives a single run. Runs go through a bounded queue
+to a single worker thread, which also keeps the synthesis with a single writer; an
+activity already waiting or running is not queued twice. Only the changed activity
+is processed and merged: re-merging an activity replaces its previous contribution.
+
+Classes:
+    ActivityWatcher: Watches the activities and processes the changed ones.
+
+Functions:
+    main: Entry point of the script.
+"""
+
+import argparse
+import logging
+import os
+import queue
+import signal
+import threading
+import time
+from dataclasses import replace
+from typing import Dict, Iterable, List, Optional, Tuple
+from src.activity_status import NEW, STALE, list_activities
+from src.config import Config
+from src.db.synthesis_backend import SYNTHESIS_BACKENDS, writer_backend
+from src.instrumentation import add_instrumentation_arguments, report_options_from_args
+from src.save_activity import get_activity_tags, process_single_activity
+from src.update_synthesis import merge_into_synthesis
+from src.user_interaction import parse_tag_options
+
+logger = logging.getLogger(__name__)
+
+# (mtime_ns, taille) de chaque entrée d'une activité, None pour un fichier absent
+Signature = Tuple[Optional[Tuple[int, int]], ...]
+
+
+class ActivityWatcher:
+    """
+    Watch the activities tree and process the activities whose inputs changed.
+
+    Attributes:
+        config (Config): Configuration.
+        backend (str): Primary copy of the synthesis ("store", "sqlite", "journal" or "json").
+        export_formats (Tuple[str, ...]): Formats exported from the store after a merge.
+        cli_tags (Dict[str, str]): Tags added to every activity, over its tags manifest.
+        poll_interval (float): Seconds between two polls.
+        debounce (float): Seconds an activity's inputs must stay unchanged before it is processed.
+        queue (queue.Queue): Activities waiting for the worker.
+    """
+
+    def __init__(self, config: Config, backend: Optional[str] = None, export_formats: Iterable[str] = (),
+                 cli_tags: Optional[Dict[str, str]] = None, poll_interval: float = 1.0, debounce: float = 2.0,
+                 queue_size: int = 16, report_options=None):
+        """
+        Initialize the watcher.
+
+        Args:
+            config (Config): Configuration.
+            backend (str, optional): Primary copy of the synthesis (default: the configured
+                or last merged one, see src.db.synthesis_backend).
+            export_formats (Iterable[str]): Formats exported from the store after a merge.
+            cli_tags (Dict[str, str], optional): Tags added to every activity.
+            poll_interval (float): Seconds between two polls.
+            debounce (float): Seconds an activity's inputs must stay unchanged before it is processed.
+            queue_size (int): Maximum number of activities waiting for the worker.
+            report_options (ReportOptions, optional): Save a run report of each processing.
+        """
+        self.config = config
+        self.backend = writer_backend(config, backend)
+        self.export_formats = tuple(export_formats)
+        self.cli_tags = cli_tags or {}
+        self.poll_interval = poll_interval
+        self.debounce = debounce
+        self.report_options = report_options
+        self.queue: "queue.Queue[str]" = queue.Queue(maxsize=queue_size)
+
+        self._snapshot: Dict[str, Signature] = {}
+        self._roster: Optional[Tuple[int, int]] = None
+        # Dernier changement vu de chaque activité pas encore mise en file
+        self._pending: Dict[str, float] = {}
+        # Activités en file ou en cours de traitement
+        self._queued = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def scan(self) -> Dict[str, Signature]:
+        """Signature of the inputs of each activity"""
+        signatures = {}
+        try:
+            entries = list(os.scandir(self.config.activity_dir))
+        except FileNotFoundError:
+            return signatures
+        for entry in entries:
+            if not entry.is_dir():
+                continue
+            source_data_dir = os.path.join(entry.path, self.config.source_data_dir)
+            signatures[entry.name] = (
+                _stat(os.path.join(source_data_dir, self.config.res_filename)),
+                _stat(os.path.join(source_data_dir, self.config.url_filename)),
+                _stat(os.path.join(entry.path, self.config.tags_manifest_filename)),
+            )
+        return signatures
+
+    def start(self, catch_up: bool = False) -> None:
+        """
+        Take the initial snapshot of the inputs.
+
+        Args:
+            catch_up (bool): Also process the activities whose results are missing or
+                older than their inputs; otherwise only later changes are processed.
+        """
+        self._snapshot = self.scan()
+        self._roster = _stat(os.path.join(self.config.data_dir, self.config.groupe_classe_filename))
+        if catch_up:
+            now = time.monotonic() - self.debounce
+            for activity, status, _ in list_activities(self.config):
+                if status in (NEW, STALE):
+                    self._pending[activity] = now
+
+    def poll(self, now: Optional[float] = None) -> List[str]:
+        """
+        Record the changes since the last poll and queue the activities that settled.
+
+        Returns:
+            List[str]: Activities queued by this poll.
+        """
+        now = time.monotonic() if now is None else now
+        signatures = self.scan()
+        for activity, signature in signatures.items():
+            if self._snapshot.get(activity) != signature:
+                logger.debug(f"Change detected in {activity}")
+                self._pending[activity] = now
+        for activity in set(self._pending) - set(signatures):
+            del self._pending[activity]
+        self._snapshot = signatures
+
+        # La liste des élèves sert à toutes les activités
+        roster = _stat(os.path.join(self.config.data_dir, self.config.groupe_classe_filename))
+        if roster != self._roster:
+            self._roster = roster
+            for activity in signatures:
+                self._pending[activity] = now
+
+        queued = []
+        for activity, changed_at in sorted(self._pending.items(), key=lambda item: item[1]):
+            if now - changed_at < self.debounce:
+                continue
+            with self._lock:
+                if activity in self._queued:
+                    # Traitée en ce moment : relancée une fois celle-ci terminée
+                    continue
+                try:
+                    self.queue.put_nowait(activity)
+                except queue.Full:
+                    logger.warning(f"Work queue full, {activity} will be queued at a later poll")
+                    break
+                self._queued.add(activity)
+            del self._pending[activity]
+            queued.append(activity)
+        return queued
+
+    def process(self, activity: str) -> bool:
+        """
+        Process one activity and merge its results into the synthesis.
+
+        The merge is skipped when processing left resultat.json untouched (inputs
+        unchanged since the last run).
+
+        Returns:
+            bool: True on success.
+        """
+        json_path = os.path.join(self.config.activity_dir, activity, self.config.final_data_dir,
+                                 self.config.resultat_json_filename)
+        before = _stat(json_path)
+        tags = get_activity_tags(self.config, activity, self.cli_tags)
+        if not process_single_activity(replace(self.config, activity=activity), activity, tags,
+                                       report_options=self.report_options):
+            return False
+        if _stat(json_path) == before:
+            return True
+        merge_into_synthesis(self.config, self.backend, [(activity, json_path)], self.export_formats)
+        return True
+
+    def run(self, catch_up: bool = False) -> None:
+        """Poll until stop is called (or Ctrl-C), processing the changed activities in a worker thread"""
+        self.start(catch_up)
+        worker = threading.Thread(target=self._work, name="activity-worker", daemon=True)
+        worker.start()
+        print(f"Watching {self.config.activity_dir} (poll {self.poll_interval}s, debounce {self.debounce}s)")
+        try:
+            while not self._stop.is_set():
+                for activity in self.poll():
+                    print(f"Activity {activity} changed, queued")
+                self._stop.wait(self.poll_interval)
+        except KeyboardInterrupt:
+            print("Stopping, waiting for the current activity to finish...")
+        finally:
+            self._stop.set()
+            worker.join()
+        print("Watch stopped")
+
+    def stop(self) -> None:
+        """Stop run after the activity being processed (queued activities are left for the next start)"""
+        self._stop.set()
+
+    def _work(self) -> None:
+        while not self._stop.is_set():
+            try:
+                activity = self.queue.get(timeout=self.poll_interval)
+            except queue.Empty:
+                continue
+            start = time.perf_counter()
+            try:
+                success = self.process(activity)
+            except Exception:
+                logger.exception(f"Processing of {activity} failed")
+                success = False
+            finally:
+                with self._lock:
+                    self._queued.discard(activity)
+                self.queue.task_done()
+            status = "done" if success else "FAILED"
+            print(f"Activity {activity}: {status} ({time.perf_counter() - start:.1f}s)")
+
+
+def _stat(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def main():
+    """
+    Watch the activities and keep their results and the synthesis up to date.
+    """
+    parser = argparse.ArgumentParser(description="Process new activity exports as they arrive")
+    parser.add_argument("--backend", choices=SYNTHESIS_BACKENDS, default=None,
+                        help="Primary copy of the synthesis (default: the last merged one, else the store)")
+    parser.add_argument("--export", default="",
+                        help="Formats exported from the store after each merge, comma-separated (json,csv)")
+    parser.add_argument("--tag", action="append", default=[], metavar="KEY=VALUE",
+                        help="Tag added to every activity (repeatable)")
+    parser.add_argument("--poll", type=float, default=1.0, help="Seconds between two polls (default: 1)")
+    parser.add_argument("--debounce", type=float, default=2.0,
+                        help="Seconds an activity's inputs must stay unchanged before it is processed (default: 2)")
+    parser.add_argument("--queue-size", type=int, default=16, help="Maximum number of activities waiting")
+    parser.add_argument("--catch-up", action="store_true",
+                        help="First process the activities whose results are missing or out of date")
+    add_instrumentation_arguments(parser)
+    args = parser.parse_args()
+    logging.basicConfig(level=args.log_level, format='%(asctime)s - %(levelname)s - %(message)s')
+    try:
+        cli_tags = parse_tag_options(args.tag)
+    except ValueError as e:
+        parser.error(str(e))
+
+    watcher = ActivityWatcher(
+        Config(),
+        backend=args.backend,
+        export_formats=[f for f in args.export.split(",") if f],
+        cli_tags=cli_tags,
+        poll_interval=args.poll,
+        debounce=args.debounce,
+        queue_size=args.queue_size,
+        report_options=report_options_from_args(args),
+    )
+    # Arrêt propre en service (systemd, docker stop...) comme avec Ctrl-C
+    signal.signal(signal.SIGTERM, lambda signum, frame: watcher.stop())
+    print(f"Synthesis backend: {watcher.backend}")
+    watcher.run(catch_up=args.catch_up)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+import json
+import math
+
+import pytest
+
+from src.db.synthesis_sqlite import SynthesisDatabase
+from src.db.synthesis_store import SynthesisStore
+from src.db.synthesis_utils import load_synthesis
+from src.update_synthesis import update_synthesis_batch, update_synthesis_database
+
+
+def _exercise(super_id, n, scores):
+    return {
+        "super_id": super_id, "uuid": f"u{super_id}", "n": n,
+        "average_score": sum(scores) / len(scores) if scores else None,
+        "max_score": max(scores) if scores else None,
+        "min_score": min(scores) if scores else None,
+    }
+
+
+def _activity(scores_by_student, n_by_exercise):
+    """resultat.json of an activity: {student: {super_id: score}} and the n of each exercise"""
+    exercises = {}
+    for super_id, n in n_by_exercise.items():
+        scores = [s[super_id] for s in scores_by_student.values() if super_id in s]
+        exercises[super_id] = _exercise(super_id, n, scores)
+    students = {
+        student: {"class": "3A", "group": "G1", "scores": scores}
+        for student, scores in scores_by_student.items()
+    }
+    return {"metadata": {}, "tags": {}, "exercises": exercises, "students": students}
+
+
+# A2 recouvre A1 ; la seconde version de A1 perd l'exercice E3 et les scores d'Ana
+RUNS = [
+    ("A1", _activity({"Ana": {"E1": 0.5, "E2": 1.0, "E3": 0.25}, "Bob": {"E1": 0.75}},
+                     {"E1": 4, "E2": 2, "E3": 3})),
+    ("A2", _activity({"Bob": {"E1": 0.1, "E2": 0.3}, "Cleo": {"E2": 0.9}}, {"E1": 2, "E2": 5})),
+    ("A1", _activity({"Ana": {}, "Bob": {"E1": 0.2, "E2": 0.6}, "Dan": {"E2": 0.4}}, {"E1": 3, "E2": 1})),
+]
+
+
+def _approx(value):
+    if isinstance(value, dict):
+        return {key: _approx(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_approx(item) for item in value]
+    if isinstance(value, float) and not math.isnan(value):
+        return pytest.approx(value)
+    return value
+
+
+def _comparable(synthesis_data):
+    return {
+        "exercises": synthesis_data["exercises"],
+        "students": synthesis_data["students"],
+        "contributions": synthesis_data["contributions"],
+        "synthesized_activities": synthesis_data["metadata"]["synthesized_activities"],
+        "statistics": synthesis_data["metadata"]["statistics"],
+    }
+
+
+def _synthesize(tmp_path, backend):
+    synthesis_dir = tmp_path / backend
+    synthesis_dir.mkdir()
+    for i, (activity, resultat) in enumerate(RUNS):
+        resultat_path = tmp_path / f"{backend}-{i}.json"
+        resultat_path.write_text(json.dumps(resultat))
+        activity_jsons = [(activity, str(resultat_path))]
+        if backend == "sqlite":
+            update_synthesis_database(str(synthesis_dir / "synthesis.db"), activity_jsons)
+        else:
+            store_dir = str(synthesis_dir / "store") if backend == "store" else None
+            update_synthesis_batch(str(synthesis_dir / "synthesis.csv"), str(synthesis_dir / "synthesis.json"),
+                                   activity_jsons, store_dir, export_formats=())
+    if backend == "sqlite":
+        with SynthesisDatabase(str(synthesis_dir / "synthesis.db"), read_only=True) as database:
+            return database.to_synthesis()
+    if backend == "store":
+        return SynthesisStore(str(synthesis_dir / "store")).to_synthesis()
+    return load_synthesis(str(synthesis_dir / "synthesis.json"))
+
+
+def test_backends_give_the_same_synthesis(tmp_path):
+    syntheses = {backend: _comparable(_synthesize(tmp_path, backend)) for backend in ("json", "store", "sqlite")}
+
+    assert syntheses["store"] == _approx(syntheses["json"])
+    assert syntheses["sqlite"] == _approx(syntheses["json"])
+
+
+def test_rerun_drops_what_the_activity_no_longer_has(tmp_path):
+    synthesis_data = _synthesize(tmp_path, "sqlite")
+
+    assert "E3" not in synthesis_data["exercises"]
+    assert synthesis_data["students"]["Ana"] == {"class": "3A", "group": "G1", "scores": {},
+                                                 "activities": ["A1"], "stats": {}}
+    assert synthesis_data["exercises"]["E1"]["stats"] == _approx([2, 0.1 + 0.2, 0.1 ** 2 + 0.2 ** 2])
+    assert synthesis_data["exercises"]["E1"]["n"] == 5